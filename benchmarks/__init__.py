@@ -0,0 +1,6 @@
+"""
+Benchmarks for PyBinaryTree
+
+    python -m benchmarks - the suite with JSON results and regression checks (see suite.py)
+    python -m benchmarks.key_cache - the cost of hashing during searches
+"""
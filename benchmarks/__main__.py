@@ -0,0 +1,72 @@
+"""
+Entry point for the benchmark suite, see benchmarks/suite.py
+
+Run from the repository root:
+    python -m benchmarks --help
+"""
+
+
+import argparse
+import sys
+
+from . import suite
+
+
+def main(argv=None):
+    """
+    Parses the arguments, runs the suite and compares the results
+
+    OUT:
+        int - the exit code, 1 if there are regressions
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="PyBinaryTree benchmarks")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=list(suite.DEFAULT_SIZES),
+        help="the tree sizes to run at (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=suite.DEFAULT_REPEAT,
+        help="how many times to run each benchmark (default: %(default)s)"
+    )
+    parser.add_argument("--trees", nargs="+", choices=list(suite.TREE_TYPES), help="the tree types to run")
+    parser.add_argument("--workloads", nargs="+", choices=suite.WORKLOADS, help="the workloads to run")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare the results with this JSON file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=suite.DEFAULT_THRESHOLD,
+        help="the relative slowdown that counts as a regression (default: %(default)s)"
+    )
+    args = parser.parse_args(argv)
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    report = suite.run(args.sizes, args.repeat, args.trees, args.workloads, log=log)
+
+    if args.output:
+        suite.save_report(report, args.output)
+
+    if not args.compare:
+        print(suite.format_report(report))
+        return 0
+
+    rows = suite.compare(suite.load_report(args.compare), report, args.threshold)
+    print(suite.format_comparison(rows))
+
+    num_regressions = sum(row[-1] for row in rows)
+    if num_regressions:
+        print(f"{num_regressions} regression(s) over {args.threshold:.0%}", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
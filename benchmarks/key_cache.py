@@ -0,0 +1,118 @@
+# pylint: disable=wrong-import-position
+# pylint: disable=import-error
+# pylint: disable=protected-access
+"""
+Measures the per-operation hashing cost of tree searches for tuple/str values:
+the cached node keys vs hashing both sides at every level (as cmp_hash does)
+
+Run from the repository root:
+    python -m benchmarks.key_cache
+"""
+
+
+import sys
+import pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+import random
+import string
+import timeit
+
+from PyBinaryTree import BinaryTree
+
+
+NUM_VALUES = 50_000
+NUM_REPEATS = 5
+
+
+class CountingHash:
+    """
+    Wraps a value and counts how many times its hash was computed
+    """
+    __slots__ = ("value",)
+    num_calls = 0
+
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        CountingHash.num_calls += 1
+        return hash(self.value)
+
+    def __eq__(self, other):
+        return isinstance(other, CountingHash) and self.value == other.value
+
+
+def has_value_uncached(tree, value):
+    """
+    Reference search that hashes the probe and the node value at every level
+    """
+    node = tree._root
+    while node is not None:
+        cmp = BinaryTree.cmp_hash(value, node.value)
+        if cmp < 0:
+            node = node.left_child
+        elif cmp > 0:
+            node = node.right_child
+        else:
+            return True
+    return False
+
+
+def make_values(kind):
+    """
+    Generates random values of the given kind
+    """
+    rng = random.Random(kind)
+
+    if kind == "str":
+        return [
+            "".join(rng.choices(string.ascii_letters, k=32))
+            for _ in range(NUM_VALUES)
+        ]
+
+    return [
+        (rng.random(), "".join(rng.choices(string.ascii_letters, k=8)), rng.randrange(10**9))
+        for _ in range(NUM_VALUES)
+    ]
+
+
+def run():
+    """
+    Runs the benchmark and prints the results
+    """
+    for kind in ("str", "tuple"):
+        values = make_values(kind)
+        tree = BinaryTree.from_iterable(values, balance="rb")
+
+        cached = min(timeit.repeat(
+            lambda: [tree.has_value(v) for v in values],# pylint: disable=cell-var-from-loop
+            number=1,
+            repeat=NUM_REPEATS
+        ))
+        uncached = min(timeit.repeat(
+            lambda: [has_value_uncached(tree, v) for v in values],# pylint: disable=cell-var-from-loop
+            number=1,
+            repeat=NUM_REPEATS
+        ))
+
+        counting_tree = BinaryTree.from_iterable(map(CountingHash, values[:1000]), balance="rb")
+        probe = CountingHash(values[500])
+
+        CountingHash.num_calls = 0
+        counting_tree.has_value(probe)
+        cached_calls = CountingHash.num_calls
+
+        CountingHash.num_calls = 0
+        has_value_uncached(counting_tree, probe)
+        uncached_calls = CountingHash.num_calls
+
+        print(
+            f"{kind:>5}: has_value {cached / NUM_VALUES * 1e6:.2f} us/op "
+            f"({cached_calls} hash calls), "
+            f"uncached {uncached / NUM_VALUES * 1e6:.2f} us/op "
+            f"({uncached_calls} hash calls)"
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,391 @@
+# pylint: disable=wrong-import-position
+# pylint: disable=import-error
+"""
+Benchmark suite: times add, has_value, the traversals, the inorder scan and delete on random,
+sorted, reverse sorted and duplicate heavy workloads, measures memory per node
+and writes the results as JSON that can be compared between commits
+
+Run from the repository root:
+    python -m benchmarks --sizes 10000 100000 --output results.json
+    python -m benchmarks --compare results.json
+"""
+
+
+import sys
+import pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+import gc
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from PyBinaryTree import BinaryTree, ArrayBinaryTree, BPlusTree
+
+
+DEFAULT_SIZES = (10_000, 100_000)
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.1
+SEED = 0
+
+# Unbalanced trees degenerate into linked lists on (reverse) sorted input,
+# at these sizes that's O(n^2) and would take hours
+DEGENERATE_WORKLOADS = ("sorted", "reversed")
+
+TREE_TYPES = {
+    "plain": lambda: BinaryTree(),
+    "rb": lambda: BinaryTree(balance="rb"),
+    "treap": lambda: BinaryTree(balance="treap"),
+    "array-rb": lambda: ArrayBinaryTree(balance="rb"),
+    "bplus": lambda: BPlusTree(),
+}
+WORKLOADS = ("random", "sorted", "reversed", "dupes")
+TRAVERSALS = (
+    "traverse_inorder",
+    "traverse_preorder",
+    "traverse_postorder",
+    "traverse_breadthfirst",
+)
+
+
+def make_values(workload, size):
+    """
+    Generates the values for a workload, the same for every run
+
+    IN:
+        workload - the workload name
+        size - the number of values
+
+    OUT:
+        list of ints
+    """
+    rng = random.Random(f"{SEED}-{workload}-{size}")
+
+    if workload == "sorted":
+        return list(range(size))
+
+    if workload == "reversed":
+        return list(range(size - 1, -1, -1))
+
+    if workload == "dupes":
+        # About 100 copies of every value
+        return [rng.randrange(max(size // 100, 1)) for _ in range(size)]
+
+    values = list(range(size))
+    rng.shuffle(values)
+    return values
+
+
+def time_best(func, repeat):
+    """
+    Runs the function several times and returns the best time
+
+    IN:
+        func - the function to time, gets called without arguments
+        repeat - how many times to run it
+
+    OUT:
+        float - seconds
+    """
+    best = float("inf")
+
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def build_tree(tree_type, values):
+    """
+    Builds a tree of the given type by adding the values one by one
+
+    IN:
+        tree_type - the tree type name
+        values - the values to add
+
+    OUT:
+        tree
+    """
+    tree = TREE_TYPES[tree_type]()
+    add = tree.add
+    for value in values:
+        add(value)
+    return tree
+
+
+def count_nodes(tree):
+    """
+    Counts the nodes the traversals of a tree visit,
+    the repeated values share a node in BinaryTree,
+    a B+ tree node holds many values
+
+    IN:
+        tree - the tree
+
+    OUT:
+        int
+    """
+    num_nodes = 0
+
+    def count(node):
+        nonlocal num_nodes
+        num_nodes += 1
+
+    tree.traverse_inorder(count)
+    return num_nodes
+
+
+def measure_memory(tree_type, values):
+    """
+    Measures the memory the tree takes per node, the values aren't counted
+
+    IN:
+        tree_type - the tree type name
+        values - the values for the tree
+
+    OUT:
+        float - bytes per node
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tree = build_tree(tree_type, values)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    # A B+ tree node holds up to `order` values, so its memory is spread over the entries
+    num_nodes = len(tree) if isinstance(tree, BPlusTree) else count_nodes(tree)
+    del tree
+    return (after - before) / max(num_nodes, 1)
+
+
+def run_case(tree_type, workload, size, repeat):
+    """
+    Runs all benchmarks for a tree type and a workload
+
+    IN:
+        tree_type - the tree type name
+        workload - the workload name
+        size - the number of values
+        repeat - how many times to run each benchmark
+
+    OUT:
+        list of result dicts
+    """
+    values = make_values(workload, size)
+    probes = list(values)
+    random.Random(SEED).shuffle(probes)
+    results = []
+
+    def add_result(operation, seconds, num_ops):
+        results.append({
+            "name": f"{tree_type}/{workload}/{operation}",
+            "size": size,
+            "seconds": seconds,
+            "ns_per_op": seconds / num_ops * 1e9,
+        })
+
+    add_result("add", time_best(lambda: build_tree(tree_type, values), repeat), size)
+
+    tree = build_tree(tree_type, values)
+    has_value = tree.has_value
+    add_result("has_value", time_best(lambda: [has_value(v) for v in probes], repeat), size)
+
+    def noop(node):
+        pass
+
+    # The traversals visit every node once, however many values it holds
+    num_nodes = count_nodes(tree)
+
+    for traversal in TRAVERSALS:
+        traverse = getattr(tree, traversal)
+        add_result(traversal, time_best(lambda traverse=traverse: traverse(noop), repeat), num_nodes)
+
+    def scan():
+        for _ in tree:
+            pass
+
+    add_result("iter_inorder", time_best(scan, repeat), len(tree))
+
+    def delete_all():
+        # Deleting empties the tree, so every run gets a new one (not timed)
+        delete_tree = build_tree(tree_type, values)
+        delete = delete_tree.delete
+        start = time.perf_counter()
+        for value in probes:
+            delete(value)
+        return time.perf_counter() - start
+
+    add_result("delete", min(delete_all() for _ in range(repeat)), size)
+
+    results.append({
+        "name": f"{tree_type}/{workload}/memory",
+        "size": size,
+        "bytes_per_node": measure_memory(tree_type, values),
+    })
+    return results
+
+
+def get_commit():
+    """
+    Returns the current git commit or None
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            check=True,
+            capture_output=True,
+            text=True
+        ).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, tree_types=None, workloads=None, log=print):
+    """
+    Runs the suite
+
+    IN:
+        sizes - the tree sizes to run at
+            (Default: DEFAULT_SIZES)
+        repeat - how many times to run each benchmark, the best time is kept
+            (Default: DEFAULT_REPEAT)
+        tree_types - the tree types to run, if None, all of them
+            (Default: None)
+        workloads - the workloads to run, if None, all of them
+            (Default: None)
+        log - the function to report the progress with
+            (Default: print)
+
+    OUT:
+        dict - the report
+    """
+    results = []
+
+    for size in sizes:
+        for tree_type in tree_types or TREE_TYPES:
+            for workload in workloads or WORKLOADS:
+                if tree_type == "plain" and workload in DEGENERATE_WORKLOADS:
+                    continue
+
+                log(f"{tree_type}/{workload} at {size}...")
+                results.extend(run_case(tree_type, workload, size, repeat))
+
+    return {
+        "meta": {
+            "commit": get_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "sizes": list(sizes),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def get_metric(result):
+    """
+    Returns the compared metric of a result, lower is better
+
+    OUT:
+        tuple:
+            metric name
+            float
+    """
+    if "bytes_per_node" in result:
+        return "bytes_per_node", result["bytes_per_node"]
+    return "ns_per_op", result["ns_per_op"]
+
+
+def compare(baseline, report, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares a report with a baseline report
+
+    IN:
+        baseline - the old report
+        report - the new report
+        threshold - the relative slowdown (or memory growth) that counts as a regression
+            (Default: DEFAULT_THRESHOLD)
+
+    OUT:
+        list of tuples:
+            benchmark name
+            size
+            metric name
+            old value
+            new value
+            bool - whether or not it's a regression
+    """
+    old_results = {(result["name"], result["size"]): result for result in baseline["results"]}
+    rows = []
+
+    for result in report["results"]:
+        old_result = old_results.get((result["name"], result["size"]))
+        if old_result is None:
+            continue
+
+        metric, new_value = get_metric(result)
+        _, old_value = get_metric(old_result)
+        is_regression = new_value > old_value * (1 + threshold)
+        rows.append((result["name"], result["size"], metric, old_value, new_value, is_regression))
+
+    return rows
+
+
+def format_report(report):
+    """
+    Formats a report as a table
+
+    OUT:
+        str
+    """
+    lines = []
+    for result in report["results"]:
+        metric, value = get_metric(result)
+        lines.append(f"{result['name']:<40} {result['size']:>10} {value:>12.1f} {metric}")
+    return "\n".join(lines)
+
+
+def format_comparison(rows):
+    """
+    Formats the comparison rows as a table
+
+    OUT:
+        str
+    """
+    lines = []
+    for name, size, metric, old_value, new_value, is_regression in rows:
+        change = (new_value / old_value - 1) * 100 if old_value else 0.0
+        mark = "REGRESSION" if is_regression else ""
+        lines.append(
+            f"{name:<40} {size:>10} {old_value:>12.1f} -> {new_value:>12.1f} {metric} "
+            f"{change:>+7.1f}% {mark}"
+        )
+    return "\n".join(lines)
+
+
+def load_report(path):
+    """
+    Loads a JSON report
+    """
+    with open(path, "r", encoding="utf-8") as report_file:
+        return json.load(report_file)
+
+
+def save_report(report, path):
+    """
+    Saves a report as JSON
+    """
+    with open(path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=4)
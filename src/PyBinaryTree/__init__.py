@@ -8,17 +8,48 @@ Python implementation of binary tree
 from __future__ import annotations
 
 
-__all__ = ["BinaryTree"]
+__all__ = [
+    "BinaryTree",
+    "TreeMap",
+    "ConcurrentBinaryTree",
+    "PersistentBinaryTree",
+    "ArrayBinaryTree",
+    "BPlusTree",
+    "MappedBinaryTree"
+]
 __version__ = "0.0.1"
 __author__ = "Booplicate"
 
 
+import asyncio
+import math
+import random
+import mmap
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
 from collections import deque
-from functools import total_ordering
+from collections.abc import AsyncIterator, ItemsView, KeysView, Mapping, MutableMapping, ValuesView
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import AbstractContextManager, contextmanager
+from copy import deepcopy
+from functools import reduce, total_ordering
+from itertools import accumulate, chain, groupby, islice, repeat, takewhile
+from operator import attrgetter
+from os import PathLike, cpu_count
+try:
+    import numpy as np
+except ImportError:
+    np = None# type: ignore[assignment]
+
 from typing import (
     TypeVar,
     TypeAlias,
+    BinaryIO,
     Callable,
+    Iterable,
+    Iterator,
     Any,
     Literal,
     Protocol,
@@ -48,23 +79,34 @@ class CompHashProto(Protocol):
         ...
 
 _T = TypeVar("_T", bound=CompHashProto)# pylint: disable=invalid-name
+_K = TypeVar("_K", bound=CompHashProto)# pylint: disable=invalid-name
+_V = TypeVar("_V")# pylint: disable=invalid-name
+_BalanceMode: TypeAlias = Literal["rb", "treap"] | None
+_Ordering: TypeAlias = Literal["hash", "native"]
 # Big sad I can't do this...
 # _TraverseCallback: TypeAlias = Callable[[_Node[_T]], Any]
 
+# Stands for an omitted argument where None is a valid value
+_MISSING: Any = object()
+
 
 @total_ordering
 class _Node(Generic[_T]):
     """
     Represents a binary tree node
     """
-    __slots__ = ("value", "parent", "left_child", "right_child")
+    __slots__ = ("value", "key", "parent", "left_child", "right_child", "meta", "size", "count")
 
     def __init__(
         self,
         value: _T,
         parent: _Node[_T] | None = None,
         left_child: _Node[_T] | None = None,
-        right_child: _Node[_T] | None = None
+        right_child: _Node[_T] | None = None,
+        meta: Any = None,
+        size: int = 1,
+        key: Any = _MISSING,
+        count: int = 1
     ) -> None:
         """
         Constructor for binary tree node
@@ -77,11 +119,25 @@ class _Node(Generic[_T]):
                 (Default: None)
             right_child - the right child node for this node
                 (Default: None)
+            meta - balancing metadata used by self-balancing trees
+                (the node colour for red-black trees)
+                (Default: None)
+            size - the number of values in the subtree rooted at this node
+                (counting the repeated values), only maintained by trees with order statistics
+                (Default: 1)
+            key - the precomputed sort key of the value (can be None),
+                if omitted, the hash of the value is used
+            count - how many times the value was added to the tree
+                (Default: 1)
         """
         self.value = value
+        self.key = hash(value) if key is _MISSING else key
         self.parent = parent
         self.left_child = left_child
         self.right_child = right_child
+        self.meta = meta
+        self.size = size
+        self.count = count
 
     def __repr__(self) -> str:
         return self.repr(1)
@@ -177,340 +233,6840 @@ class _Node(Generic[_T]):
         return self.value < other.value
 
 
-class BinaryTree(Generic[_T]):
+_RED = True
+_BLACK = False
+_ARRAY_RED = 1
+_ARRAY_BLACK = 0
+
+# Binary dump format: the header, then the nodes in preorder,
+# each node record is (value, index of the right child or 0, count, flags),
+# the left child (if any) is always the next record
+_DUMP_MAGIC = b"PBTD"
+_DUMP_VERSION = 2
+# magic, version, typecode, balance, flags, number of nodes, number of values
+_DUMP_HEADER = struct.Struct("<4sBcBBQQ")
+_DUMP_RECORDS = {
+    b"q": struct.Struct("<qIIB3x"),
+    b"d": struct.Struct("<dIIB3x")
+}
+_DUMP_RIGHT_INDEX = struct.Struct("<I")
+_DUMP_RIGHT_INDEX_OFFSET = 8
+_DUMP_BALANCE_MODES: tuple[_BalanceMode, ...] = (None, "rb", "treap")
+# Header flags
+_DUMP_ALLOW_DUPES = 1
+_DUMP_NATIVE_ORDERING = 2
+_DUMP_CUSTOM_KEY = 4
+# Record flags
+_DUMP_HAS_LEFT = 1
+_DUMP_IS_RED = 2
+# How many nodes async iterators and batch operations process between yielding to the event loop
+_ASYNC_CHUNK_SIZE = 1024
+# The max number of values parallel_reduce sends to a worker at once
+_PARALLEL_CHUNK_SIZE = 65536
+# Pickle shape flags
+_SHAPE_HAS_LEFT = 1
+_SHAPE_HAS_RIGHT = 2
+_SHAPE_IS_RED = 4
+
+_get_node_value = attrgetter("value")
+_get_node_key = attrgetter("key")
+_get_node_item = attrgetter("value", "data")
+_get_node_data = attrgetter("data")
+
+
+def _iter_node_values(nodes: Iterator[_Node[_T]]) -> Iterator[_T]:
     """
-    Represents a binary tree
+    Maps the nodes to their values, repeating each value as many times as it was added
+
+    IN:
+        nodes - iterator over the nodes
+
+    OUT:
+        iterator over the values
     """
-    def __init__(self, allow_dupes: bool = True) -> None:
-        self.allow_dupes = allow_dupes
-        self._root: _Node[_T] | None = None
+    for node in nodes:
+        count = node.count
+        if count == 1:
+            # The common case, skips creating a repeat iterator per node
+            yield node.value
+        else:
+            yield from repeat(node.value, count)
+
+
+def _identity(value: _T) -> _T:
+    """
+    Returns the given value as is, the key function for native ordering
+    """
+    return value
+
+
+def _read_dump_header(data: bytes | mmap.mmap) -> tuple[bytes, _BalanceMode, int, int, int]:
+    """
+    Parses and validates the header of a binary tree dump
+
+    IN:
+        data - the header bytes or the memory-mapped dump
+
+    OUT:
+        tuple:
+            value typecode
+            balance mode
+            header flags
+            number of nodes
+            number of values (counting the repeated values)
+
+    RAISES:
+        ValueError - if the data isn't a valid dump
+    """
+    if len(data) < _DUMP_HEADER.size:
+        raise ValueError("truncated binary tree dump")
+
+    magic, version, typecode, balance_id, flags, count, num_values = _DUMP_HEADER.unpack_from(data)
+
+    if magic != _DUMP_MAGIC:
+        raise ValueError("not a binary tree dump")
+
+    if version != _DUMP_VERSION:
+        raise ValueError(f"unsupported binary tree dump version {version}")
+
+    if typecode not in _DUMP_RECORDS or balance_id >= len(_DUMP_BALANCE_MODES):
+        raise ValueError("corrupted binary tree dump")
+
+    return typecode, _DUMP_BALANCE_MODES[balance_id], flags, count, num_values
+
+
+def _count_values(values: Iterable[_T]) -> list[tuple[_T, int]]:
+    """
+    Counts the equal values in a (small) group of values with equal keys,
+    the values don't have to be hashable or comparable
+
+    IN:
+        values - the values
 
-    def _add(self, parent_node: _Node[_T], value: _T) -> bool:
+    OUT:
+        list of (value, count) pairs in the order of the first occurrences
+    """
+    unique: list[_T] = []
+    counts: list[int] = []
+
+    for value in values:
+        try:
+            counts[unique.index(value)] += 1
+        except ValueError:
+            unique.append(value)
+            counts.append(1)
+
+    return list(zip(unique, counts))
+
+
+def _unique_values(values: Iterable[_T]) -> list[_T]:
+    """
+    Removes duplicates from a (small) group of values with equal keys,
+    the values don't have to be hashable or comparable
+
+    IN:
+        values - the values
+
+    OUT:
+        list of unique values in their original order
+    """
+    unique: list[_T] = []
+
+    for value in values:
+        if value not in unique:
+            unique.append(value)
+
+    return unique
+
+
+if TYPE_CHECKING:
+    class _VectorizedQueriesHost(Protocol):
+        """
+        The methods the classes using _VectorizedQueriesMixin must provide
         """
-        Private methods that handles adding new nodes using recursion
+        def _iter_snapshot_keys(self) -> Iterator[Any]:
+            """
+            Iterates over the keys in order for the snapshot,
+            raises ValueError if the tree can't be queried by value
+            """
 
-        IN:
-            parent_node - the mode we're trying to add new node to
-            value - the value of the new node
+else:
+    # Only declares the host methods for type checkers, nothing to inherit at runtime
+    _VectorizedQueriesHost = object
 
-        OUT:
-            bool
+
+class _VectorizedQueriesMixin(_VectorizedQueriesHost):
+    """
+    Vectorized batch queries over a sorted snapshot of the tree keys,
+    the snapshot is built lazily and dropped when the tree changes
+
+    NOTE: requires NumPy and numeric values ordered by value,
+        the class must implement _iter_snapshot_keys
+    """
+    _key_array: Any = None
+
+    def key_array(self) -> Any:
         """
-        cmp = self.cmp_hash(value, parent_node.value)
+        Returns a sorted NumPy array of the tree keys, the array is cached
+        until the tree is modified and must not be changed by the caller
 
-        if cmp < 0:
-            if parent_node.left_child is None:
-                parent_node.left_child = _Node(value, parent=parent_node)
-                return True
+        OUT:
+            numpy.ndarray
 
-            return self._add(parent_node.left_child, value)
+        RAISES:
+            ImportError - if NumPy isn't available
+            ValueError - if the tree isn't ordered by value
+            TypeError - if the values aren't numeric
+        """
+        if np is None:
+            raise ImportError("vectorized queries require NumPy")
 
-        if (cmp > 0) or self.allow_dupes:
-            if parent_node.right_child is None:
-                parent_node.right_child = _Node(value, parent=parent_node)
-                return True
+        if self._key_array is None:
+            key_array = np.array(list(self._iter_snapshot_keys()))
 
-            return self._add(parent_node.right_child, value)
+            if key_array.dtype.kind not in "biuf":
+                raise TypeError(f"vectorized queries require numeric values, got {key_array.dtype}")
 
-        # The node is a dupe and we don't like dupes here
-        return False
+            key_array.flags.writeable = False
+            self._key_array = key_array
 
-    def add(self, value: _T) -> bool:
+        return self._key_array
+
+    def rank_many(self, values: Iterable[Any]) -> Any:
         """
-        Adds a new node with the given value to this tree
+        Returns the number of values in this tree that are less than
+        each of the given values using binary search over the key snapshot
 
         IN:
-            value - the value for the new node
+            values - the values to rank (array-like)
 
         OUT:
-            bool - whether or not the new node was added
+            numpy.ndarray of ints
         """
-        if self._root is None:
-            self._root = _Node(value)
-            return True
+        return np.searchsorted(self.key_array(), np.asarray(values), side="left")
 
-        return self._add(self._root, value)
-
-    def _find_min(self, current_node: _Node[_T]) -> _Node[_T]:
+    def count_range(
+        self,
+        start: Any = None,
+        end: Any = None,
+        inclusive: tuple[bool, bool] = (True, True)
+    ) -> int:
         """
-        Finds minimal node starting from the given node
+        Counts the values between the given bounds using binary search over the key snapshot
 
         IN:
-            current_node - the current node
+            start - the lower bound, if None, counts from the first value
+                (Default: None)
+            end - the upper bound, if None, counts to the last value
+                (Default: None)
+            inclusive - whether or not the lower and the upper bounds are included
+                (Default: (True, True))
 
         OUT:
-            node
+            int
         """
-        # Found?
-        if current_node.left_child is None:
-            return current_node
-        # Continue
-        return self._find_min(current_node.left_child)
+        key_array = self.key_array()
+        include_start, include_end = inclusive
 
-    def _handle_node_deletion(self, node: _Node[_T]) -> bool:
+        start_index = 0
+        if start is not None:
+            start_index = np.searchsorted(key_array, start, side="left" if include_start else "right")
+
+        end_index = len(key_array)
+        if end is not None:
+            end_index = np.searchsorted(key_array, end, side="right" if include_end else "left")
+
+        return max(int(end_index) - int(start_index), 0)
+
+    def _contains_many_vectorized(self, values: Any) -> Any:
         """
-        Handles node deletion
+        Checks if the given values exist using binary search over the key snapshot
 
         IN:
-            node - the node to delete
+            values - numpy.ndarray of values
 
         OUT:
-            bool
+            numpy.ndarray of bools
         """
-        has_left_child = node.left_child is not None
-        has_right_child = node.right_child is not None
+        key_array = self.key_array()
 
-        # Has both children
-        if (has_left_child and has_right_child):
-            if TYPE_CHECKING:
-                node.right_child = cast_type(_Node[_T], node.right_child)
-
-            # Find min node from the right child
-            min_node = self._find_min(node.right_child)
-            min_node_value = min_node.value
-            # Changed the value of the current node (basically moving the min node)
-            node.value = min_node_value
-            # Delete the min node
-            return self._delete(min_node, min_node_value)
-
-        # No children
-        if (not has_left_child and not has_right_child):
-            # Special case if we need to delete the root node
-            if self._root is node:
-                self._root = None
-                return True
+        if not len(key_array):
+            return np.zeros(values.shape, dtype=bool)
+
+        indices = np.searchsorted(key_array, values, side="left")
+        found_keys = key_array[np.minimum(indices, len(key_array) - 1)]
+        return (indices < len(key_array)) & (found_keys == values)
 
-            if TYPE_CHECKING:
-                node.parent = cast_type(_Node[_T], node.parent)
 
-            return node.parent.remove_child(node)
+if TYPE_CHECKING:
+    class _AsyncHost(Protocol):
+        """
+        The methods the classes using _AsyncMixin must provide
+        """
+        def iter_inorder(self, reverse: bool = False) -> Iterator[Any]: ...
 
-        # One child
-        if has_left_child:
-            child = node.left_child
+        def iter_preorder(self, reverse: bool = False) -> Iterator[Any]: ...
 
-        if has_right_child:
-            child = node.right_child
+        def iter_postorder(self, reverse: bool = False) -> Iterator[Any]: ...
 
-        if TYPE_CHECKING:
-            child = cast_type(_Node[_T], child)
+        def iter_breadthfirst(self) -> Iterator[Any]: ...
 
-        node.value = child.value
-        node.left_child = child.left_child
-        node.right_child = child.right_child
-        return True
+        def add_many(self, values: Iterable[Any]) -> list[bool]: ...
 
-    def _delete(self, current_node: _Node[_T] | None, value: _T) -> bool:
+        def delete_many(self, values: Iterable[Any]) -> list[bool]: ...
+
+        def contains_many(self, values: Iterable[Any]) -> list[bool]: ...
+
+else:
+    # Only declares the host methods for type checkers, nothing to inherit at runtime
+    _AsyncHost = object
+
+
+class _AsyncMixin(_AsyncHost):
+    """
+    Async versions of the iterators and the batch operations for asyncio code,
+    the work is done in chunks and the event loop gets control between them,
+    or the chunks are computed in an executor so the loop isn't blocked at all
+
+    NOTE: the tree must not be modified by other tasks while an async iteration
+        or a batch operation is in progress,
+        the class must implement the iterators and the batch methods
+    """
+    @staticmethod
+    async def _aiter_chunked(
+        values: Iterator[Any],
+        chunk_size: int,
+        offload: bool,
+        executor: Executor | None
+    ) -> AsyncIterator[Any]:
         """
-        Recursively deletes node with the given value
+        Async generator over the values of a sync iterator, fetched in chunks
 
         IN:
-            current_node - current node
-            value - the node's value to delete
+            values - the iterator
+            chunk_size - the number of values to fetch at once
+            offload - whether or not to fetch the chunks in an executor
+            executor - the executor, None for the default one of the loop
 
         OUT:
-            bool
+            async iterator over the values
         """
-        if current_node is None:
-            return False
+        if chunk_size < 1:
+            raise ValueError(f"chunk size must be positive, got {chunk_size}")
 
-        # Search for the node
-        cmp = self.cmp_hash(value, current_node.value)
-        if cmp < 0:
-            return self._delete(current_node.left_child, value)
+        loop = asyncio.get_running_loop()
 
-        if cmp > 0:
-            return self._delete(current_node.right_child, value)
+        while True:
+            if offload:
+                chunk = await loop.run_in_executor(executor, list, islice(values, chunk_size))
+            else:
+                chunk = list(islice(values, chunk_size))
 
-        # Found, delete
-        return self._handle_node_deletion(current_node)
+            if not chunk:
+                return
 
-    def delete(self, value: _T) -> bool:
+            for value in chunk:
+                yield value
+
+            if not offload:
+                # Let other tasks run before the next chunk
+                await asyncio.sleep(0)
+
+    def aiter_inorder(
+        self,
+        reverse: bool = False,
+        chunk_size: int = _ASYNC_CHUNK_SIZE,
+        offload: bool = False,
+        executor: Executor | None = None
+    ) -> AsyncIterator[Any]:
         """
-        Deletes a node from the tree
+        Async version of iter_inorder
 
         IN:
-            value - the node's value
+            reverse - whether or not to iterate in reverse order
+                (Default: False)
+            chunk_size - how many nodes to visit before yielding control to the event loop
+                (Default: 1024)
+            offload - whether or not to visit the nodes in an executor
+                (Default: False)
+            executor - the executor to use, if None, the default executor of the loop is used
+                (Default: None)
 
         OUT:
-            bool - whether or not the node was deleted
+            async iterator over the values
         """
-        return self._delete(self._root, value)
+        return self._aiter_chunked(self.iter_inorder(reverse), chunk_size, offload, executor)
 
-    def _has_value(self, current_node: _Node[_T] | None, value: _T) -> bool:
+    def aiter_preorder(
+        self,
+        reverse: bool = False,
+        chunk_size: int = _ASYNC_CHUNK_SIZE,
+        offload: bool = False,
+        executor: Executor | None = None
+    ) -> AsyncIterator[Any]:
+        """
+        Async version of iter_preorder, see aiter_inorder for the arguments
+        """
+        return self._aiter_chunked(self.iter_preorder(reverse), chunk_size, offload, executor)
+
+    def aiter_postorder(
+        self,
+        reverse: bool = False,
+        chunk_size: int = _ASYNC_CHUNK_SIZE,
+        offload: bool = False,
+        executor: Executor | None = None
+    ) -> AsyncIterator[Any]:
+        """
+        Async version of iter_postorder, see aiter_inorder for the arguments
+        """
+        return self._aiter_chunked(self.iter_postorder(reverse), chunk_size, offload, executor)
+
+    def aiter_breadthfirst(
+        self,
+        chunk_size: int = _ASYNC_CHUNK_SIZE,
+        offload: bool = False,
+        executor: Executor | None = None
+    ) -> AsyncIterator[Any]:
+        """
+        Async version of iter_breadthfirst, see aiter_inorder for the arguments
+        """
+        return self._aiter_chunked(self.iter_breadthfirst(), chunk_size, offload, executor)
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self.aiter_inorder()
+
+    async def _run_chunked(
+        self,
+        operation: Callable[[list[Any]], list[bool]],
+        values: Iterable[Any],
+        chunk_size: int,
+        offload: bool,
+        executor: Executor | None
+    ) -> list[bool]:
         """
-        Private methods that uses recursion to find a node
+        Runs a batch operation over the values in chunks
 
         IN:
-            current_node - the node we're currently checking
-            value - the value to check
+            operation - the batch operation
+            values - the values
+            chunk_size - the number of values per chunk
+            offload - whether or not to run the whole operation in an executor
+            executor - the executor, None for the default one of the loop
 
         OUT:
-            bool
+            list of bools - the results of the operation
         """
-        if current_node is None:
-            return False
+        if chunk_size < 1:
+            raise ValueError(f"chunk size must be positive, got {chunk_size}")
 
-        cmp = self.cmp_hash(value, current_node.value)
+        values = list(values)
 
-        if cmp < 0:
-            return self._has_value(current_node.left_child, value)
+        if offload:
+            return await asyncio.get_running_loop().run_in_executor(executor, operation, values)
 
-        if cmp > 0:
-            return self._has_value(current_node.right_child, value)
+        results: list[bool] = []
+        for i in range(0, len(values), chunk_size):
+            if i:
+                await asyncio.sleep(0)
+            results.extend(operation(values[i:i + chunk_size]))
 
-        return True
+        return results
 
-    def has_value(self, value: _T) -> bool:
+    async def aadd_many(
+        self,
+        values: Iterable[Any],
+        chunk_size: int = _ASYNC_CHUNK_SIZE,
+        offload: bool = False,
+        executor: Executor | None = None
+    ) -> list[bool]:
         """
-        Checks if a node with the given value exists
+        Async version of add_many
 
         IN:
-            value - the value to check
+            values - the values for the new nodes
+            chunk_size - how many values to add before yielding control to the event loop
+                (Default: 1024)
+            offload - whether or not to add all values in an executor
+                (Default: False)
+            executor - the executor to use, if None, the default executor of the loop is used
+                (Default: None)
 
         OUT:
-            bool
+            list of bools - whether or not each value was added
         """
-        return self._has_value(self._root, value)
+        return await self._run_chunked(self.add_many, values, chunk_size, offload, executor)
 
-    def traverse_inorder(
+    async def adelete_many(
         self,
-        callback: Callable[[_Node[_T]], Any],
-        reverse: bool = False
-    ) -> None:
+        values: Iterable[Any],
+        chunk_size: int = _ASYNC_CHUNK_SIZE,
+        offload: bool = False,
+        executor: Executor | None = None
+    ) -> list[bool]:
         """
-        Traverse the tree using deepth first inorder algorithm
-
-        IN:
-            callback - a callable that's being used for processing the tree,
-                must accept a single argument - the node being processed
+        Async version of delete_many, see aadd_many for the arguments
         """
-        self._traverse_inorder(self._root, callback=callback, reverse=reverse)
+        return await self._run_chunked(self.delete_many, values, chunk_size, offload, executor)
 
-    def _traverse_inorder(
+    async def acontains_many(
         self,
-        node: _Node[_T] | None,
-        callback: Callable[[_Node[_T]], Any],
-        reverse: bool = False
-    ) -> None:
-        if node is None:
-            return
+        values: Iterable[Any],
+        chunk_size: int = _ASYNC_CHUNK_SIZE,
+        offload: bool = False,
+        executor: Executor | None = None
+    ) -> list[bool]:
+        """
+        Async version of contains_many, see aadd_many for the arguments
+        """
+        return await self._run_chunked(self.contains_many, values, chunk_size, offload, executor)
 
-        left_child = node.left_child
-        right_child = node.right_child
-        children = (left_child, right_child) if not reverse else (right_child, left_child)
 
-        self._traverse_inorder(children[0], callback=callback, reverse=reverse)
-        callback(node)
-        self._traverse_inorder(children[1], callback=callback, reverse=reverse)
+class BinaryTree(_VectorizedQueriesMixin, _AsyncMixin, Generic[_T]):
+    """
+    Represents a binary tree
+    """
+    BALANCE_MODES = (None, "rb", "treap")
+    ORDERINGS = ("hash", "native")
 
-    def traverse_preorder(
+    _node_type: type[_Node] = _Node
+    # The methods enable_stats swaps for the instrumented ones
+    _INSTRUMENTED_METHODS = (
+        "add",
+        "delete",
+        "has_value",
+        "add_many",
+        "delete_many",
+        "contains_many",
+        "_rotate_left",
+        "_rotate_right"
+    )
+    # Returns what's needed to restore a node (see _node_from_state)
+    _get_node_state: Callable[[_Node], Any] = staticmethod(_get_node_value)
+
+    def __init__(
         self,
-        callback: Callable[[_Node[_T]], Any],
-        reverse: bool = False
+        allow_dupes: bool = True,
+        balance: _BalanceMode = None,
+        order_statistics: bool = False,
+        key: Callable[[_T], Any] | None = None,
+        ordering: _Ordering = "hash",
+        auto_rebalance: float | None = None
     ) -> None:
         """
-        Traverse the tree using deepth first preorder algorithm
+        Constructor for binary tree
 
         IN:
-            callback - a callable that's being used for processing the tree,
-                must accept a single argument - the node being processed
-        """
-        self._traverse_preorder(self._root, callback=callback, reverse=reverse)
+            allow_dupes - whether or not the tree accepts duplicate values,
+                a duplicate increments the count of the existing node instead of
+                adding a new one, the iterators yield the value that many times,
+                the traversal callbacks get the node once
+                (Default: True)
+            balance - the balancing strategy for this tree:
+                None - plain unbalanced tree
+                "rb" - red-black tree, guarantees O(log n) height
+                "treap" - randomized tree (the nodes keep random priorities
+                    in heap order), expected O(log n) height, fewer rotations
+                (Default: None)
+            order_statistics - whether or not to keep subtree sizes in the nodes,
+                makes rank and select O(height) instead of O(n)
+                (Default: False)
+            key - a function that returns the sort key for a value,
+                if given, the tree is ordered by the keys and ordering is ignored
+                (Default: None)
+            ordering - how to order values if there's no key function:
+                "hash" - by hash, values only need to be hashable
+                "native" - by the values themselves, values must be comparable
+                (Default: "hash")
+            auto_rebalance - for unbalanced trees, the factor c: when a new node
+                is deeper than c * log2(n), the subtree that got too unbalanced
+                is rebuilt (like in scapegoat trees), must be greater than 1
+                (Default: None)
 
-    def _traverse_preorder(
-        self,
-        node: _Node[_T] | None,
-        callback: Callable[[_Node[_T]], Any],
-        reverse: bool = False
-    ) -> None:
-        if node is None:
-            return
+        NOTE: values with equal keys (e.g. hash collisions) are only treated
+            as duplicates if the values are equal as well
+        """
+        if balance not in self.BALANCE_MODES:
+            raise ValueError(
+                f"unknown balance mode {balance!r}, expected one of {self.BALANCE_MODES}"
+            )
 
-        left_child = node.left_child
-        right_child = node.right_child
-        children = (left_child, right_child) if not reverse else (right_child, left_child)
+        if ordering not in self.ORDERINGS:
+            raise ValueError(
+                f"unknown ordering {ordering!r}, expected one of {self.ORDERINGS}"
+            )
 
-        callback(node)
+        if auto_rebalance is not None:
+            if balance is not None:
+                raise ValueError("auto rebalancing is only for unbalanced trees")
+            if auto_rebalance <= 1:
+                raise ValueError(f"the auto rebalance factor must be greater than 1, got {auto_rebalance}")
 
-        for child in children:
-            self._traverse_preorder(child, callback=callback, reverse=reverse)
+        self.allow_dupes = allow_dupes
+        self.balance = balance
+        self.order_statistics = order_statistics
+        self.key_func = key
+        self.ordering = ordering
+        self.auto_rebalance = auto_rebalance
+        self._get_key = self._select_key_func(key, ordering)
+        self._root: _Node[_T] | None = None
+        self._size = 0
+        # The values can repeat in a node, so the nodes are counted separately (None if unknown)
+        self._num_nodes: int | None = 0
 
-    def traverse_postorder(
-        self,
-        callback: Callable[[_Node[_T]], Any],
-        reverse: bool = False
-    ) -> None:
+    @staticmethod
+    def _select_key_func(key: Callable[[_T], Any] | None, ordering: _Ordering) -> Callable[[_T], Any]:
         """
-        Traverse the tree using deepth first postorder algorithm
+        Returns the function that gives the sort keys for the values
 
         IN:
-            callback - a callable that's being used for processing the tree,
-                must accept a single argument - the node being processed
+            key - the user key function or None
+            ordering - the ordering to use if there's no key function
+
+        OUT:
+            callable
         """
-        self._traverse_postorder(self._root, callback=callback, reverse=reverse)
+        if key is not None:
+            return key
+        if ordering == "native":
+            return _identity
+        return hash
 
-    def _traverse_postorder(
-        self,
-        node: _Node[_T] | None,
-        callback: Callable[[_Node[_T]], Any],
-        reverse: bool = False
-    ) -> None:
-        if node is None:
-            return
+    def __len__(self) -> int:
+        return self._size
 
-        left_child = node.left_child
-        right_child = node.right_child
-        children = (left_child, right_child) if not reverse else (right_child, left_child)
+    def __getstate__(self) -> dict[str, Any]:
+        """
+        Returns a flat representation of this tree for pickle and copy:
+        the node states in preorder and a byte of shape flags per node,
+        so neither pickling nor unpickling recurses through the nodes
+        """
+        state = self._get_instance_state()
+        del state["_root"]
+        del state["_get_key"]
+        state.pop("_key_array", None)
 
-        for child in children:
-            self._traverse_postorder(child, callback=callback, reverse=reverse)
-        callback(node)
+        nodes = list(self._iter_preorder(self._root))
+        state["_nodes"] = list(map(self._get_node_state, nodes))
+        counts = [node.count for node in nodes]
+        # Most trees have no repeated values
+        state["_counts"] = counts if any(count > 1 for count in counts) else None
+        state["_shape"] = bytes(
+            (node.left_child is not None) * _SHAPE_HAS_LEFT
+            | (node.right_child is not None) * _SHAPE_HAS_RIGHT
+            | (node.meta is _RED) * _SHAPE_IS_RED
+            for node in nodes
+        )
+        return state
 
-    def traverse_breadthfirst(
-        self,
-        callback: Callable[[_Node[_T]], Any]
-    ) -> None:
+    def __setstate__(self, state: dict[str, Any]) -> None:
         """
-        Traverse the tree using breadth first algorithm
+        Restores this tree from the representation returned by __getstate__
 
-        IN:
-            callback - a callable that's being used for processing the tree,
-                must accept a single argument - the node being processed
+        NOTE: the hashes of some types (e.g. str) differ between processes,
+            if the restored shape doesn't match the new keys, the tree is rebuilt
         """
-        if self._root is None:
+        state = state.copy()
+        node_states = state.pop("_nodes")
+        shape = state.pop("_shape")
+        counts = state.pop("_counts", None)
+        self.__dict__.update(state)
+        self._get_key = self._select_key_func(self.key_func, self.ordering)
+        self._key_array = None
+
+        is_rb = self.balance == "rb"
+        nodes = [self._node_from_state(node_state) for node_state in node_states]
+        if counts is not None:
+            for node, count in zip(nodes, counts):
+                node.count = count
+        # The nodes that still wait for their right child
+        stack: list[_Node[_T]] = []
+        prev_node: _Node[_T] | None = None
+        prev_flags = 0
+
+        for node, flags in zip(nodes, shape):
+            if is_rb:
+                node.meta = _RED if flags & _SHAPE_IS_RED else _BLACK
+
+            if prev_node is None:
+                pass
+            # In preorder, the left child goes right after its parent
+            elif prev_flags & _SHAPE_HAS_LEFT:
+                node.parent = prev_node
+                prev_node.left_child = node
+            else:
+                parent = stack.pop()
+                node.parent = parent
+                parent.right_child = node
+
+            if flags & _SHAPE_HAS_RIGHT:
+                stack.append(node)
+            prev_node = node
+            prev_flags = flags
+
+        self._root = nodes[0] if nodes else None
+        self._num_nodes = len(nodes)
+
+        keys = list(map(_get_node_key, self._iter_inorder(self._root)))
+        if any(key > next_key for key, next_key in zip(keys, islice(keys, 1, None))):
+            nodes.sort(key=_get_node_key)
+            self._link_balanced(nodes)
             return
 
-        queue: deque[_Node[_T]] = deque()
-        queue.append(self._root)
+        if self.order_statistics:
+            self._recalc_sizes()
 
-        while queue:
-            node = queue.pop()
+        if self.balance == "treap":
+            self._assign_treap_priorities(len(nodes))
+
+    def __copy__(self) -> BinaryTree[_T]:
+        tree = type(self).__new__(type(self))
+        tree.__setstate__(self.__getstate__())
+        return tree
+
+    def __deepcopy__(self, memo: dict[int, Any]) -> BinaryTree[_T]:
+        tree = type(self).__new__(type(self))
+        memo[id(self)] = tree
+        tree.__setstate__(deepcopy(self.__getstate__(), memo))
+        return tree
+
+    def _node_from_state(self, node_state: Any) -> _Node[_T]:
+        """
+        Creates a node from its state
+
+        IN:
+            node_state - the node state as returned by _get_node_state
+
+        OUT:
+            new node
+        """
+        return self._node_type(node_state, key=self._get_key(node_state))
 
+    def _recalc_sizes(self) -> None:
+        """
+        Recalculates the subtree sizes of all nodes
+        """
+        for node in self._iter_postorder(self._root):
+            node.size = node.count
             for child in (node.left_child, node.right_child):
                 if child is not None:
-                    queue.appendleft(child)
+                    node.size += child.size
 
-            callback(node)
+    def clear(self) -> None:
+        """
+        Removes all values from this tree
+        """
+        self._root = None
+        self._size = 0
+        self._num_nodes = 0
+        self._key_array = None
 
-    @staticmethod
-    def cmp_hash(obj1: _Node[_T] | _T, obj2: _Node[_T] | _T) -> Literal[-1, 0, 1]:
+    def _iter_snapshot_keys(self) -> Iterator[Any]:
+        if self._get_key is not _identity:
+            raise ValueError("vectorized queries require the native ordering")
+
+        # The keys are the values with the native ordering
+        return self._get_values(self._iter_inorder(self._root))
+
+    @classmethod
+    def from_iterable(
+        cls,
+        values: Iterable[_T],
+        presorted: bool = False,
+        **kwargs: Any
+    ) -> BinaryTree[_T]:
         """
-        Compares hash of 2 objects, returns an int in range [-1, 1]
+        Builds a perfectly balanced tree from the given values in O(n)
+        (plus O(n log n) to sort the values if they are not sorted yet)
 
         IN:
-            obj1 - the first object to compare
-            obj2 - the second object to compare
+            values - the values for the tree
+            presorted - whether or not the values are already sorted
+                in the order of this tree (by key), skips sorting
+                (Default: False)
+            kwargs - the rest of the arguments are passed to the constructor
 
         OUT:
-            int
+            new tree
         """
-        # pylint: disable=invalid-name
-        h1 = hash(obj1)
-        h2 = hash(obj2)
-        rv = (h1 > h2) - (h1 < h2)
-        # mypy I swear to got...
-        if TYPE_CHECKING:
+        tree = cls(**kwargs)
+        get_key = tree._get_key# pylint: disable=protected-access
+
+        if not presorted:
+            values = sorted(values, key=get_key)
+
+        if not tree.allow_dupes:
+            values = chain.from_iterable(
+                _unique_values(group)
+                for _, group in groupby(values, key=get_key)
+            )
+
+        tree._build_balanced(values)# pylint: disable=protected-access
+        return tree
+
+    def _build_balanced(self, values: Iterable[_T]) -> None:
+        """
+        Replaces the contents of this tree with a perfectly balanced tree
+        built from the given sorted values, equal values share a node
+
+        IN:
+            values - the values for the tree, must be sorted
+        """
+        node_type = self._node_type
+        self._link_balanced([
+            node_type(value, key=key, count=count)
+            for key, group in groupby(values, key=self._get_key)
+            for value, count in _count_values(group)
+        ])
+
+    def _link_balanced(self, nodes: list[_Node[_T]]) -> None:
+        """
+        Replaces the contents of this tree with a perfectly balanced tree
+        made of the given sorted nodes, the nodes are relinked as needed
+
+        IN:
+            nodes - the nodes for the tree, must be sorted
+        """
+        num_nodes = len(nodes)
+        # The number of values before each node, gives the subtree sizes
+        offsets = list(accumulate((node.count for node in nodes), initial=0))
+        self._root = None
+        self._size = offsets[-1]
+        self._num_nodes = num_nodes
+        self._key_array = None
+
+        if not nodes:
+            return
+
+        is_rb = self.balance == "rb"
+        # If the last level isn't full, colour its nodes red so
+        # every path has the same number of black nodes
+        red_depth = num_nodes.bit_length() - 1 if (num_nodes + 1) & num_nodes else -1
+
+        # Each item is (start, end, parent, is right child, depth)
+        stack: list[tuple[int, int, _Node[_T] | None, bool, int]] = [(0, num_nodes, None, False, 0)]
+
+        while stack:
+            start, end, parent, is_right_child, depth = stack.pop()
+            middle = (start + end) // 2
+            node = nodes[middle]
+            node.parent = parent
+            node.left_child = node.right_child = None
+            node.size = offsets[end] - offsets[start]
+            if is_rb:
+                node.meta = _RED if depth == red_depth else _BLACK
+
+            if parent is None:
+                self._root = node
+            elif is_right_child:
+                parent.right_child = node
+            else:
+                parent.left_child = node
+
+            if start < middle:
+                stack.append((start, middle, node, False, depth + 1))
+            if middle + 1 < end:
+                stack.append((middle + 1, end, node, True, depth + 1))
+
+        if self.balance == "treap":
+            self._assign_treap_priorities(num_nodes)
+
+    def _assign_treap_priorities(self, num_nodes: int) -> None:
+        """
+        Gives the nodes new random priorities in heap order for the current shape:
+        the priorities are sorted and handed out in breadth first order,
+        so every parent gets a greater priority than its children
+
+        IN:
+            num_nodes - the number of nodes in this tree
+        """
+        priorities = sorted((random.random() for _ in range(num_nodes)), reverse=True)
+        for node, priority in zip(self._iter_breadthfirst(self._root), priorities):
+            node.meta = priority
+
+    def dump(self, fp: BinaryIO) -> None:
+        """
+        Writes this tree to a binary file in a compact format that keeps
+        the tree shape, the values must be all ints (64-bit) or all floats
+
+        IN:
+            fp - file object opened for writing in binary mode
+
+        RAISES:
+            TypeError - if the values can't be dumped
+        """
+        if self._node_type is not _Node:
+            raise TypeError(f"{type(self).__name__} can't be dumped")
+
+        if all(isinstance(value, int) for value in self):
+            typecode = b"q"
+        elif all(isinstance(value, float) for value in self):
+            typecode = b"d"
+        else:
+            raise TypeError("only trees of ints or floats can be dumped")
+
+        record = _DUMP_RECORDS[typecode]
+        record_size = record.size
+        pack_record = record.pack_into
+        pack_right_index = _DUMP_RIGHT_INDEX.pack_into
+        num_nodes = self._count_nodes(self._root)
+        buffer = bytearray(record_size * num_nodes)
+
+        # Each item is (node, the index of the parent record if the node is a right child)
+        stack: list[tuple[_Node[_T], int]] = [(self._root, -1)] if self._root is not None else []
+        index = 0
+
+        while stack:
+            node, parent_index = stack.pop()
+
+            if parent_index >= 0:
+                pack_right_index(buffer, parent_index * record_size + _DUMP_RIGHT_INDEX_OFFSET, index)
+
+            flags = 0
+            if node.left_child is not None:
+                flags |= _DUMP_HAS_LEFT
+            if node.meta is _RED:
+                flags |= _DUMP_IS_RED
+
+            try:
+                pack_record(buffer, index * record_size, node.value, 0, node.count, flags)
+            except struct.error as e:
+                raise OverflowError(f"value {node.value!r} doesn't fit into 64 bits") from e
+
+            # The left subtree goes right after the node
+            if node.right_child is not None:
+                stack.append((node.right_child, index))
+            if node.left_child is not None:
+                stack.append((node.left_child, -1))
+
+            index += 1
+
+        flags = 0
+        if self.allow_dupes:
+            flags |= _DUMP_ALLOW_DUPES
+        if self.ordering == "native":
+            flags |= _DUMP_NATIVE_ORDERING
+        if self.key_func is not None:
+            flags |= _DUMP_CUSTOM_KEY
+
+        fp.write(
+            _DUMP_HEADER.pack(
+                _DUMP_MAGIC,
+                _DUMP_VERSION,
+                typecode,
+                _DUMP_BALANCE_MODES.index(self.balance),
+                flags,
+                num_nodes,
+                self._size
+            )
+        )
+        fp.write(buffer)
+
+    @classmethod
+    def load(cls, fp: BinaryIO, **kwargs: Any) -> BinaryTree[_T]:
+        """
+        Reads a tree written by dump, the tree shape is restored as is
+
+        IN:
+            fp - file object opened for reading in binary mode
+            kwargs - the rest of the arguments are passed to the constructor,
+                allow_dupes, balance and ordering are taken from the dump
+                (the key function must be passed again if the tree had one)
+
+        OUT:
+            new tree
+
+        RAISES:
+            ValueError - if the data isn't a valid dump
+        """
+        typecode, balance, flags, count, num_values = _read_dump_header(fp.read(_DUMP_HEADER.size))
+
+        tree = cls(
+            allow_dupes=bool(flags & _DUMP_ALLOW_DUPES),
+            balance=balance,
+            ordering="native" if flags & _DUMP_NATIVE_ORDERING else "hash",
+            **kwargs
+        )
+        if flags & _DUMP_CUSTOM_KEY and tree.key_func is None:
+            raise ValueError("the tree was dumped with a key function, pass it as 'key'")
+
+        record = _DUMP_RECORDS[typecode]
+        data = fp.read(record.size * count)
+        if len(data) != record.size * count:
+            raise ValueError("truncated binary tree dump")
+
+        get_key = tree._get_key# pylint: disable=protected-access
+        node_type = tree._node_type# pylint: disable=protected-access
+        is_rb = balance == "rb"
+        records = list(record.iter_unpack(data))
+        nodes = [
+            node_type(
+                value,
+                key=get_key(value),
+                meta=(_RED if node_flags & _DUMP_IS_RED else _BLACK) if is_rb else None,
+                count=node_count
+            )
+            for value, _, node_count, node_flags in records
+        ]
+
+        def link_child(node: _Node[_T], index: int, child_index: int) -> _Node[_T]:
+            # In preorder, the children go after their parent and every node has one parent
+            if not index < child_index < count or nodes[child_index].parent is not None:
+                raise ValueError("corrupted binary tree dump")
+            child = nodes[child_index]
+            child.parent = node
+            return child
+
+        for i, (_, right_index, _, node_flags) in enumerate(records):
+            node = nodes[i]
+
+            if node_flags & _DUMP_HAS_LEFT:
+                node.left_child = link_child(node, i, i + 1)
+
+            if right_index:
+                node.right_child = link_child(node, i, right_index)
+
+        if any(node.parent is None for node in islice(nodes, 1, None)):
+            # Some nodes aren't reachable from the root
+            raise ValueError("corrupted binary tree dump")
+
+        tree._root = nodes[0] if nodes else None# pylint: disable=protected-access
+        tree._size = num_values# pylint: disable=protected-access
+        tree._num_nodes = count# pylint: disable=protected-access
+
+        if tree.order_statistics:
+            tree._recalc_sizes()# pylint: disable=protected-access
+
+        if balance == "treap":
+            tree._assign_treap_priorities(count)# pylint: disable=protected-access
+
+        return tree
+
+    def _add(self, parent_node: _Node[_T], value: _T, key: Any) -> tuple[_Node[_T], bool]:
+        """
+        Private methods that handles adding new nodes,
+        walks down from the given node until it finds a free spot
+
+        IN:
+            parent_node - the mode we're trying to add new node to
+            value - the value of the new node
+            key - the key of the value
+
+        OUT:
+            tuple:
+                the new node (or the existing equal node if the value is a dupe)
+                bool - whether or not the value was added
+        """
+        # Whether or not we already know there's no equal value
+        is_checked = False
+
+        while True:
+            if key < parent_node.key:
+                if parent_node.left_child is None:
+                    node = parent_node.left_child = self._node_type(value, parent=parent_node, key=key)
+                    self._on_node_added(node)
+                    return node, True
+
+                parent_node = parent_node.left_child
+
+            else:
+                if not is_checked and not key > parent_node.key:
+                    equal_node = self._find_equal(parent_node, value, key)
+                    if equal_node is not None:
+                        if not self.allow_dupes:
+                            # The node is a dupe and we don't like dupes here
+                            return equal_node, False
+
+                        self._add_count(equal_node, 1)
+                        return equal_node, True
+                    # Just a collision, equal keys go to the right
+                    is_checked = True
+
+                if parent_node.right_child is None:
+                    node = parent_node.right_child = self._node_type(value, parent=parent_node, key=key)
+                    self._on_node_added(node)
+                    return node, True
+
+                parent_node = parent_node.right_child
+
+    def add(self, value: _T) -> bool:
+        """
+        Adds a new node with the given value to this tree
+
+        IN:
+            value - the value for the new node
+
+        OUT:
+            bool - whether or not the new node was added
+        """
+        key = self._get_key(value)
+
+        if self._root is None:
+            self._root = self._node_type(value, key=key)
+            self._on_node_added(self._root)
+            return True
+
+        return self._add(self._root, value, key)[1]
+
+    def _add_count(self, node: _Node[_T], delta: int) -> None:
+        """
+        Changes how many times the value of a node is in this tree
+
+        IN:
+            node - the node
+            delta - the change of the count
+        """
+        node.count += delta
+        self._size += delta
+        self._key_array = None
+
+        if self.order_statistics:
+            current_node: _Node[_T] | None = node
+            while current_node is not None:
+                current_node.size += delta
+                current_node = current_node.parent
+
+    def _on_node_added(self, node: _Node[_T]) -> None:
+        """
+        Restores the tree invariants after a new leaf node was attached
+
+        IN:
+            node - the new node
+        """
+        self._size += 1
+        if self._num_nodes is not None:
+            self._num_nodes += 1
+        self._key_array = None
+
+        if self.order_statistics:
+            parent = node.parent
+            while parent is not None:
+                parent.size += 1
+                parent = parent.parent
+
+        if self.balance == "rb":
+            self._fix_after_insert_rb(node)
+
+        elif self.balance == "treap":
+            self._fix_after_insert_treap(node)
+
+        elif self.auto_rebalance is not None:
+            self._rebalance_scapegoat(node)
+
+    def _get_num_nodes(self) -> int:
+        """
+        Returns the number of nodes in this tree, O(1) unless the nodes
+        have to be counted after a split or join of trees with dupes
+
+        OUT:
+            int
+        """
+        if self._num_nodes is None:
+            self._num_nodes = self._count_nodes(self._root)
+        return self._num_nodes
+
+    def _count_nodes(self, node: _Node[_T] | None) -> int:
+        """
+        Returns the number of nodes in a subtree,
+        O(1) with order statistics (and no dupes), O(size) otherwise
+
+        IN:
+            node - the root of the subtree
+
+        OUT:
+            int
+        """
+        if node is None:
+            return 0
+        if self.order_statistics and not self.allow_dupes:
+            # Otherwise the sizes count the repeated values
+            return node.size
+        return sum(1 for _ in self._iter_inorder(node))
+
+    def _rebalance_scapegoat(self, node: _Node[_T]) -> None:
+        """
+        Rebuilds the subtree that got too unbalanced if the new node
+        is too deep, the subtree sizes are only counted in that case
+
+        IN:
+            node - the new node
+        """
+        auto_rebalance = self.auto_rebalance
+        if TYPE_CHECKING:
+            auto_rebalance = cast_type(float, auto_rebalance)
+
+        depth = 0
+        ancestor = node.parent
+        while ancestor is not None:
+            depth += 1
+            ancestor = ancestor.parent
+
+        if depth <= auto_rebalance * math.log2(self._get_num_nodes() + 1):
+            return
+
+        # A weight-balanced subtree with this alpha has the height of at most c * log2(size)
+        alpha = 2 ** (-1 / auto_rebalance)
+        child = node
+        child_size = 1
+        ancestor = node.parent
+
+        while ancestor is not None:
+            sibling = ancestor.right_child if child is ancestor.left_child else ancestor.left_child
+            size = child_size + 1 + self._count_nodes(sibling)
+
+            if child_size > alpha * size:
+                self._rebalance_subtree(ancestor, size)
+                return
+
+            child = ancestor
+            child_size = size
+            ancestor = ancestor.parent
+
+    def rebalance(self) -> None:
+        """
+        Rebuilds this tree in place into a balanced tree in O(n) time using O(1) extra memory
+        (Day-Stout-Warren: the tree is rotated into a sorted "vine" and then folded back),
+        red-black trees are recoloured and treaps get new priorities afterwards (in O(n) extra memory)
+        """
+        if self._root is None:
+            return
+
+        num_nodes = self._get_num_nodes()
+        self._rebalance_subtree(self._root, num_nodes)
+
+        if self.balance == "treap":
+            self._assign_treap_priorities(num_nodes)
+
+        if self.balance == "rb":
+            # All levels but the last one are full, colour the last one red if it isn't full,
+            # so every path has the same number of black nodes
+            red_depth = num_nodes.bit_length() - 1 if (num_nodes + 1) & num_nodes else -1
+            level = [self._root]
+            depth = 0
+            while level:
+                for node in level:
+                    node.meta = _RED if depth == red_depth else _BLACK
+                level = [
+                    child
+                    for node in level
+                    for child in (node.left_child, node.right_child)
+                    if child is not None
+                ]
+                depth += 1
+
+    def _rebalance_subtree(self, root: _Node[_T], size: int) -> None:
+        """
+        Rebuilds a subtree in place using Day-Stout-Warren algorithm
+
+        IN:
+            root - the root of the subtree
+            size - the number of nodes in the subtree
+        """
+        parent = root.parent
+        is_left_child = parent is not None and root is parent.left_child
+
+        def get_top() -> _Node[_T]:
+            top = self._root if parent is None else (parent.left_child if is_left_child else parent.right_child)
+            if TYPE_CHECKING:
+                top = cast_type(_Node[_T], top)
+            return top
+
+        rotate_left = self._rotate_left
+        rotate_right = self._rotate_right
+
+        # Turn the subtree into a vine: rotate right until there are no left children
+        node: _Node[_T] | None = root
+        while node is not None:
+            if node.left_child is not None:
+                rotate_right(node)
+                node = node.parent
+            else:
+                node = node.right_child
+
+        def compress(count: int) -> None:
+            # Rotate left every other node of the vine
+            node = get_top()
+            for _ in range(count):
+                rotate_left(node)
+                node = node.parent.right_child# type: ignore[union-attr, assignment]
+
+        # Make the bottom level first, then fold the vine in halves
+        full_size = (1 << ((size + 1).bit_length() - 1)) - 1
+        compress(size - full_size)
+        while full_size > 1:
+            full_size //= 2
+            compress(full_size)
+
+    def _find_min(self, current_node: _Node[_T]) -> _Node[_T]:
+        """
+        Finds minimal node starting from the given node
+
+        IN:
+            current_node - the current node
+
+        OUT:
+            node
+        """
+        while current_node.left_child is not None:
+            current_node = current_node.left_child
+
+        return current_node
+
+    def _find_max(self, current_node: _Node[_T]) -> _Node[_T]:
+        """
+        Finds maximal node starting from the given node
+
+        IN:
+            current_node - the current node
+
+        OUT:
+            node
+        """
+        while current_node.right_child is not None:
+            current_node = current_node.right_child
+
+        return current_node
+
+    def _replace_in_parent(self, old_node: _Node[_T], new_node: _Node[_T] | None) -> None:
+        """
+        Puts a node (which can be None) in place of another node,
+        the children of the old node are kept intact
+
+        IN:
+            old_node - the node to replace
+            new_node - the node to put in its place
+        """
+        parent = old_node.parent
+
+        if parent is None:
+            self._root = new_node
+        else:
+            parent.replace_child(old_node, new_node)
+
+        if new_node is not None:
+            new_node.parent = parent
+
+    def _rotate_left(self, node: _Node[_T]) -> None:
+        """
+        Rotates the subtree with the given root to the left
+
+        IN:
+            node - the root of the subtree, must have the right child
+        """
+        pivot = node.right_child
+        if TYPE_CHECKING:
+            pivot = cast_type(_Node[_T], pivot)
+
+        node.right_child = pivot.left_child
+        if pivot.left_child is not None:
+            pivot.left_child.parent = node
+
+        self._replace_in_parent(node, pivot)
+        pivot.left_child = node
+        node.parent = pivot
+
+        if self.order_statistics:
+            self._update_rotated_sizes(node, pivot)
+
+    def _rotate_right(self, node: _Node[_T]) -> None:
+        """
+        Rotates the subtree with the given root to the right
+
+        IN:
+            node - the root of the subtree, must have the left child
+        """
+        pivot = node.left_child
+        if TYPE_CHECKING:
+            pivot = cast_type(_Node[_T], pivot)
+
+        node.left_child = pivot.right_child
+        if pivot.right_child is not None:
+            pivot.right_child.parent = node
+
+        self._replace_in_parent(node, pivot)
+        pivot.right_child = node
+        node.parent = pivot
+
+        if self.order_statistics:
+            self._update_rotated_sizes(node, pivot)
+
+    @staticmethod
+    def _update_rotated_sizes(node: _Node[_T], pivot: _Node[_T]) -> None:
+        """
+        Fixes subtree sizes after a rotation
+
+        IN:
+            node - the old root of the rotated subtree
+            pivot - the new root of the rotated subtree
+        """
+        pivot.size = node.size
+        node.size = node.count
+        if node.left_child is not None:
+            node.size += node.left_child.size
+        if node.right_child is not None:
+            node.size += node.right_child.size
+
+    def _fix_after_insert_rb(self, node: _Node[_T]) -> bool:
+        """
+        Restores the red-black properties after inserting a node
+
+        IN:
+            node - the inserted node
+
+        OUT:
+            bool - whether or not the black height of the tree grew
+        """
+        node.meta = _RED
+        parent = node.parent
+
+        while parent is not None and parent.meta is _RED:
+            # A red node is never the root, so the grandparent exists
+            grandparent = parent.parent
+            if TYPE_CHECKING:
+                grandparent = cast_type(_Node[_T], grandparent)
+
+            if parent is grandparent.left_child:
+                uncle = grandparent.right_child
+                if uncle is not None and uncle.meta is _RED:
+                    parent.meta = uncle.meta = _BLACK
+                    grandparent.meta = _RED
+                    node = grandparent
+                    parent = node.parent
+                    continue
+
+                if node is parent.right_child:
+                    self._rotate_left(parent)
+                    node, parent = parent, node
+
+                parent.meta = _BLACK
+                grandparent.meta = _RED
+                self._rotate_right(grandparent)
+
+            else:
+                uncle = grandparent.left_child
+                if uncle is not None and uncle.meta is _RED:
+                    parent.meta = uncle.meta = _BLACK
+                    grandparent.meta = _RED
+                    node = grandparent
+                    parent = node.parent
+                    continue
+
+                if node is parent.left_child:
+                    self._rotate_right(parent)
+                    node, parent = parent, node
+
+                parent.meta = _BLACK
+                grandparent.meta = _RED
+                self._rotate_left(grandparent)
+
+            break
+
+        if TYPE_CHECKING:
+            self._root = cast_type(_Node[_T], self._root)
+        # The fix can only end with a red root if it was recoloured (or it's the new node)
+        is_root_red = self._root.meta is _RED
+        self._root.meta = _BLACK
+        return is_root_red
+
+    def _fix_after_insert_treap(self, node: _Node[_T]) -> None:
+        """
+        Gives a new leaf a random priority and rotates it up
+        while its priority is greater than its parent's
+
+        IN:
+            node - the added node
+        """
+        node.meta = random.random()
+        parent = node.parent
+        while parent is not None and parent.meta < node.meta:
+            if node is parent.left_child:
+                self._rotate_right(parent)
+            else:
+                self._rotate_left(parent)
+            parent = node.parent
+
+    def _fix_after_delete_rb(self, node: _Node[_T] | None, parent: _Node[_T] | None) -> None:
+        """
+        Restores the red-black properties after removing a black node
+
+        IN:
+            node - the node that took the place of the removed one (can be None)
+            parent - the parent of that node
+        """
+        while node is not self._root and (node is None or node.meta is _BLACK):
+            # The removed node was black, so its sibling subtree can't be empty
+            if TYPE_CHECKING:
+                parent = cast_type(_Node[_T], parent)
+
+            if node is parent.left_child:
+                sibling = parent.right_child
+                if TYPE_CHECKING:
+                    sibling = cast_type(_Node[_T], sibling)
+                if sibling.meta is _RED:
+                    sibling.meta = _BLACK
+                    parent.meta = _RED
+                    self._rotate_left(parent)
+                    sibling = parent.right_child
+                    if TYPE_CHECKING:
+                        sibling = cast_type(_Node[_T], sibling)
+
+                near = sibling.left_child
+                far = sibling.right_child
+                if (
+                    (near is None or near.meta is _BLACK)
+                    and (far is None or far.meta is _BLACK)
+                ):
+                    sibling.meta = _RED
+                    node = parent
+                    parent = node.parent
+                    continue
+
+                if far is None or far.meta is _BLACK:
+                    # The near child is red then
+                    if TYPE_CHECKING:
+                        near = cast_type(_Node[_T], near)
+                    near.meta = _BLACK
+                    sibling.meta = _RED
+                    self._rotate_right(sibling)
+                    sibling = parent.right_child
+                    if TYPE_CHECKING:
+                        sibling = cast_type(_Node[_T], sibling)
+
+                sibling.meta = parent.meta
+                parent.meta = _BLACK
+                far = sibling.right_child
+                if TYPE_CHECKING:
+                    far = cast_type(_Node[_T], far)
+                far.meta = _BLACK
+                self._rotate_left(parent)
+
+            else:
+                sibling = parent.left_child
+                if TYPE_CHECKING:
+                    sibling = cast_type(_Node[_T], sibling)
+                if sibling.meta is _RED:
+                    sibling.meta = _BLACK
+                    parent.meta = _RED
+                    self._rotate_right(parent)
+                    sibling = parent.left_child
+                    if TYPE_CHECKING:
+                        sibling = cast_type(_Node[_T], sibling)
+
+                near = sibling.right_child
+                far = sibling.left_child
+                if (
+                    (near is None or near.meta is _BLACK)
+                    and (far is None or far.meta is _BLACK)
+                ):
+                    sibling.meta = _RED
+                    node = parent
+                    parent = node.parent
+                    continue
+
+                if far is None or far.meta is _BLACK:
+                    # The near child is red then
+                    if TYPE_CHECKING:
+                        near = cast_type(_Node[_T], near)
+                    near.meta = _BLACK
+                    sibling.meta = _RED
+                    self._rotate_left(sibling)
+                    sibling = parent.left_child
+                    if TYPE_CHECKING:
+                        sibling = cast_type(_Node[_T], sibling)
+
+                sibling.meta = parent.meta
+                parent.meta = _BLACK
+                far = sibling.left_child
+                if TYPE_CHECKING:
+                    far = cast_type(_Node[_T], far)
+                far.meta = _BLACK
+                self._rotate_right(parent)
+
+            node = self._root
+            break
+
+        if node is not None:
+            node.meta = _BLACK
+
+    def _handle_node_deletion(self, node: _Node[_T]) -> bool:
+        """
+        Handles node deletion, the node is unlinked from the tree
+        (if it has both children, its inorder successor takes its place)
+
+        IN:
+            node - the node to delete
+
+        OUT:
+            bool
+        """
+        if self.balance == "treap":
+            # Rotate the node down (keeping the heap order) until it has one child at most
+            while node.left_child is not None and node.right_child is not None:
+                if node.left_child.meta > node.right_child.meta:
+                    self._rotate_right(node)
+                else:
+                    self._rotate_left(node)
+
+        left_child = node.left_child
+        right_child = node.right_child
+
+        # Has both children
+        if left_child is not None and right_child is not None:
+            # Find min node from the right child and move it in place of the current one
+            successor = self._find_min(right_child)
+            removed_meta = successor.meta
+            child = successor.right_child
+
+            child_parent: _Node[_T] | None
+            if successor is right_child:
+                child_parent = successor
+
+            else:
+                child_parent = successor.parent
+                self._replace_in_parent(successor, child)
+                successor.right_child = right_child
+                right_child.parent = successor
+
+            self._replace_in_parent(node, successor)
+            successor.left_child = left_child
+            left_child.parent = successor
+            successor.meta = node.meta
+
+        # One or no children
+        else:
+            removed_meta = node.meta
+            child = left_child if left_child is not None else right_child
+            child_parent = node.parent
+            self._replace_in_parent(node, child)
+
+        node.parent = node.left_child = node.right_child = None
+        self._size -= node.count
+        if self._num_nodes is not None:
+            self._num_nodes -= 1
+        self._key_array = None
+
+        if self.order_statistics:
+            self._recalc_sizes_upwards(child_parent)
+
+        if self.balance == "rb" and removed_meta is _BLACK:
+            self._fix_after_delete_rb(child, child_parent)
+
+        return True
+
+    @staticmethod
+    def _recalc_sizes_upwards(node: _Node[_T] | None) -> None:
+        """
+        Recalculates subtree sizes on the path from the given node to the root
+
+        IN:
+            node - the node to start from
+        """
+        while node is not None:
+            size = node.count
+            if node.left_child is not None:
+                size += node.left_child.size
+            if node.right_child is not None:
+                size += node.right_child.size
+            node.size = size
+            node = node.parent
+
+    @staticmethod
+    def _find_equal(node: _Node[_T], value: _T, key: Any) -> _Node[_T] | None:
+        """
+        Searches the subtree of a node with the given key for a node with
+        the given value, used to tell apart values with equal keys
+
+        IN:
+            node - the first found node with the key
+            value - the value to search for
+            key - the key of the value
+
+        OUT:
+            the node with the value or None if the keys just collide
+        """
+        stack = [node]
+
+        while stack:
+            node = stack.pop()
+
+            if key < node.key:
+                if node.left_child is not None:
+                    stack.append(node.left_child)
+
+            elif key > node.key:
+                if node.right_child is not None:
+                    stack.append(node.right_child)
+
+            else:
+                if node.value == value:
+                    return node
+
+                # Nodes with equal keys can be on either side
+                for child in (node.left_child, node.right_child):
+                    if child is not None:
+                        stack.append(child)
+
+        return None
+
+    def _delete(self, current_node: _Node[_T] | None, value: _T) -> bool:
+        """
+        Deletes node with the given value starting the search from the given node
+
+        IN:
+            current_node - current node
+            value - the node's value to delete
+
+        OUT:
+            bool
+        """
+        key = self._get_key(value)
+
+        # Search for the node
+        while current_node is not None:
+            if key < current_node.key:
+                current_node = current_node.left_child
+
+            elif key > current_node.key:
+                current_node = current_node.right_child
+
+            else:
+                if current_node.value != value:
+                    current_node = self._find_equal(current_node, value, key)
+                    if current_node is None:
+                        return False
+
+                # Found, delete
+                return self._remove_value(current_node)
+
+        return False
+
+    def _remove_value(self, node: _Node[_T]) -> bool:
+        """
+        Removes the value of a node once, the node is deleted
+        when the last copy of the value is removed
+
+        IN:
+            node - the node
+
+        OUT:
+            bool
+        """
+        if node.count > 1:
+            self._add_count(node, -1)
+            return True
+
+        return self._handle_node_deletion(node)
+
+    def delete(self, value: _T) -> bool:
+        """
+        Deletes a node from the tree, if the value was added several times,
+        only one copy of it is deleted
+
+        IN:
+            value - the node's value
+
+        OUT:
+            bool - whether or not the node was deleted
+        """
+        return self._delete(self._root, value)
+
+    def _has_value(self, current_node: _Node[_T] | None, value: _T) -> bool:
+        """
+        Private methods that walks down from the given node to find a node
+
+        IN:
+            current_node - the node we're currently checking
+            value - the value to check
+
+        OUT:
+            bool
+        """
+        key = self._get_key(value)
+
+        while current_node is not None:
+            if key < current_node.key:
+                current_node = current_node.left_child
+
+            elif key > current_node.key:
+                current_node = current_node.right_child
+
+            else:
+                return (
+                    current_node.value == value
+                    or self._find_equal(current_node, value, key) is not None
+                )
+
+        return False
+
+    def __contains__(self, value: Any) -> bool:
+        return self._has_value(self._root, value)
+
+    def has_value(self, value: _T) -> bool:
+        """
+        Checks if a node with the given value exists
+
+        IN:
+            value - the value to check
+
+        OUT:
+            bool
+        """
+        return self._has_value(self._root, value)
+
+    def count(self, value: _T) -> int:
+        """
+        Returns how many times the given value is in this tree
+
+        IN:
+            value - the value to count
+
+        OUT:
+            int
+        """
+        node = self._find_from(self._root, value, self._get_key(value))[0]
+        return node.count if node is not None else 0
+
+    def _climb(self, finger: _Node[_T] | None, key: Any) -> _Node[_T] | None:
+        """
+        Finds the lowest ancestor of the finger node which subtree can contain
+        the given key, used for finger search over keys in ascending order
+
+        IN:
+            finger - the node the previous search stopped at,
+                its key must not be greater than the given key
+                (if None, the search starts from the root)
+            key - the key to search for
+
+        OUT:
+            node to start the search from (None if the tree is empty)
+        """
+        if finger is None or not key > finger.key:
+            # Nodes with equal keys can be above the subtree of the finger
+            # (a key function can give distinct values equal keys),
+            # only the topmost node with the key is guaranteed to have them all
+            return self._root
+
+        node = finger
+        parent = node.parent
+
+        # Climb until we come from the left of a node with a greater key,
+        # that node is the upper bound of the current subtree
+        while parent is not None:
+            if node is parent.left_child and key < parent.key:
+                break
+
+            node = parent
+            parent = node.parent
+
+        return node
+
+    def _find_from(
+        self,
+        current_node: _Node[_T] | None,
+        value: _T,
+        key: Any
+    ) -> tuple[_Node[_T] | None, _Node[_T] | None]:
+        """
+        Walks down from the given node to find a node with the given value
+
+        IN:
+            current_node - the node to start from
+            value - the value to search for
+            key - the key of the value
+
+        OUT:
+            tuple:
+                the found node or None
+                the last visited node
+        """
+        last_node = current_node
+
+        while current_node is not None:
+            last_node = current_node
+
+            if key < current_node.key:
+                current_node = current_node.left_child
+
+            elif key > current_node.key:
+                current_node = current_node.right_child
+
+            else:
+                if current_node.value == value:
+                    return current_node, current_node
+
+                return self._find_equal(current_node, value, key), current_node
+
+        return None, last_node
+
+    def _get_batch_order(self, values: list[_T]) -> tuple[list[Any], list[int]]:
+        """
+        Computes the keys of the values of a batch and sorts them by key
+
+        IN:
+            values - the batch
+
+        OUT:
+            tuple:
+                list of keys
+                list of indices of the values in ascending order
+        """
+        keys = list(map(self._get_key, values))
+        return keys, sorted(range(len(values)), key=keys.__getitem__)
+
+    def add_many(self, values: Iterable[_T]) -> list[bool]:
+        """
+        Adds new nodes with the given values to this tree,
+        for self-balancing trees the batch is sorted and inserted
+        in a single pass reusing the previous position in the tree
+        (unbalanced trees keep the given order, sorted inserts would degenerate them)
+
+        IN:
+            values - the values for the new nodes
+
+        OUT:
+            list of bools - whether or not each value was added
+        """
+        if self.balance is None:
+            # The method of the class: with the statistics enabled, the one
+            # of the instance would count every value a second time
+            add = type(self).add
+            return [add(self, value) for value in values]
+
+        values = list(values)
+        results = [False] * len(values)
+        keys, order = self._get_batch_order(values)
+        finger: _Node[_T] | None = None
+
+        for i in order:
+            key = keys[i]
+            start_node = self._climb(finger, key)
+
+            if start_node is None:
+                self._root = finger = self._node_type(values[i], key=key)
+                self._on_node_added(finger)
+                results[i] = True
+
+            else:
+                finger, results[i] = self._add(start_node, values[i], key)
+
+        return results
+
+    def delete_many(self, values: Iterable[_T]) -> list[bool]:
+        """
+        Deletes nodes with the given values from this tree,
+        the batch is sorted and deleted in a single pass
+        reusing the previous position in the tree
+
+        IN:
+            values - the values to delete
+
+        OUT:
+            list of bools - whether or not each value was deleted
+        """
+        values = list(values)
+        results = [False] * len(values)
+        keys, order = self._get_batch_order(values)
+        finger: _Node[_T] | None = None
+
+        for i in order:
+            key = keys[i]
+            node, last_node = self._find_from(self._climb(finger, key), values[i], key)
+
+            if node is None:
+                finger = last_node
+
+            else:
+                # The predecessor stays in the tree and can't be greater than the next key
+                finger = self._get_prev_node(node)
+                results[i] = self._remove_value(node)
+
+        return results
+
+    def contains_many(self, values: Iterable[_T]) -> list[bool]:
+        """
+        Checks if nodes with the given values exist,
+        the batch is sorted and checked in a single pass
+        reusing the previous position in the tree
+
+        NOTE: if NumPy is available, the tree uses the native ordering and
+            the values are a numpy.ndarray, the check is vectorized
+            over the sorted key snapshot and returns numpy.ndarray of bools
+
+        IN:
+            values - the values to check
+
+        OUT:
+            list of bools - whether or not each value exists
+        """
+        if np is not None and isinstance(values, np.ndarray) and self._get_key is _identity:
+            return self._contains_many_vectorized(values)
+
+        values = list(values)
+        results = [False] * len(values)
+        keys, order = self._get_batch_order(values)
+        finger: _Node[_T] | None = None
+
+        for i in order:
+            key = keys[i]
+            node, finger = self._find_from(self._climb(finger, key), values[i], key)
+            results[i] = node is not None
+
+        return results
+
+    def _new_empty(self) -> BinaryTree[_T]:
+        """
+        Creates an empty tree with the same settings as this one
+
+        OUT:
+            new tree
+        """
+        tree = type(self).__new__(type(self))
+        tree.__dict__.update(self._get_instance_state())
+        tree._root = None
+        tree._size = 0
+        tree._num_nodes = 0
+        tree._key_array = None
+        return tree
+
+    def _check_compatible(self, other: BinaryTree[_T]) -> None:
+        """
+        Checks that the other tree can be combined with this one
+
+        IN:
+            other - the other tree
+
+        RAISES:
+            ValueError - if the trees have different types or settings
+        """
+        if (
+            type(other) is not type(self)
+            or other.allow_dupes != self.allow_dupes
+            or other.balance != self.balance
+            or other.order_statistics != self.order_statistics
+            or other.key_func is not self.key_func
+            or other.ordering != self.ordering
+        ):
+            raise ValueError("the trees must be of the same type and have the same settings")
+
+    @staticmethod
+    def _get_black_height(node: _Node[_T] | None) -> int:
+        """
+        Returns the number of black nodes on a path from the given node down to a leaf
+
+        IN:
+            node - the root of a red-black subtree
+
+        OUT:
+            int
+        """
+        height = 0
+        while node is not None:
+            height += node.meta is _BLACK
+            node = node.left_child
+
+        return height
+
+    def _detach_subtree(self, node: _Node[_T] | None, height: int) -> tuple[_Node[_T] | None, int]:
+        """
+        Detaches a subtree from its parent so it can be joined elsewhere,
+        red roots are made black
+
+        IN:
+            node - the root of the subtree
+            height - the black height of the subtree
+
+        OUT:
+            tuple:
+                the root of the subtree
+                the new black height of the subtree
+        """
+        if node is not None:
+            node.parent = None
+            if node.meta is _RED:
+                node.meta = _BLACK
+                height += 1
+
+        return node, height
+
+    def _join_subtrees(
+        self,
+        left: _Node[_T] | None,
+        left_height: int,
+        middle: _Node[_T],
+        right: _Node[_T] | None,
+        right_height: int
+    ) -> tuple[_Node[_T], int]:
+        """
+        Joins two detached subtrees using a node which key is between theirs,
+        for red-black trees the shorter subtree is attached to the taller one
+        at the same black height, so it's O(difference of the heights),
+        for treaps the node gets a new priority and is rotated down, so it's O(height),
+        uses the root of this tree as the working space
+
+        IN:
+            left - the root of the subtree with the lesser keys or None
+            left_height - the black height of the left subtree
+            middle - the node to put between the subtrees, its links are overwritten
+            right - the root of the subtree with the greater keys or None
+            right_height - the black height of the right subtree
+
+        OUT:
+            tuple:
+                the root of the joined tree
+                the black height of the joined tree
+        """
+        order_statistics = self.order_statistics
+        middle.parent = None
+
+        if self.balance != "rb" or left_height == right_height:
+            middle.left_child = left
+            middle.right_child = right
+            middle.size = middle.count
+            for child in (left, right):
+                if child is not None:
+                    child.parent = middle
+                    middle.size += child.size
+
+            if self.balance == "rb":
+                middle.meta = _BLACK
+                return middle, left_height + 1
+
+            if self.balance == "treap":
+                self._root = middle
+                middle.meta = random.random()
+                while True:
+                    left_child = middle.left_child
+                    right_child = middle.right_child
+                    if left_child is not None and left_child.meta > middle.meta and (
+                        right_child is None or left_child.meta > right_child.meta
+                    ):
+                        self._rotate_right(middle)
+                    elif right_child is not None and right_child.meta > middle.meta:
+                        self._rotate_left(middle)
+                    else:
+                        break
+
+                if TYPE_CHECKING:
+                    self._root = cast_type(_Node[_T], self._root)
+                return self._root, 0
+
+            return middle, 0
+
+        is_left_taller = left_height > right_height
+        if is_left_taller:
+            taller, height, shorter, shorter_height = left, left_height, right, right_height
+        else:
+            taller, height, shorter, shorter_height = right, right_height, left, left_height
+        if TYPE_CHECKING:
+            taller = cast_type(_Node[_T], taller)
+
+        # Go down the inner side of the taller subtree to a black node
+        # with the same black height as the shorter subtree
+        parent: _Node[_T] | None = None
+        node: _Node[_T] | None = taller
+        node_height = height
+        while node is not None and (node.meta is _RED or node_height > shorter_height):
+            node_height -= node.meta is _BLACK
+            parent = node
+            node = node.right_child if is_left_taller else node.left_child
+
+        if TYPE_CHECKING:
+            parent = cast_type(_Node[_T], parent)
+
+        if is_left_taller:
+            middle.left_child, middle.right_child = node, shorter
+            parent.right_child = middle
+        else:
+            middle.left_child, middle.right_child = shorter, node
+            parent.left_child = middle
+        middle.parent = parent
+
+        middle.size = middle.count
+        for child in (node, shorter):
+            if child is not None:
+                child.parent = middle
+                middle.size += child.size
+
+        if order_statistics:
+            added_size = middle.size - (node.size if node is not None else 0)
+            while parent is not None:
+                parent.size += added_size
+                parent = parent.parent
+
+        self._root = taller
+        if self._fix_after_insert_rb(middle):
+            height += 1
+
+        if TYPE_CHECKING:
+            self._root = cast_type(_Node[_T], self._root)
+        return self._root, height
+
+    def _set_subtree(self, root: _Node[_T] | None, size: int | None = None) -> None:
+        """
+        Makes the given detached subtree the contents of this tree
+
+        IN:
+            root - the root of the subtree
+            size - the number of values in the subtree, if None, it's taken
+                from the root (order statistics) or counted
+                (Default: None)
+        """
+        self._root = root
+        self._key_array = None
+
+        if size is None:
+            if root is None:
+                size = 0
+            elif self.order_statistics:
+                size = root.size
+            else:
+                size = sum(node.count for node in self._iter_inorder(root))
+
+        self._size = size
+        # Without dupes every node holds one value, otherwise the nodes are counted when needed
+        self._num_nodes = size if not self.allow_dupes else None
+
+    def split(self, value: _T) -> tuple[BinaryTree[_T], BinaryTree[_T]]:
+        """
+        Splits this tree in two by the key of the given value, the nodes
+        are moved to the new trees and this tree is left empty,
+        O(log n) for red-black trees, O(height) for unbalanced trees
+
+        NOTE: without order statistics the sizes of the new trees are counted in O(n)
+
+        IN:
+            value - the value to split at
+
+        OUT:
+            tuple:
+                new tree with the values which keys are less than the key of the value
+                new tree with the rest of the values
+        """
+        key = self._get_key(value)
+        is_rb = self.balance == "rb"
+
+        # Each item is (node, its black height, whether or not it goes to the left tree)
+        path: list[tuple[_Node[_T], int, bool]] = []
+        node = self._root
+        height = self._get_black_height(node) if is_rb else 0
+        while node is not None:
+            goes_left = node.key < key
+            path.append((node, height, goes_left))
+            if is_rb:
+                height -= node.meta is _BLACK
+            node = node.right_child if goes_left else node.left_child
+
+        left_tree = self._new_empty()
+        right_tree = self._new_empty()
+        left_root: _Node[_T] | None = None
+        right_root: _Node[_T] | None = None
+        left_height = right_height = 0
+
+        # Join the pieces bottom up, the black heights of the joined trees only grow,
+        # so the costs of the joins add up to O(log n)
+        for node, height, goes_left in reversed(path):
+            child_height = height - (node.meta is _BLACK) if is_rb else 0
+
+            if goes_left:
+                child, child_height = self._detach_subtree(node.left_child, child_height)
+                left_root, left_height = left_tree._join_subtrees(
+                    child,
+                    child_height,
+                    node,
+                    left_root,
+                    left_height
+                )
+
+            else:
+                child, child_height = self._detach_subtree(node.right_child, child_height)
+                right_root, right_height = right_tree._join_subtrees(
+                    right_root,
+                    right_height,
+                    node,
+                    child,
+                    child_height
+                )
+
+        left_tree._set_subtree(left_root)
+        right_tree._set_subtree(right_root, self._size - left_tree._size)
+        self.clear()
+
+        return left_tree, right_tree
+
+    @classmethod
+    def join(cls, left: BinaryTree[_T], right: BinaryTree[_T]) -> BinaryTree[_T]:
+        """
+        Joins two trees with the same settings, all keys of the left tree must be less than
+        (or equal to if the trees allow dupes) the keys of the right tree,
+        the nodes are moved to the new tree and the given trees are left empty
+        (a value that is in both trees keeps one node with the summed count),
+        O(log n) for red-black trees, O(height) for unbalanced trees
+
+        IN:
+            left - the tree with the lesser keys
+            right - the tree with the greater keys
+
+        OUT:
+            new tree
+
+        RAISES:
+            ValueError - if the trees can't be joined
+        """
+        left._check_compatible(right)# pylint: disable=protected-access
+        # pylint: disable=protected-access
+        tree = left._new_empty()
+
+        if left._root is not None and right._root is not None:
+            left_max = left._find_max(left._root)
+            right_min = right._find_min(right._root)
+            if right_min.key < left_max.key or (not left.allow_dupes and not left_max.key < right_min.key):
+                raise ValueError("the keys of the left tree must be less than the keys of the right tree")
+
+            if not left_max.key < right_min.key:
+                # A value can only have one node, so the values on the boundary that are
+                # in both trees are counted in the left nodes and taken out of the right tree
+                boundary_key = left_max.key
+                boundary_nodes = list(takewhile(
+                    lambda node: not boundary_key < node.key,
+                    right._iter_inorder(right._root)
+                ))
+                for node in boundary_nodes:
+                    equal_node = left._find_from(left._root, node.value, boundary_key)[0]
+                    if equal_node is not None:
+                        right._handle_node_deletion(node)
+                        left._add_count(equal_node, node.count)
+
+        if left._root is None or right._root is None:
+            tree._set_subtree(
+                left._root if left._root is not None else right._root,
+                left._size + right._size
+            )
+
+        else:
+            # Take the smallest node out of the right tree and put it between
+            right_min = right._find_min(right._root)
+            right._handle_node_deletion(right_min)
+            is_rb = tree.balance == "rb"
+            root, _ = tree._join_subtrees(
+                left._root,
+                tree._get_black_height(left._root) if is_rb else 0,
+                right_min,
+                right._root,
+                tree._get_black_height(right._root) if is_rb else 0
+            )
+            tree._set_subtree(root, left._size + right._size + right_min.count)
+
+        left.clear()
+        right.clear()
+        # pylint: enable=protected-access
+        return tree
+
+    def _merge_groups(self, other: BinaryTree[_T]) -> Iterator[tuple[list[_Node[_T]], list[_Node[_T]]]]:
+        """
+        Merges the nodes of this and the other tree by key in O(n + m)
+
+        IN:
+            other - the other tree
+
+        OUT:
+            iterator over the pairs of lists of nodes with equal keys
+                from this and the other tree (one of the lists can be empty)
+        """
+        self._check_compatible(other)
+        self_groups = groupby(self._iter_inorder(self._root), key=_get_node_key)
+        other_groups = groupby(other._iter_inorder(other._root), key=_get_node_key)
+        self_group = next(self_groups, None)
+        other_group = next(other_groups, None)
+
+        while self_group is not None or other_group is not None:
+            if other_group is None or (self_group is not None and self_group[0] < other_group[0]):
+                yield list(self_group[1]), []# type: ignore[index]
+                self_group = next(self_groups, None)
+
+            elif self_group is None or other_group[0] < self_group[0]:
+                yield [], list(other_group[1])
+                other_group = next(other_groups, None)
+
+            else:
+                yield list(self_group[1]), list(other_group[1])
+                self_group = next(self_groups, None)
+                other_group = next(other_groups, None)
+
+    def _from_sorted_nodes(self, nodes: Iterable[_Node[_T]]) -> BinaryTree[_T]:
+        """
+        Builds a perfectly balanced tree with the same settings as this one
+        from copies of the given sorted nodes
+
+        IN:
+            nodes - the nodes
+
+        OUT:
+            new tree
+        """
+        tree = self._new_empty()
+        get_node_state = self._get_node_state
+        node_from_state = self._node_from_state
+        new_nodes = []
+        for node in nodes:
+            new_node = node_from_state(get_node_state(node))
+            new_node.count = node.count
+            new_nodes.append(new_node)
+
+        tree._link_balanced(new_nodes)
+        return tree
+
+    def union(self, other: BinaryTree[_T]) -> BinaryTree[_T]:
+        """
+        Returns a new tree with the values of this tree and the values
+        of the other tree that aren't in this tree, O(n + m)
+
+        IN:
+            other - the other tree, must have the same settings
+
+        OUT:
+            new tree
+        """
+        nodes: list[_Node[_T]] = []
+
+        for self_nodes, other_nodes in self._merge_groups(other):
+            nodes.extend(self_nodes)
+            if other_nodes:
+                self_values = list(map(_get_node_value, self_nodes))
+                nodes.extend(node for node in other_nodes if node.value not in self_values)
+
+        return self._from_sorted_nodes(nodes)
+
+    def intersection(self, other: BinaryTree[_T]) -> BinaryTree[_T]:
+        """
+        Returns a new tree with the values of this tree that are also in the other tree, O(n + m)
+
+        IN:
+            other - the other tree, must have the same settings
+
+        OUT:
+            new tree
+        """
+        nodes: list[_Node[_T]] = []
+
+        for self_nodes, other_nodes in self._merge_groups(other):
+            if self_nodes and other_nodes:
+                other_values = list(map(_get_node_value, other_nodes))
+                nodes.extend(node for node in self_nodes if node.value in other_values)
+
+        return self._from_sorted_nodes(nodes)
+
+    def difference(self, other: BinaryTree[_T]) -> BinaryTree[_T]:
+        """
+        Returns a new tree with the values of this tree that aren't in the other tree, O(n + m)
+
+        IN:
+            other - the other tree, must have the same settings
+
+        OUT:
+            new tree
+        """
+        nodes: list[_Node[_T]] = []
+
+        for self_nodes, other_nodes in self._merge_groups(other):
+            if self_nodes:
+                other_values = list(map(_get_node_value, other_nodes))
+                nodes.extend(node for node in self_nodes if node.value not in other_values)
+
+        return self._from_sorted_nodes(nodes)
+
+    @staticmethod
+    def _get_prev_node(node: _Node[_T]) -> _Node[_T] | None:
+        """
+        Returns the inorder predecessor of the given node
+
+        IN:
+            node - the node
+
+        OUT:
+            node or None if this is the first node
+        """
+        if node.left_child is not None:
+            node = node.left_child
+            while node.right_child is not None:
+                node = node.right_child
+            return node
+
+        parent = node.parent
+        while parent is not None and node is parent.left_child:
+            node = parent
+            parent = node.parent
+
+        return parent
+
+    @staticmethod
+    def _get_next_node(node: _Node[_T]) -> _Node[_T] | None:
+        """
+        Returns the inorder successor of the given node
+
+        IN:
+            node - the node
+
+        OUT:
+            node or None if this is the last node
+        """
+        if node.right_child is not None:
+            node = node.right_child
+            while node.left_child is not None:
+                node = node.left_child
+            return node
+
+        parent = node.parent
+        while parent is not None and node is parent.right_child:
+            node = parent
+            parent = node.parent
+
+        return parent
+
+    def _find_lower_bound(self, key: Any, inclusive: bool = True) -> _Node[_T] | None:
+        """
+        Finds the first node (in order) which key is greater than
+        (or equal to if inclusive) the given key
+
+        IN:
+            key - the key
+            inclusive - whether or not a node with an equal key counts
+                (Default: True)
+
+        OUT:
+            node or None
+        """
+        node = self._root
+        bound = None
+
+        while node is not None:
+            if key < node.key or (inclusive and not key > node.key):
+                bound = node
+                node = node.left_child
+            else:
+                node = node.right_child
+
+        return bound
+
+    def _find_upper_bound(self, key: Any, inclusive: bool = True) -> _Node[_T] | None:
+        """
+        Finds the last node (in order) which key is less than
+        (or equal to if inclusive) the given key
+
+        IN:
+            key - the key
+            inclusive - whether or not a node with an equal key counts
+                (Default: True)
+
+        OUT:
+            node or None
+        """
+        node = self._root
+        bound = None
+
+        while node is not None:
+            if key > node.key or (inclusive and not key < node.key):
+                bound = node
+                node = node.right_child
+            else:
+                node = node.left_child
+
+        return bound
+
+    def range(
+        self,
+        start: _T | None = None,
+        end: _T | None = None,
+        inclusive: tuple[bool, bool] = (True, True),
+        reverse: bool = False
+    ) -> Iterator[_T]:
+        """
+        Lazily iterates over the values which keys are between the keys
+        of the given values in O(log n + k), only the nodes
+        within the bounds are visited
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            start - the lower bound, if None, iterates from the first value
+                (Default: None)
+            end - the upper bound, if None, iterates to the last value
+                (Default: None)
+            inclusive - whether or not the lower and the upper bounds are included
+                (Default: (True, True))
+            reverse - whether or not to iterate from the upper bound down
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        get_key = self._get_key
+        start_key = get_key(start) if start is not None else None
+        end_key = get_key(end) if end is not None else None
+        include_start, include_end = inclusive
+
+        if not reverse:
+            if start_key is None:
+                node = self._find_min(self._root) if self._root is not None else None
+            else:
+                node = self._find_lower_bound(start_key, include_start)
+
+            get_next_node = self._get_next_node
+            while node is not None:
+                # Past the upper bound?
+                if end_key is not None and (
+                    end_key < node.key
+                    or (not include_end and not end_key > node.key)
+                ):
+                    return
+
+                yield from repeat(node.value, node.count)
+                node = get_next_node(node)
+
+        else:
+            if end_key is None:
+                node = self._find_max(self._root) if self._root is not None else None
+            else:
+                node = self._find_upper_bound(end_key, include_end)
+
+            get_prev_node = self._get_prev_node
+            while node is not None:
+                # Past the lower bound?
+                if start_key is not None and (
+                    start_key > node.key
+                    or (not include_start and not start_key < node.key)
+                ):
+                    return
+
+                yield from repeat(node.value, node.count)
+                node = get_prev_node(node)
+
+    def floor(self, value: _T) -> _T | None:
+        """
+        Returns the greatest value which key is less than or equal to the key of the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        node = self._find_upper_bound(self._get_key(value))
+        return node.value if node is not None else None
+
+    def ceiling(self, value: _T) -> _T | None:
+        """
+        Returns the smallest value which key is greater than or equal to the key of the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        node = self._find_lower_bound(self._get_key(value))
+        return node.value if node is not None else None
+
+    def predecessor(self, value: _T) -> _T | None:
+        """
+        Returns the greatest value which key is less than the key of the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        node = self._find_upper_bound(self._get_key(value), inclusive=False)
+        return node.value if node is not None else None
+
+    def successor(self, value: _T) -> _T | None:
+        """
+        Returns the smallest value which key is greater than the key of the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        node = self._find_lower_bound(self._get_key(value), inclusive=False)
+        return node.value if node is not None else None
+
+    def rank(self, value: _T) -> int:
+        """
+        Returns the number of values in this tree that are less than the given value,
+        O(height) for trees with order statistics, O(n) otherwise
+
+        IN:
+            value - the value to rank
+
+        OUT:
+            int
+        """
+        key = self._get_key(value)
+
+        if not self.order_statistics:
+            rank = 0
+            for node in self._iter_inorder(self._root):
+                if node.key >= key:
+                    break
+                rank += node.count
+            return rank
+
+        rank = 0
+        current_node = self._root
+        while current_node is not None:
+            if key <= current_node.key:
+                current_node = current_node.left_child
+
+            else:
+                rank += current_node.count
+                if current_node.left_child is not None:
+                    rank += current_node.left_child.size
+                current_node = current_node.right_child
+
+        return rank
+
+    def select(self, index: int) -> _T:
+        """
+        Returns the value with the given index in sorted order (k-th smallest value),
+        O(height) for trees with order statistics, O(n) otherwise
+
+        IN:
+            index - the index of the value, supports negative indices
+
+        OUT:
+            the value
+
+        RAISES:
+            IndexError - if the index is out of range
+        """
+        if index < 0:
+            index += self._size
+
+        if not 0 <= index < self._size:
+            raise IndexError("tree index out of range")
+
+        if not self.order_statistics:
+            return next(islice(self, index, None))
+
+        node = self._root
+        while True:
+            if TYPE_CHECKING:
+                node = cast_type(_Node[_T], node)
+
+            left_size = node.left_child.size if node.left_child is not None else 0
+
+            if index < left_size:
+                node = node.left_child
+
+            elif index >= left_size + node.count:
+                index -= left_size + node.count
+                node = node.right_child
+
+            else:
+                return node.value
+
+    def __iter__(self) -> Iterator[_T]:
+        return self.iter_inorder()
+
+    def __reversed__(self) -> Iterator[_T]:
+        return self.iter_inorder(reverse=True)
+
+    def iter_inorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this tree using deepth first inorder algorithm
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            reverse - whether or not to iterate in reverse order
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return self._get_values(self._iter_inorder(self._root, reverse=reverse))
+
+    def iter_preorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this tree using deepth first preorder algorithm
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            reverse - whether or not to visit the right subtrees first
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return self._get_values(self._iter_preorder(self._root, reverse=reverse))
+
+    def iter_postorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this tree using deepth first postorder algorithm
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            reverse - whether or not to visit the right subtrees first
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return self._get_values(self._iter_postorder(self._root, reverse=reverse))
+
+    def iter_breadthfirst(self) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this tree using breadth first algorithm
+        NOTE: the tree must not be modified during iteration
+
+        OUT:
+            iterator over the values
+        """
+        return self._get_values(self._iter_breadthfirst(self._root))
+
+    def _get_values(self, nodes: Iterator[_Node[_T]]) -> Iterator[_T]:
+        """
+        Maps the nodes to their values, the values that were added
+        several times are repeated
+
+        IN:
+            nodes - iterator over the nodes
+
+        OUT:
+            iterator over the values
+        """
+        if self.allow_dupes:
+            return _iter_node_values(nodes)
+
+        # All counts are 1
+        return map(_get_node_value, nodes)
+
+    def traverse_inorder(
+        self,
+        callback: Callable[[_Node[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first inorder algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        for node in self._iter_inorder(self._root, reverse=reverse):
+            callback(node)
+
+    def traverse_preorder(
+        self,
+        callback: Callable[[_Node[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first preorder algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        for node in self._iter_preorder(self._root, reverse=reverse):
+            callback(node)
+
+    def traverse_postorder(
+        self,
+        callback: Callable[[_Node[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first postorder algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        for node in self._iter_postorder(self._root, reverse=reverse):
+            callback(node)
+
+    def traverse_breadthfirst(
+        self,
+        callback: Callable[[_Node[_T]], Any]
+    ) -> None:
+        """
+        Traverse the tree using breadth first algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        for node in self._iter_breadthfirst(self._root):
+            callback(node)
+
+    def _get_instance_state(self) -> dict[str, Any]:
+        """
+        Returns a copy of the instance attributes without the instrumentation
+
+        OUT:
+            dict
+        """
+        return {
+            name: attr
+            for name, attr in self.__dict__.items()
+            if name not in self._INSTRUMENTED_METHODS and name != "_stats"
+        }
+
+    def enable_stats(self, hook: Callable[[str, Any, int], Any] | None = None) -> None:
+        """
+        Starts collecting the operation statistics (see stats), the methods
+        of this tree are swapped for instrumented ones, so there's no overhead
+        when the statistics are disabled; enabling them again resets the counters
+
+        NOTE: the instrumented operations search the tree one extra time
+            to measure the path length, the batch operations are only counted,
+            the in operator isn't counted (special methods can't be swapped per instance)
+
+        IN:
+            hook - a callable to call after each add, delete and has_value
+                with the operation name, the value and the path length
+                (Default: None)
+        """
+        self.disable_stats()
+        self._stats: dict[str, Any] = {
+            "operations": dict.fromkeys(("add", "delete", "has_value"), 0),
+            "path_length": dict.fromkeys(("add", "delete", "has_value"), 0),
+            "depths": {name: {} for name in ("add", "delete", "has_value")},
+            "rotations": 0,
+        }
+
+        for name in self._INSTRUMENTED_METHODS:
+            setattr(self, name, self._make_instrumented(name, getattr(self, name), hook))
+
+    def disable_stats(self) -> None:
+        """
+        Stops collecting the operation statistics and restores the original methods
+        """
+        for name in self._INSTRUMENTED_METHODS:
+            self.__dict__.pop(name, None)
+        self.__dict__.pop("_stats", None)
+
+    def _make_instrumented(
+        self,
+        name: str,
+        method: Callable[..., Any],
+        hook: Callable[[str, Any, int], Any] | None
+    ) -> Callable[..., Any]:
+        """
+        Wraps a method to collect the statistics
+
+        IN:
+            name - the method name
+            method - the original bound method
+            hook - the hook to call after the single value operations
+
+        OUT:
+            the instrumented method
+        """
+        stats = self._stats
+        operations = stats["operations"]
+
+        if name in ("_rotate_left", "_rotate_right"):
+            def instrumented_rotate(node: _Node[_T]) -> None:
+                stats["rotations"] += 1
+                method(node)
+
+            return instrumented_rotate
+
+        if name.endswith("_many"):
+            operation = {"add_many": "add", "delete_many": "delete", "contains_many": "has_value"}[name]
+
+            def instrumented_batch(values: Iterable[_T]) -> Any:
+                if np is None or not isinstance(values, np.ndarray):
+                    values = list(values)
+                operations[operation] += len(values)
+                return method(values)
+
+            return instrumented_batch
+
+        path_lengths = stats["path_length"]
+        depths = stats["depths"][name]
+
+        def instrumented(value: _T) -> bool:
+            _, last_node = self._find_from(self._root, value, self._get_key(value))
+
+            # The number of nodes on the path from the root to the last visited node
+            path_length = 0
+            while last_node is not None:
+                path_length += 1
+                last_node = last_node.parent
+
+            result = method(value)
+            operations[name] += 1
+            path_lengths[name] += path_length
+            depths[path_length] = depths.get(path_length, 0) + 1
+
+            if hook is not None:
+                hook(name, value, path_length)
+
+            return result
+
+        return instrumented
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Returns a snapshot of the statistics collected since enable_stats,
+        the height is measured on call in O(n)
+
+        OUT:
+            dict:
+                operations - the number of adds, deletes and has_value checks
+                path_length - the total search path length per operation: the number of nodes
+                    from the root to the node where the search for the value stops,
+                    it doesn't count the extra comparisons of the equal key scans
+                    and doesn't include the rebalancing work
+                depths - the histogram of the search path lengths per operation
+                rotations - the number of rotations
+                height - the current height of the tree
+                size - the current number of values
+
+        RAISES:
+            RuntimeError - if the statistics aren't enabled
+        """
+        if "_stats" not in self.__dict__:
+            raise RuntimeError("the statistics aren't enabled, call enable_stats first")
+
+        stats = self._stats
+        height = 0
+        level = [self._root] if self._root is not None else []
+        while level:
+            height += 1
+            level = [
+                child
+                for node in level
+                for child in (node.left_child, node.right_child)
+                if child is not None
+            ]
+
+        return {
+            "operations": dict(stats["operations"]),
+            "path_length": dict(stats["path_length"]),
+            "depths": {name: dict(sorted(depths.items())) for name, depths in stats["depths"].items()},
+            "rotations": stats["rotations"],
+            "height": height,
+            "size": self._size,
+        }
+
+    def parallel_reduce(
+        self,
+        fn: Callable[[list[_T]], _V],
+        combine: Callable[[_V, _V], _V],
+        workers: int | None = None,
+        executor: Executor | None = None
+    ) -> _V:
+        """
+        Reduces the values of this tree using a process pool: the values are split
+        into contiguous key ranges, fn reduces each range in a worker and
+        combine merges the results of the neighbouring ranges in order
+
+        The ranges are cut from the inorder iterator as the workers need them
+        (at most 2 * workers ranges are pending), so big trees aren't copied in one go
+
+        NOTE: fn and the values must be picklable (e.g. fn can't be a lambda),
+            the tree must not be modified until the reduction is done
+
+        IN:
+            fn - a function that reduces a sorted list of values to a result
+                (e.g. sum, len, max)
+            combine - a function that merges the results of two neighbouring ranges,
+                the result of the lower range goes first
+                (e.g. operator.add, max)
+            workers - the number of processes if there's no executor,
+                the tree is split into at least this many ranges,
+                if None, the number of CPUs is used
+                (Default: None)
+            executor - the executor to run fn in, if None, a new process pool is used
+                (Default: None)
+
+        OUT:
+            the combined result, fn([]) for an empty tree
+        """
+        if workers is None:
+            workers = cpu_count() or 1
+
+        if workers < 1:
+            raise ValueError(f"the number of workers must be positive, got {workers}")
+
+        if not len(self):
+            return fn([])
+
+        chunk_size = min(-(-len(self) // workers), _PARALLEL_CHUNK_SIZE)
+        values = iter(self)
+        chunks = iter(lambda: list(islice(values, chunk_size)), [])
+
+        def iter_results(executor: Executor) -> Iterator[_V]:
+            pending: deque[Future[_V]] = deque()
+
+            for chunk in chunks:
+                pending.append(executor.submit(fn, chunk))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+        if executor is not None:
+            return reduce(combine, iter_results(executor))
+
+        with ProcessPoolExecutor(workers) as own_executor:
+            return reduce(combine, iter_results(own_executor))
+
+    @staticmethod
+    def _iter_inorder(node: _Node[_T] | None, reverse: bool = False) -> Iterator[_Node[_T]]:
+        """
+        Generator over the nodes of a subtree in inorder,
+        uses O(height) memory
+
+        IN:
+            node - the root of the subtree
+            reverse - whether or not to iterate in reverse order
+                (Default: False)
+
+        OUT:
+            iterator over the nodes
+        """
+        stack: list[_Node[_T]] = []
+
+        while True:
+            # Go as far to the first side as possible
+            while node is not None:
+                stack.append(node)
+                node = node.left_child if not reverse else node.right_child
+
+            if not stack:
+                return
+
+            node = stack.pop()
+            yield node
+            node = node.right_child if not reverse else node.left_child
+
+    @staticmethod
+    def _iter_preorder(node: _Node[_T] | None, reverse: bool = False) -> Iterator[_Node[_T]]:
+        """
+        Generator over the nodes of a subtree in preorder,
+        uses O(height) memory
+
+        IN:
+            node - the root of the subtree
+            reverse - whether or not to visit the right subtrees first
+                (Default: False)
+
+        OUT:
+            iterator over the nodes
+        """
+        if node is None:
+            return
+
+        stack = [node]
+
+        while stack:
+            node = stack.pop()
+            yield node
+
+            # Push the child we want to visit first the last
+            left_child = node.left_child
+            right_child = node.right_child
+            children = (right_child, left_child) if not reverse else (left_child, right_child)
+            for child in children:
+                if child is not None:
+                    stack.append(child)
+
+    @staticmethod
+    def _iter_postorder(node: _Node[_T] | None, reverse: bool = False) -> Iterator[_Node[_T]]:
+        """
+        Generator over the nodes of a subtree in postorder,
+        uses O(height) memory
+
+        IN:
+            node - the root of the subtree
+            reverse - whether or not to visit the right subtrees first
+                (Default: False)
+
+        OUT:
+            iterator over the nodes
+        """
+        stack: list[_Node[_T]] = []
+        last_visited: _Node[_T] | None = None
+
+        while stack or node is not None:
+            # Go as far to the first side as possible
+            while node is not None:
+                stack.append(node)
+                node = node.left_child if not reverse else node.right_child
+
+            top = stack[-1]
+            second_child = top.right_child if not reverse else top.left_child
+
+            # Visit the second subtree before the node itself
+            if second_child is not None and second_child is not last_visited:
+                node = second_child
+
+            else:
+                stack.pop()
+                yield top
+                last_visited = top
+
+    @staticmethod
+    def _iter_breadthfirst(node: _Node[_T] | None) -> Iterator[_Node[_T]]:
+        """
+        Generator over the nodes of a subtree in breadth first order
+
+        IN:
+            node - the root of the subtree
+
+        OUT:
+            iterator over the nodes
+        """
+        if node is None:
+            return
+
+        queue: deque[_Node[_T]] = deque()
+        queue.append(node)
+
+        while queue:
+            node = queue.pop()
+
+            for child in (node.left_child, node.right_child):
+                if child is not None:
+                    queue.appendleft(child)
+
+            yield node
+
+    @staticmethod
+    def cmp_hash(obj1: _Node[_T] | _T, obj2: _Node[_T] | _T) -> Literal[-1, 0, 1]:
+        """
+        Compares hash of 2 objects, returns an int in range [-1, 1]
+
+        IN:
+            obj1 - the first object to compare
+            obj2 - the second object to compare
+
+        OUT:
+            int
+        """
+        # pylint: disable=invalid-name
+        h1 = hash(obj1)
+        h2 = hash(obj2)
+        rv = (h1 > h2) - (h1 < h2)
+        # mypy I swear to got...
+        if TYPE_CHECKING:
             rv = cast_type(Literal[-1, 0, 1], rv)
         return rv
         # pylint: enable=invalid-name
+
+
+class _MapNode(_Node[_K]):
+    """
+    Represents a tree map node, the node value is the mapping key
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, value: _K, *args: Any, data: Any = None, **kwargs: Any) -> None:
+        """
+        Constructor for tree map node
+
+        IN:
+            value - the mapping key (must be hashable)
+            data - the value mapped to the key
+                (Default: None)
+            the rest of the arguments are the same as for _Node
+        """
+        super().__init__(value, *args, **kwargs)
+        self.data = data
+
+
+class _TreeMapItemsView(ItemsView[_K, _V]):
+    """
+    Represents a view of the (key, value) pairs of a tree map in the order of the keys
+    """
+    __slots__ = ()
+    _mapping: TreeMap[_K, _V]
+
+    def __iter__(self) -> Iterator[tuple[_K, _V]]:
+        """
+        Lazily iterates over the (key, value) pairs in order
+        NOTE: the map must not be modified during iteration
+
+        OUT:
+            iterator over the pairs
+        """
+        tree_map = self._mapping
+        return map(_get_node_item, tree_map._iter_inorder(tree_map._root))# pylint: disable=protected-access
+
+
+class _TreeMapValuesView(ValuesView[_V]):
+    """
+    Represents a view of the values of a tree map in the order of their keys
+    """
+    __slots__ = ()
+    _mapping: TreeMap[Any, _V]
+
+    def __iter__(self) -> Iterator[_V]:
+        """
+        Lazily iterates over the values in the order of their keys
+        NOTE: the map must not be modified during iteration
+
+        OUT:
+            iterator over the values
+        """
+        tree_map = self._mapping
+        return map(_get_node_data, tree_map._iter_inorder(tree_map._root))# pylint: disable=protected-access
+
+
+class TreeMap(BinaryTree[_K], MutableMapping[_K, _V]):
+    """
+    Represents an ordered mapping on top of a binary tree,
+    the keys are stored in the tree nodes along with their values,
+    so there's no need for a separate dict
+
+    NOTE: the BinaryTree methods (add, has_value, traversals, etc) work with the mapping keys
+    """
+    _node_type = _MapNode
+    _get_node_state = staticmethod(_get_node_item)
+
+    def __init__(
+        self,
+        items: Mapping[_K, _V] | Iterable[tuple[_K, _V]] = (),
+        balance: _BalanceMode = "rb",
+        order_statistics: bool = False,
+        key: Callable[[_K], Any] | None = None,
+        ordering: _Ordering = "hash"
+    ) -> None:
+        """
+        Constructor for tree map
+
+        IN:
+            items - the initial mapping or (key, value) pairs
+                (Default: empty tuple)
+            balance - the balancing strategy for this tree
+                (Default: "rb")
+            the rest of the arguments are the same as for BinaryTree
+        """
+        super().__init__(
+            allow_dupes=False,
+            balance=balance,
+            order_statistics=order_statistics,
+            key=key,
+            ordering=ordering
+        )
+
+        if isinstance(items, Mapping):
+            items = items.items()
+
+        for map_key, map_value in items:
+            self[map_key] = map_value
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self.items())!r})"
+
+    @classmethod
+    def from_iterable(# type: ignore[override]
+        cls,
+        items: Mapping[_K, _V] | Iterable[tuple[_K, _V]],
+        presorted: bool = False,
+        **kwargs: Any
+    ) -> TreeMap[_K, _V]:
+        """
+        Builds a perfectly balanced map from the given (key, value) pairs in O(n)
+        (plus O(n log n) to sort the pairs if they are not sorted yet),
+        if a key repeats, the last value wins, like with dict
+
+        IN:
+            items - a mapping or (key, value) pairs
+            presorted - whether or not the pairs are already sorted
+                in the order of this map (by key), skips sorting
+                (Default: False)
+            kwargs - the rest of the arguments are passed to the constructor
+
+        OUT:
+            new map
+        """
+        tree = cls(**kwargs)
+        get_key = tree._get_key# pylint: disable=protected-access
+
+        if isinstance(items, Mapping):
+            items = items.items()
+
+        def get_item_key(item: tuple[_K, _V]) -> Any:
+            return get_key(item[0])
+
+        if not presorted:
+            # The sort is stable, so the last value of a repeated key stays last
+            items = sorted(items, key=get_item_key)
+
+        nodes: list[_Node[_K]] = []
+        for key, group in groupby(items, key=get_item_key):
+            # Distinct mapping keys can have equal tree keys
+            group_nodes: list[_MapNode[_K]] = []
+            for map_key, map_value in group:
+                for node in group_nodes:
+                    if node.value == map_key:
+                        node.data = map_value
+                        break
+                else:
+                    group_nodes.append(_MapNode(map_key, key=key, data=map_value))
+            nodes.extend(group_nodes)
+
+        tree._link_balanced(nodes)# pylint: disable=protected-access
+        return tree
+
+    def add(self, value: _K) -> bool:
+        """
+        Not supported, a key can't be added without a value
+
+        RAISES:
+            TypeError - always, use map[key] = value instead
+        """
+        raise TypeError(f"{type(self).__name__} keys need values, use map[key] = value")
+
+    def add_many(self, values: Iterable[_K]) -> list[bool]:
+        """
+        Not supported, the keys can't be added without values
+
+        RAISES:
+            TypeError - always, use map.update(items) instead
+        """
+        raise TypeError(f"{type(self).__name__} keys need values, use map.update(items)")
+
+    def _node_from_state(self, node_state: tuple[_K, _V]) -> _MapNode[_K]:
+        map_key, map_value = node_state
+        return _MapNode(map_key, key=self._get_key(map_key), data=map_value)
+
+    def _find_node(self, map_key: _K) -> _MapNode[_K] | None:
+        """
+        Finds the node for the given mapping key
+
+        IN:
+            map_key - the mapping key
+
+        OUT:
+            node or None
+        """
+        node = self._find_from(self._root, map_key, self._get_key(map_key))[0]
+        if TYPE_CHECKING:
+            node = cast_type(_MapNode[_K] | None, node)
+        return node
+
+    def __getitem__(self, map_key: _K) -> _V:
+        node = self._find_node(map_key)
+
+        if node is None:
+            raise KeyError(map_key)
+
+        return node.data
+
+    def __setitem__(self, map_key: _K, map_value: _V) -> None:
+        key = self._get_key(map_key)
+
+        node: _Node[_K]
+        if self._root is None:
+            node = self._root = _MapNode(map_key, key=key)
+            self._on_node_added(node)
+
+        else:
+            # Returns the existing node if the key is already in the map
+            node = self._add(self._root, map_key, key)[0]
+
+        if TYPE_CHECKING:
+            node = cast_type(_MapNode[_K], node)
+
+        node.data = map_value
+
+    def __delitem__(self, map_key: _K) -> None:
+        node = self._find_node(map_key)
+
+        if node is None:
+            raise KeyError(map_key)
+
+        self._handle_node_deletion(node)
+
+    def get(self, map_key: _K, default: Any = None) -> _V | Any:
+        """
+        Returns the value for the given key or the default value
+
+        IN:
+            map_key - the mapping key
+            default - the value to return if there's no such key
+                (Default: None)
+
+        OUT:
+            the value
+        """
+        node = self._find_node(map_key)
+
+        if node is None:
+            return default
+
+        return node.data
+
+    def pop(self, map_key: _K, default: Any = _MISSING) -> _V | Any:
+        """
+        Removes the given key and returns its value
+
+        IN:
+            map_key - the mapping key
+            default - the value to return if there's no such key,
+                if omitted, KeyError is raised instead
+
+        OUT:
+            the value
+        """
+        node = self._find_node(map_key)
+
+        if node is None:
+            if default is _MISSING:
+                raise KeyError(map_key)
+            return default
+
+        map_value = node.data
+        self._handle_node_deletion(node)
+        return map_value
+
+    def items(self) -> ItemsView[_K, _V]:
+        """
+        Returns a view of the (key, value) pairs, the view iterates in order
+
+        OUT:
+            the items view
+        """
+        return _TreeMapItemsView(self)
+
+    def keys(self) -> KeysView[_K]:
+        """
+        Returns a view of the keys, the view iterates in order
+
+        OUT:
+            the keys view
+        """
+        return KeysView(self)
+
+    def values(self) -> ValuesView[_V]:
+        """
+        Returns a view of the values, the view iterates in the order of their keys
+
+        OUT:
+            the values view
+        """
+        return _TreeMapValuesView(self)
+
+
+class _ReadWriteLock:
+    """
+    Represents a readers-writer lock: any number of readers or a single writer,
+    waiting writers stop new readers from coming in so they can't starve
+
+    NOTE: the lock isn't reentrant, a thread that holds it must not acquire it again
+    """
+    __slots__ = ("_condition", "_readers", "_is_writing", "_waiting_writers")
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._is_writing = False
+        self._waiting_writers = 0
+
+    def acquire_read(self) -> None:
+        with self._condition:
+            while self._is_writing or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._condition:
+            self._waiting_writers += 1
+            while self._is_writing or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._is_writing = True
+
+    def release_write(self) -> None:
+        with self._condition:
+            self._is_writing = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class ConcurrentBinaryTree(Generic[_T]):
+    """
+    Represents a thread-safe binary tree, wraps a BinaryTree and guards it
+    with a readers-writer lock: the queries run concurrently,
+    the modifications are exclusive
+
+    NOTE: the iterators return a snapshot of the values taken under the lock,
+        so the tree can be modified while iterating over them
+    """
+    def __init__(self, tree: BinaryTree[_T] | None = None, **kwargs: Any) -> None:
+        """
+        Constructor for concurrent binary tree
+
+        IN:
+            tree - the tree to wrap, it must not be used directly after this,
+                if None, a new tree is created
+                (Default: None)
+            kwargs - the arguments for the new tree, the same as for BinaryTree
+        """
+        if tree is not None and kwargs:
+            raise TypeError("can't pass both a tree and the arguments for a new tree")
+
+        self.tree: BinaryTree[_T] = tree if tree is not None else BinaryTree(**kwargs)
+        self._lock = _ReadWriteLock()
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}(size={len(self)})>"
+
+    def __getstate__(self) -> dict[str, Any]:
+        with self._lock.read():
+            return {"tree": self.tree}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.tree = state["tree"]
+        self._lock = _ReadWriteLock()
+
+    @classmethod
+    def from_iterable(
+        cls,
+        values: Iterable[_T],
+        presorted: bool = False,
+        **kwargs: Any
+    ) -> ConcurrentBinaryTree[_T]:
+        """
+        Builds a perfectly balanced tree from the given values, see BinaryTree.from_iterable
+        """
+        return cls(BinaryTree.from_iterable(values, presorted=presorted, **kwargs))
+
+    def read_lock(self) -> AbstractContextManager[None]:
+        """
+        Returns a context manager that holds the read lock, use it to run
+        several queries on the wrapped tree (self.tree) as one atomic operation
+
+        NOTE: don't call the methods of this object while holding the lock
+
+        OUT:
+            context manager
+        """
+        return self._lock.read()
+
+    def write_lock(self) -> AbstractContextManager[None]:
+        """
+        Returns a context manager that holds the write lock, use it to run
+        several modifications of the wrapped tree (self.tree) as one atomic operation
+
+        NOTE: don't call the methods of this object while holding the lock
+
+        OUT:
+            context manager
+        """
+        return self._lock.write()
+
+    def __len__(self) -> int:
+        return len(self.tree)
+
+    def clear(self) -> None:
+        """
+        Removes all values from this tree
+        """
+        with self._lock.write():
+            self.tree.clear()
+
+    def add(self, value: _T) -> bool:
+        """
+        Adds a new node with the given value to this tree, see BinaryTree.add
+        """
+        with self._lock.write():
+            return self.tree.add(value)
+
+    def delete(self, value: _T) -> bool:
+        """
+        Deletes a node from the tree, see BinaryTree.delete
+        """
+        with self._lock.write():
+            return self.tree.delete(value)
+
+    def add_many(self, values: Iterable[_T]) -> list[bool]:
+        """
+        Adds new nodes with the given values to this tree, see BinaryTree.add_many
+
+        NOTE: the values are collected before taking the lock
+        """
+        values = list(values)
+        with self._lock.write():
+            return self.tree.add_many(values)
+
+    def delete_many(self, values: Iterable[_T]) -> list[bool]:
+        """
+        Deletes nodes with the given values from this tree, see BinaryTree.delete_many
+
+        NOTE: the values are collected before taking the lock
+        """
+        values = list(values)
+        with self._lock.write():
+            return self.tree.delete_many(values)
+
+    def __contains__(self, value: Any) -> bool:
+        return self.has_value(value)
+
+    def has_value(self, value: _T) -> bool:
+        """
+        Checks if a node with the given value exists, see BinaryTree.has_value
+        """
+        with self._lock.read():
+            return self.tree.has_value(value)
+
+    def count(self, value: _T) -> int:
+        """
+        Returns how many times the given value is in the tree, see BinaryTree.count
+        """
+        with self._lock.read():
+            return self.tree.count(value)
+
+    def contains_many(self, values: Iterable[_T]) -> list[bool]:
+        """
+        Checks if nodes with the given values exist, see BinaryTree.contains_many
+        """
+        if np is None or not isinstance(values, np.ndarray):
+            values = list(values)
+        with self._lock.read():
+            return self.tree.contains_many(values)
+
+    def floor(self, value: _T) -> _T | None:
+        """
+        See BinaryTree.floor
+        """
+        with self._lock.read():
+            return self.tree.floor(value)
+
+    def ceiling(self, value: _T) -> _T | None:
+        """
+        See BinaryTree.ceiling
+        """
+        with self._lock.read():
+            return self.tree.ceiling(value)
+
+    def predecessor(self, value: _T) -> _T | None:
+        """
+        See BinaryTree.predecessor
+        """
+        with self._lock.read():
+            return self.tree.predecessor(value)
+
+    def successor(self, value: _T) -> _T | None:
+        """
+        See BinaryTree.successor
+        """
+        with self._lock.read():
+            return self.tree.successor(value)
+
+    def rank(self, value: _T) -> int:
+        """
+        See BinaryTree.rank
+        """
+        with self._lock.read():
+            return self.tree.rank(value)
+
+    def select(self, index: int) -> _T:
+        """
+        See BinaryTree.select
+        """
+        with self._lock.read():
+            return self.tree.select(index)
+
+    def range(
+        self,
+        start: _T | None = None,
+        end: _T | None = None,
+        inclusive: tuple[bool, bool] = (True, True),
+        reverse: bool = False
+    ) -> Iterator[_T]:
+        """
+        Iterates over a snapshot of the values between the given bounds, see BinaryTree.range
+        """
+        with self._lock.read():
+            return iter(list(self.tree.range(start, end, inclusive, reverse)))
+
+    def __iter__(self) -> Iterator[_T]:
+        return self.iter_inorder()
+
+    def __reversed__(self) -> Iterator[_T]:
+        return self.iter_inorder(reverse=True)
+
+    def iter_inorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Iterates over a snapshot of the values in inorder, see BinaryTree.iter_inorder
+        """
+        with self._lock.read():
+            return iter(list(self.tree.iter_inorder(reverse)))
+
+    def iter_preorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Iterates over a snapshot of the values in preorder, see BinaryTree.iter_preorder
+        """
+        with self._lock.read():
+            return iter(list(self.tree.iter_preorder(reverse)))
+
+    def iter_postorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Iterates over a snapshot of the values in postorder, see BinaryTree.iter_postorder
+        """
+        with self._lock.read():
+            return iter(list(self.tree.iter_postorder(reverse)))
+
+    def iter_breadthfirst(self) -> Iterator[_T]:
+        """
+        Iterates over a snapshot of the values in breadth first order, see BinaryTree.iter_breadthfirst
+        """
+        with self._lock.read():
+            return iter(list(self.tree.iter_breadthfirst()))
+
+    def traverse_inorder(
+        self,
+        callback: Callable[[_Node[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first inorder algorithm under the read lock,
+        the callback must not modify the tree
+        """
+        with self._lock.read():
+            self.tree.traverse_inorder(callback, reverse)
+
+    def traverse_preorder(
+        self,
+        callback: Callable[[_Node[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first preorder algorithm under the read lock,
+        the callback must not modify the tree
+        """
+        with self._lock.read():
+            self.tree.traverse_preorder(callback, reverse)
+
+    def traverse_postorder(
+        self,
+        callback: Callable[[_Node[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first postorder algorithm under the read lock,
+        the callback must not modify the tree
+        """
+        with self._lock.read():
+            self.tree.traverse_postorder(callback, reverse)
+
+    def traverse_breadthfirst(self, callback: Callable[[_Node[_T]], Any]) -> None:
+        """
+        Traverse the tree using breadth first algorithm under the read lock,
+        the callback must not modify the tree
+        """
+        with self._lock.read():
+            self.tree.traverse_breadthfirst(callback)
+
+
+class _PersistentNode(Generic[_T]):
+    """
+    Represents an immutable node of a persistent tree, the nodes are
+    shared between the tree versions, so they can't link to their parents
+    """
+    __slots__ = ("value", "key", "left_child", "right_child", "height")
+
+    def __init__(
+        self,
+        value: _T,
+        key: Any,
+        left_child: _PersistentNode[_T] | None = None,
+        right_child: _PersistentNode[_T] | None = None
+    ) -> None:
+        """
+        Constructor for persistent tree node
+
+        IN:
+            value - node value
+            key - the sort key of the value
+            left_child - the left child node for this node
+                (Default: None)
+            right_child - the right child node for this node
+                (Default: None)
+        """
+        self.value = value
+        self.key = key
+        self.left_child = left_child
+        self.right_child = right_child
+        self.height: int = 1 + max(
+            left_child.height if left_child is not None else 0,
+            right_child.height if right_child is not None else 0
+        )
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}(value={self.value}, height={self.height})>"
+
+
+class PersistentBinaryTree(Generic[_T]):
+    """
+    Represents a persistent (immutable) AVL tree: add and delete return a new version
+    of the tree that shares all untouched nodes with the old one (O(log n) new nodes
+    per change), so any version can be read from any number of threads without locking
+    while new versions are being made
+    """
+    ORDERINGS = BinaryTree.ORDERINGS
+
+    def __init__(
+        self,
+        allow_dupes: bool = True,
+        key: Callable[[_T], Any] | None = None,
+        ordering: _Ordering = "hash"
+    ) -> None:
+        """
+        Constructor for an empty persistent tree
+
+        IN:
+            allow_dupes - whether or not the tree accepts duplicate values
+                (Default: True)
+            key - a function that returns the sort key for a value
+                (Default: None)
+            ordering - how to order values if there's no key function
+                (Default: "hash")
+        """
+        if ordering not in self.ORDERINGS:
+            raise ValueError(
+                f"unknown ordering {ordering!r}, expected one of {self.ORDERINGS}"
+            )
+
+        self.allow_dupes = allow_dupes
+        self.key_func = key
+        self.ordering = ordering
+        self._get_key = BinaryTree._select_key_func(key, ordering)# pylint: disable=protected-access
+        self._root: _PersistentNode[_T] | None = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _new_version(self, root: _PersistentNode[_T] | None, size: int) -> PersistentBinaryTree[_T]:
+        """
+        Creates a new version of this tree with the given nodes
+
+        IN:
+            root - the root of the new version
+            size - the number of nodes in the new version
+
+        OUT:
+            new tree
+        """
+        tree = type(self).__new__(type(self))
+        tree.__dict__.update(self.__dict__)
+        tree._root = root
+        tree._size = size
+        return tree
+
+    @classmethod
+    def from_iterable(
+        cls,
+        values: Iterable[_T],
+        presorted: bool = False,
+        **kwargs: Any
+    ) -> PersistentBinaryTree[_T]:
+        """
+        Builds a perfectly balanced tree from the given values in O(n)
+        (plus O(n log n) to sort the values if they are not sorted yet)
+
+        IN:
+            values - the values for the tree
+            presorted - whether or not the values are already sorted by key
+                (Default: False)
+            kwargs - the rest of the arguments are passed to the constructor
+
+        OUT:
+            new tree
+        """
+        tree = cls(**kwargs)
+        get_key = tree._get_key
+
+        if not presorted:
+            values = sorted(values, key=get_key)
+
+        if not tree.allow_dupes:
+            values = chain.from_iterable(
+                _unique_values(group)
+                for _, group in groupby(values, key=get_key)
+            )
+
+        values = list(values)
+        keys = list(map(get_key, values))
+        # The subtrees are built bottom up, each item is (start, end, whether or not
+        # the children are built), the built subtrees wait on the results stack
+        stack: list[tuple[int, int, bool]] = [(0, len(values), False)]
+        results: list[_PersistentNode[_T] | None] = []
+
+        while stack:
+            start, end, is_ready = stack.pop()
+            if start >= end:
+                results.append(None)
+                continue
+
+            middle = (start + end) // 2
+            if not is_ready:
+                stack.append((start, end, True))
+                stack.append((middle + 1, end, False))
+                stack.append((start, middle, False))
+                continue
+
+            right_child = results.pop()
+            left_child = results.pop()
+            results.append(_PersistentNode(values[middle], keys[middle], left_child, right_child))
+
+        tree._root = results.pop()
+        tree._size = len(values)
+        return tree
+
+    @staticmethod
+    def _get_height(node: _PersistentNode[_T] | None) -> int:
+        return node.height if node is not None else 0
+
+    @staticmethod
+    def _rotate_left(node: _PersistentNode[_T]) -> _PersistentNode[_T]:
+        pivot = node.right_child
+        if TYPE_CHECKING:
+            pivot = cast_type(_PersistentNode[_T], pivot)
+        return _PersistentNode(
+            pivot.value,
+            pivot.key,
+            _PersistentNode(node.value, node.key, node.left_child, pivot.left_child),
+            pivot.right_child
+        )
+
+    @staticmethod
+    def _rotate_right(node: _PersistentNode[_T]) -> _PersistentNode[_T]:
+        pivot = node.left_child
+        if TYPE_CHECKING:
+            pivot = cast_type(_PersistentNode[_T], pivot)
+        return _PersistentNode(
+            pivot.value,
+            pivot.key,
+            pivot.left_child,
+            _PersistentNode(node.value, node.key, pivot.right_child, node.right_child)
+        )
+
+    @classmethod
+    def _rebalance(cls, node: _PersistentNode[_T]) -> _PersistentNode[_T]:
+        """
+        Restores the AVL balance of a new node which subtrees differ in height by 2 at most
+
+        IN:
+            node - the node to balance
+
+        OUT:
+            the node that should take its place
+        """
+        get_height = cls._get_height
+        left_child = node.left_child
+        right_child = node.right_child
+        balance = get_height(left_child) - get_height(right_child)
+
+        if balance > 1:
+            if TYPE_CHECKING:
+                left_child = cast_type(_PersistentNode[_T], left_child)
+            if get_height(left_child.left_child) < get_height(left_child.right_child):
+                node = _PersistentNode(node.value, node.key, cls._rotate_left(left_child), right_child)
+            return cls._rotate_right(node)
+
+        if balance < -1:
+            if TYPE_CHECKING:
+                right_child = cast_type(_PersistentNode[_T], right_child)
+            if get_height(right_child.right_child) < get_height(right_child.left_child):
+                node = _PersistentNode(node.value, node.key, left_child, cls._rotate_right(right_child))
+            return cls._rotate_left(node)
+
+        return node
+
+    @classmethod
+    def _rebuild(
+        cls,
+        path: list[tuple[_PersistentNode[_T], bool]],
+        child: _PersistentNode[_T] | None
+    ) -> _PersistentNode[_T] | None:
+        """
+        Copies the nodes on the given path bottom up, replacing the changed child
+
+        IN:
+            path - the (node, whether or not we went left) pairs from the root down
+            child - the new subtree at the end of the path
+
+        OUT:
+            the new root
+        """
+        rebalance = cls._rebalance
+
+        for node, is_left in reversed(path):
+            if is_left:
+                node = _PersistentNode(node.value, node.key, child, node.right_child)
+            else:
+                node = _PersistentNode(node.value, node.key, node.left_child, child)
+            child = rebalance(node)
+
+        return child
+
+    @staticmethod
+    def _find_path(
+        root: _PersistentNode[_T] | None,
+        value: _T,
+        key: Any
+    ) -> tuple[list[tuple[_PersistentNode[_T], bool]], _PersistentNode[_T]] | None:
+        """
+        Finds the node with the given value and the path to it,
+        nodes with equal keys can be on either side, so both are searched
+
+        IN:
+            root - the root to search under
+            value - the value to find
+            key - the key of the value
+
+        OUT:
+            tuple of the path and the node or None if there's no such node
+        """
+        stack: list[tuple[_PersistentNode[_T] | None, list[tuple[_PersistentNode[_T], bool]]]] = [(root, [])]
+
+        while stack:
+            node, path = stack.pop()
+
+            while node is not None:
+                if key < node.key:
+                    path.append((node, True))
+                    node = node.left_child
+
+                elif key > node.key:
+                    path.append((node, False))
+                    node = node.right_child
+
+                elif node.value == value:
+                    return path, node
+
+                else:
+                    if node.left_child is not None:
+                        stack.append((node.left_child, path + [(node, True)]))
+                    path.append((node, False))
+                    node = node.right_child
+
+        return None
+
+    def has_value(self, value: _T) -> bool:
+        """
+        Checks if a node with the given value exists
+
+        IN:
+            value - the value to check
+
+        OUT:
+            bool
+        """
+        return self._find_path(self._root, value, self._get_key(value)) is not None
+
+    def __contains__(self, value: Any) -> bool:
+        return self.has_value(value)
+
+    def _insert(self, root: _PersistentNode[_T] | None, value: _T) -> _PersistentNode[_T] | None:
+        """
+        Inserts the value under the given root
+
+        IN:
+            root - the root to insert under
+            value - the value to insert
+
+        OUT:
+            the new root or None if the value is a dupe and dupes aren't allowed
+        """
+        key = self._get_key(value)
+        path: list[tuple[_PersistentNode[_T], bool]] = []
+        node = root
+
+        if not self.allow_dupes and self._find_path(root, value, key) is not None:
+            return None
+
+        # Equal keys go right
+        while node is not None:
+            is_left = key < node.key
+            path.append((node, is_left))
+            node = node.left_child if is_left else node.right_child
+
+        return self._rebuild(path, _PersistentNode(value, key))
+
+    def _remove(self, root: _PersistentNode[_T] | None, value: _T) -> _PersistentNode[_T] | None | Any:
+        """
+        Removes the value from under the given root
+
+        IN:
+            root - the root to remove from
+            value - the value to remove
+
+        OUT:
+            the new root or _MISSING if there's no such value
+        """
+        found = self._find_path(root, value, self._get_key(value))
+        if found is None:
+            return _MISSING
+
+        path, node = found
+        if node.left_child is None or node.right_child is None:
+            replacement = node.left_child if node.left_child is not None else node.right_child
+
+        else:
+            # Take the successor's place and remove the successor instead
+            index = len(path)
+            path.append((node, False))
+            successor = node.right_child
+            while successor.left_child is not None:
+                path.append((successor, True))
+                successor = successor.left_child
+
+            path[index] = (
+                _PersistentNode(successor.value, successor.key, node.left_child, node.right_child),
+                False
+            )
+            replacement = successor.right_child
+
+        return self._rebuild(path, replacement)
+
+    def add(self, value: _T) -> PersistentBinaryTree[_T]:
+        """
+        Returns a new version of this tree with the given value added
+
+        IN:
+            value - the value to add
+
+        OUT:
+            new tree (or this tree if the value is a dupe and dupes aren't allowed)
+        """
+        root = self._insert(self._root, value)
+        if root is None:
+            return self
+        return self._new_version(root, self._size + 1)
+
+    def delete(self, value: _T) -> PersistentBinaryTree[_T]:
+        """
+        Returns a new version of this tree with the given value deleted
+
+        IN:
+            value - the value to delete
+
+        OUT:
+            new tree (or this tree if there's no such value)
+        """
+        root = self._remove(self._root, value)
+        if root is _MISSING:
+            return self
+        return self._new_version(root, self._size - 1)
+
+    def add_many(self, values: Iterable[_T]) -> PersistentBinaryTree[_T]:
+        """
+        Returns a new version of this tree with the given values added,
+        the intermediate versions are never created
+
+        IN:
+            values - the values to add
+
+        OUT:
+            new tree
+        """
+        root = self._root
+        size = self._size
+
+        for value in values:
+            new_root = self._insert(root, value)
+            if new_root is not None:
+                root = new_root
+                size += 1
+
+        return self._new_version(root, size)
+
+    def delete_many(self, values: Iterable[_T]) -> PersistentBinaryTree[_T]:
+        """
+        Returns a new version of this tree with the given values deleted,
+        the intermediate versions are never created
+
+        IN:
+            values - the values to delete
+
+        OUT:
+            new tree
+        """
+        root = self._root
+        size = self._size
+
+        for value in values:
+            new_root = self._remove(root, value)
+            if new_root is not _MISSING:
+                root = new_root
+                size -= 1
+
+        return self._new_version(root, size)
+
+    def range(
+        self,
+        start: _T | None = None,
+        end: _T | None = None,
+        inclusive: tuple[bool, bool] = (True, True),
+        reverse: bool = False
+    ) -> Iterator[_T]:
+        """
+        Lazily iterates over the values which keys are between the keys
+        of the given values in O(log n + k)
+
+        IN:
+            start - the lower bound, if None, iterates from the first value
+                (Default: None)
+            end - the upper bound, if None, iterates to the last value
+                (Default: None)
+            inclusive - whether or not the lower and the upper bounds are included
+                (Default: (True, True))
+            reverse - whether or not to iterate from the upper bound down
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        get_key = self._get_key
+        start_key = get_key(start) if start is not None else None
+        end_key = get_key(end) if end is not None else None
+        include_start, include_end = inclusive
+
+        def is_after_start(node_key: Any) -> bool:
+            if start_key is None:
+                return True
+            return start_key < node_key or (include_start and not node_key < start_key)
+
+        def is_before_end(node_key: Any) -> bool:
+            if end_key is None:
+                return True
+            return node_key < end_key or (include_end and not end_key < node_key)
+
+        if reverse:
+            is_after_start, is_before_end = is_before_end, is_after_start
+
+        stack: list[_PersistentNode[_T]] = []
+        node = self._root
+        while True:
+            # Descend, skipping the nodes (and their first subtrees) before the lower bound
+            while node is not None:
+                if is_after_start(node.key):
+                    stack.append(node)
+                    node = node.left_child if not reverse else node.right_child
+                else:
+                    node = node.right_child if not reverse else node.left_child
+
+            if not stack:
+                return
+
+            node = stack.pop()
+            if not is_before_end(node.key):
+                return
+
+            yield node.value
+            node = node.right_child if not reverse else node.left_child
+
+    def __iter__(self) -> Iterator[_T]:
+        return self.iter_inorder()
+
+    def __reversed__(self) -> Iterator[_T]:
+        return self.iter_inorder(reverse=True)
+
+    # The nodes only link to their children, so the BinaryTree generators work as is
+    # pylint: disable=protected-access
+    def iter_inorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this version using deepth first inorder algorithm,
+        the version never changes, so it's safe to make new versions while iterating
+
+        IN:
+            reverse - whether or not to iterate in reverse order
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return map(_get_node_value, BinaryTree._iter_inorder(self._root, reverse))# type: ignore[arg-type]
+
+    def iter_preorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this version using deepth first preorder algorithm
+
+        IN:
+            reverse - whether or not to visit the right subtrees first
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return map(_get_node_value, BinaryTree._iter_preorder(self._root, reverse))# type: ignore[arg-type]
+
+    def iter_postorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this version using deepth first postorder algorithm
+
+        IN:
+            reverse - whether or not to visit the right subtrees first
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return map(_get_node_value, BinaryTree._iter_postorder(self._root, reverse))# type: ignore[arg-type]
+
+    def iter_breadthfirst(self) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this version using breadth first algorithm
+
+        OUT:
+            iterator over the values
+        """
+        return map(_get_node_value, BinaryTree._iter_breadthfirst(self._root))# type: ignore[arg-type]
+
+    def traverse_inorder(
+        self,
+        callback: Callable[[_PersistentNode[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse this version using deepth first inorder algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        node: _PersistentNode[_T]
+        for node in BinaryTree._iter_inorder(self._root, reverse):# type: ignore[arg-type, assignment]
+            callback(node)
+
+    def traverse_preorder(
+        self,
+        callback: Callable[[_PersistentNode[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse this version using deepth first preorder algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        node: _PersistentNode[_T]
+        for node in BinaryTree._iter_preorder(self._root, reverse):# type: ignore[arg-type, assignment]
+            callback(node)
+
+    def traverse_postorder(
+        self,
+        callback: Callable[[_PersistentNode[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse this version using deepth first postorder algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        node: _PersistentNode[_T]
+        for node in BinaryTree._iter_postorder(self._root, reverse):# type: ignore[arg-type, assignment]
+            callback(node)
+
+    def traverse_breadthfirst(
+        self,
+        callback: Callable[[_PersistentNode[_T]], Any]
+    ) -> None:
+        """
+        Traverse this version using breadth first algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        node: _PersistentNode[_T]
+        for node in BinaryTree._iter_breadthfirst(self._root):# type: ignore[arg-type, assignment]
+            callback(node)
+    # pylint: enable=protected-access
+
+
+class _ArrayNodeView:
+    """
+    A node-like view of an ArrayBinaryTree node,
+    passed to the traversal callbacks instead of _Node
+    """
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree: ArrayBinaryTree, index: int) -> None:
+        """
+        Constructor for array node view
+
+        IN:
+            tree - the tree the node belongs to
+            index - the index of the node in the tree arrays
+        """
+        self.tree = tree
+        self.index = index
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}(value={self.value}, index={self.index})>"
+
+    def _get_view(self, index: int) -> _ArrayNodeView | None:
+        return _ArrayNodeView(self.tree, index) if index else None
+
+    @property
+    def value(self) -> int:
+        """
+        The node value
+        """
+        return self.tree._keys[self.index]# pylint: disable=protected-access
+
+    key = value
+
+    @property
+    def parent(self) -> _ArrayNodeView | None:
+        """
+        The parent node
+        """
+        return self._get_view(self.tree._parents[self.index])# pylint: disable=protected-access
+
+    @property
+    def left_child(self) -> _ArrayNodeView | None:
+        """
+        The left child node
+        """
+        return self._get_view(self.tree._lefts[self.index])# pylint: disable=protected-access
+
+    @property
+    def right_child(self) -> _ArrayNodeView | None:
+        """
+        The right child node
+        """
+        return self._get_view(self.tree._rights[self.index])# pylint: disable=protected-access
+
+
+class ArrayBinaryTree(_VectorizedQueriesMixin, _AsyncMixin):
+    """
+    Represents a binary tree of integers stored in flat arrays
+    (struct-of-arrays): keys, child and parent indices are kept in
+    typed arrays instead of node objects, which takes several times
+    less memory and keeps the nodes close to each other
+
+    Values must be integers that fit into a signed 64-bit int,
+    they are ordered by value (which matches the hash ordering
+    of BinaryTree for ints except -1)
+
+    Index 0 is the nil node, deleted slots are reused through a free list
+
+    NOTE: supports the core BinaryTree API: add, delete, has_value, the batch methods,
+        the traversals, range and the order queries (floor, ceiling, predecessor,
+        successor, rank, select), rank and select are O(n) as there are no subtree sizes;
+        keys, orderings, order statistics, set operations, split/join and dumps aren't supported
+    """
+    BALANCE_MODES = (None, "rb")
+
+    def __init__(self, allow_dupes: bool = True, balance: _BalanceMode = None) -> None:
+        """
+        Constructor for array binary tree
+
+        IN:
+            allow_dupes - whether or not the tree accepts duplicate values
+                (Default: True)
+            balance - the balancing strategy for this tree:
+                None - plain unbalanced tree
+                "rb" - red-black tree, guarantees O(log n) height
+                (Default: None)
+        """
+        if balance not in self.BALANCE_MODES:
+            raise ValueError(
+                f"unknown balance mode {balance!r}, expected one of {self.BALANCE_MODES}"
+            )
+
+        self.allow_dupes = allow_dupes
+        self.balance = balance
+
+        self._keys: array[int]
+        self._lefts: array[int]
+        self._rights: array[int]
+        self._parents: array[int]
+        self._colors: bytearray
+        self._root = 0
+        self._size = 0
+        self._free = 0
+        self.clear()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def clear(self) -> None:
+        """
+        Removes all values from this tree
+        """
+        # The nil node is black and has no children
+        self._keys = array("q", (0,))
+        self._lefts = array("I", (0,))
+        self._rights = array("I", (0,))
+        self._parents = array("I", (0,))
+        self._colors = bytearray(1)
+        self._root = 0
+        self._size = 0
+        self._free = 0
+        self._key_array = None
+
+    def __copy__(self) -> ArrayBinaryTree:
+        # The default copy would share the arrays
+        tree = type(self).__new__(type(self))
+        tree.__dict__.update(self.__dict__)
+        tree._keys = array("q", self._keys)# pylint: disable=protected-access
+        tree._lefts = array("I", self._lefts)# pylint: disable=protected-access
+        tree._rights = array("I", self._rights)# pylint: disable=protected-access
+        tree._parents = array("I", self._parents)# pylint: disable=protected-access
+        tree._colors = bytearray(self._colors)# pylint: disable=protected-access
+        return tree
+
+    def _iter_snapshot_keys(self) -> Iterator[int]:
+        return self.iter_inorder()
+
+    @classmethod
+    def from_iterable(
+        cls,
+        values: Iterable[int],
+        presorted: bool = False,
+        **kwargs: Any
+    ) -> ArrayBinaryTree:
+        """
+        Builds a perfectly balanced tree from the given values in O(n)
+        (plus O(n log n) to sort the values if they are not sorted yet)
+
+        IN:
+            values - the values for the tree
+            presorted - whether or not the values are already sorted, skips sorting
+                (Default: False)
+            kwargs - the rest of the arguments are passed to the constructor
+
+        OUT:
+            new tree
+        """
+        tree = cls(**kwargs)
+
+        if not presorted:
+            values = sorted(values)
+
+        if not tree.allow_dupes:
+            values = (value for value, _ in groupby(values))
+
+        # The node at the index i + 1 holds the i-th value
+        keys = tree._keys# pylint: disable=protected-access
+        keys.extend(values)
+        num_nodes = len(keys) - 1
+        lefts = tree._lefts = array("I", bytes(4 * len(keys)))# pylint: disable=protected-access
+        rights = tree._rights = array("I", bytes(4 * len(keys)))# pylint: disable=protected-access
+        parents = tree._parents = array("I", bytes(4 * len(keys)))# pylint: disable=protected-access
+        colors = tree._colors = bytearray(len(keys))# pylint: disable=protected-access
+        tree._size = num_nodes# pylint: disable=protected-access
+
+        if not num_nodes:
+            return tree
+
+        is_rb = tree.balance == "rb"
+        red_depth = num_nodes.bit_length() - 1 if (num_nodes + 1) & num_nodes else -1
+
+        # Each item is (start, end, parent index, is right child, depth)
+        stack = [(1, num_nodes + 1, 0, False, 0)]
+
+        while stack:
+            start, end, parent, is_right_child, depth = stack.pop()
+            middle = (start + end) // 2
+            parents[middle] = parent
+            if is_rb and depth == red_depth:
+                colors[middle] = _ARRAY_RED
+
+            if not parent:
+                tree._root = middle# pylint: disable=protected-access
+            elif is_right_child:
+                rights[parent] = middle
+            else:
+                lefts[parent] = middle
+
+            if start < middle:
+                stack.append((start, middle, middle, False, depth + 1))
+            if middle + 1 < end:
+                stack.append((middle + 1, end, middle, True, depth + 1))
+
+        return tree
+
+    def _new_node(self, value: int, parent: int) -> int:
+        """
+        Allocates a new node, reusing a free slot if possible
+
+        IN:
+            value - the value of the node
+            parent - the index of the parent node
+
+        OUT:
+            the index of the new node
+        """
+        index = self._free
+
+        if index:
+            self._keys[index] = value
+            self._free = self._lefts[index]
+            self._lefts[index] = 0
+            self._rights[index] = 0
+            self._parents[index] = parent
+            self._colors[index] = _ARRAY_RED
+
+        else:
+            index = len(self._keys)
+            self._keys.append(value)
+            self._lefts.append(0)
+            self._rights.append(0)
+            self._parents.append(parent)
+            self._colors.append(_ARRAY_RED)
+
+        return index
+
+    def _free_node(self, index: int) -> None:
+        """
+        Puts the node slot on the free list
+
+        IN:
+            index - the index of the node
+        """
+        self._lefts[index] = self._free
+        self._rights[index] = 0
+        self._parents[index] = 0
+        self._free = index
+
+    def add(self, value: int) -> bool:
+        """
+        Adds a new node with the given value to this tree
+
+        IN:
+            value - the value for the new node
+
+        OUT:
+            bool - whether or not the new node was added
+        """
+        keys = self._keys
+        lefts = self._lefts
+        rights = self._rights
+        allow_dupes = self.allow_dupes
+
+        parent = 0
+        node = self._root
+        while node:
+            parent = node
+            key = keys[node]
+
+            if value < key:
+                node = lefts[node]
+            elif (value > key) or allow_dupes:
+                node = rights[node]
+            else:
+                # The node is a dupe and we don't like dupes here
+                return False
+
+        node = self._new_node(value, parent)
+
+        if not parent:
+            self._root = node
+        elif value < keys[parent]:
+            lefts[parent] = node
+        else:
+            rights[parent] = node
+
+        self._size += 1
+        self._key_array = None
+
+        if self.balance == "rb":
+            self._fix_after_insert_rb(node)
+        else:
+            self._colors[node] = _ARRAY_BLACK
+
+        return True
+
+    def _find(self, value: int) -> int:
+        """
+        Finds the node with the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the index of the node or 0 if not found
+        """
+        keys = self._keys
+        lefts = self._lefts
+        rights = self._rights
+
+        node = self._root
+        while node:
+            key = keys[node]
+
+            if value < key:
+                node = lefts[node]
+            elif value > key:
+                node = rights[node]
+            else:
+                return node
+
+        return 0
+
+    def has_value(self, value: int) -> bool:
+        """
+        Checks if a node with the given value exists
+
+        IN:
+            value - the value to check
+
+        OUT:
+            bool
+        """
+        return self._find(value) != 0
+
+    def __contains__(self, value: Any) -> bool:
+        return isinstance(value, int) and self._find(value) != 0
+
+    def delete(self, value: int) -> bool:
+        """
+        Deletes a node from the tree
+
+        IN:
+            value - the node's value
+
+        OUT:
+            bool - whether or not the node was deleted
+        """
+        node = self._find(value)
+
+        if not node:
+            return False
+
+        self._delete_node(node)
+        return True
+
+    def add_many(self, values: Iterable[int]) -> list[bool]:
+        """
+        Adds new nodes with the given values to this tree
+
+        IN:
+            values - the values for the new nodes
+
+        OUT:
+            list of bools - whether or not each value was added
+        """
+        return list(map(self.add, values))
+
+    def delete_many(self, values: Iterable[int]) -> list[bool]:
+        """
+        Deletes nodes with the given values from this tree
+
+        IN:
+            values - the values to delete
+
+        OUT:
+            list of bools - whether or not each value was deleted
+        """
+        return list(map(self.delete, values))
+
+    def contains_many(self, values: Iterable[int]) -> list[bool]:
+        """
+        Checks if nodes with the given values exist
+
+        NOTE: if NumPy is available and the values are a numpy.ndarray,
+            the check is vectorized over the sorted key snapshot
+            and returns numpy.ndarray of bools
+
+        IN:
+            values - the values to check
+
+        OUT:
+            list of bools - whether or not each value exists
+        """
+        if np is not None and isinstance(values, np.ndarray):
+            return self._contains_many_vectorized(values)
+
+        return list(map(self.has_value, values))
+
+    def _find_lower_bound(self, value: int, inclusive: bool = True) -> int:
+        """
+        Finds the first node (in order) which value is greater than
+        (or equal to if inclusive) the given value
+
+        IN:
+            value - the value
+            inclusive - whether or not a node with an equal value counts
+                (Default: True)
+
+        OUT:
+            the index of the node or 0 if not found
+        """
+        keys = self._keys
+        lefts = self._lefts
+        rights = self._rights
+
+        node = self._root
+        bound = 0
+
+        while node:
+            key = keys[node]
+
+            if value < key or (inclusive and value == key):
+                bound = node
+                node = lefts[node]
+            else:
+                node = rights[node]
+
+        return bound
+
+    def _find_upper_bound(self, value: int, inclusive: bool = True) -> int:
+        """
+        Finds the last node (in order) which value is less than
+        (or equal to if inclusive) the given value
+
+        IN:
+            value - the value
+            inclusive - whether or not a node with an equal value counts
+                (Default: True)
+
+        OUT:
+            the index of the node or 0 if not found
+        """
+        keys = self._keys
+        lefts = self._lefts
+        rights = self._rights
+
+        node = self._root
+        bound = 0
+
+        while node:
+            key = keys[node]
+
+            if value > key or (inclusive and value == key):
+                bound = node
+                node = rights[node]
+            else:
+                node = lefts[node]
+
+        return bound
+
+    def _get_next_node(self, node: int, reverse: bool = False) -> int:
+        """
+        Returns the next node in order
+
+        IN:
+            node - the index of the node
+            reverse - whether or not to return the previous node instead
+                (Default: False)
+
+        OUT:
+            the index of the node or 0 if it's the last one
+        """
+        first_children = self._lefts if not reverse else self._rights
+        second_children = self._rights if not reverse else self._lefts
+        parents = self._parents
+
+        child = second_children[node]
+        if child:
+            # The extreme node of the second subtree
+            while first_children[child]:
+                child = first_children[child]
+            return child
+
+        # Otherwise the first ancestor we reach from its first subtree
+        parent = parents[node]
+        while parent and node == second_children[parent]:
+            node = parent
+            parent = parents[node]
+
+        return parent
+
+    def range(
+        self,
+        start: int | None = None,
+        end: int | None = None,
+        inclusive: tuple[bool, bool] = (True, True),
+        reverse: bool = False
+    ) -> Iterator[int]:
+        """
+        Lazily iterates over the values between the given values in O(log n + k),
+        only the nodes within the bounds are visited
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            start - the lower bound, if None, iterates from the first value
+                (Default: None)
+            end - the upper bound, if None, iterates to the last value
+                (Default: None)
+            inclusive - whether or not the lower and the upper bounds are included
+                (Default: (True, True))
+            reverse - whether or not to iterate from the upper bound down
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        keys = self._keys
+        include_start, include_end = inclusive
+
+        if not reverse:
+            first, last, include_last = start, end, include_end
+            node = self._find_lower_bound(start, include_start) if start is not None else 0
+        else:
+            first, last, include_last = end, start, include_start
+            node = self._find_upper_bound(end, include_end) if end is not None else 0
+
+        if first is None and self._root:
+            # Start from the extreme node
+            children = self._lefts if not reverse else self._rights
+            node = self._root
+            while children[node]:
+                node = children[node]
+
+        get_next_node = self._get_next_node
+        while node:
+            key = keys[node]
+
+            # Past the other bound?
+            if last is not None and (
+                (key > last if not reverse else key < last)
+                or (not include_last and key == last)
+            ):
+                return
+
+            yield key
+            node = get_next_node(node, reverse)
+
+    def floor(self, value: int) -> int | None:
+        """
+        Returns the greatest value which is less than or equal to the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        node = self._find_upper_bound(value)
+        return self._keys[node] if node else None
+
+    def ceiling(self, value: int) -> int | None:
+        """
+        Returns the smallest value which is greater than or equal to the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        node = self._find_lower_bound(value)
+        return self._keys[node] if node else None
+
+    def predecessor(self, value: int) -> int | None:
+        """
+        Returns the greatest value which is less than the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        node = self._find_upper_bound(value, inclusive=False)
+        return self._keys[node] if node else None
+
+    def successor(self, value: int) -> int | None:
+        """
+        Returns the smallest value which is greater than the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        node = self._find_lower_bound(value, inclusive=False)
+        return self._keys[node] if node else None
+
+    def rank(self, value: int) -> int:
+        """
+        Returns the number of values in this tree that are less than the given value,
+        O(n) as the nodes don't keep subtree sizes
+
+        IN:
+            value - the value to rank
+
+        OUT:
+            int
+        """
+        keys = self._keys
+        rank = 0
+
+        for node in self._iter_inorder():
+            if keys[node] >= value:
+                break
+            rank += 1
+
+        return rank
+
+    def select(self, index: int) -> int:
+        """
+        Returns the value with the given index in sorted order (k-th smallest value),
+        O(n) as the nodes don't keep subtree sizes
+
+        IN:
+            index - the index of the value, supports negative indices
+
+        OUT:
+            the value
+
+        RAISES:
+            IndexError - if the index is out of range
+        """
+        if index < 0:
+            index += self._size
+
+        if not 0 <= index < self._size:
+            raise IndexError("tree index out of range")
+
+        return next(islice(self, index, None))
+
+    def _transplant(self, old_node: int, new_node: int) -> None:
+        """
+        Puts a node (which can be nil) in place of another node
+
+        IN:
+            old_node - the index of the node to replace
+            new_node - the index of the node to put in its place
+        """
+        parents = self._parents
+        parent = parents[old_node]
+
+        if not parent:
+            self._root = new_node
+        elif old_node == self._lefts[parent]:
+            self._lefts[parent] = new_node
+        else:
+            self._rights[parent] = new_node
+
+        # NOTE: this also sets the parent of the nil node, the delete fixup relies on it
+        parents[new_node] = parent
+
+    def _delete_node(self, node: int) -> None:
+        """
+        Unlinks the node from the tree and frees its slot
+
+        IN:
+            node - the index of the node to delete
+        """
+        lefts = self._lefts
+        rights = self._rights
+        parents = self._parents
+        colors = self._colors
+
+        removed_color = colors[node]
+
+        if not lefts[node]:
+            child = rights[node]
+            self._transplant(node, child)
+
+        elif not rights[node]:
+            child = lefts[node]
+            self._transplant(node, child)
+
+        else:
+            # Move the min node from the right subtree in place of the node
+            successor = rights[node]
+            while lefts[successor]:
+                successor = lefts[successor]
+
+            removed_color = colors[successor]
+            child = rights[successor]
+
+            if parents[successor] == node:
+                parents[child] = successor
+            else:
+                self._transplant(successor, child)
+                rights[successor] = rights[node]
+                parents[rights[successor]] = successor
+
+            self._transplant(node, successor)
+            lefts[successor] = lefts[node]
+            parents[lefts[successor]] = successor
+            colors[successor] = colors[node]
+
+        self._free_node(node)
+        self._size -= 1
+        self._key_array = None
+
+        if self.balance == "rb" and removed_color == _ARRAY_BLACK:
+            self._fix_after_delete_rb(child)
+
+        parents[0] = 0
+
+    def _rotate_left(self, node: int) -> None:
+        """
+        Rotates the subtree with the given root to the left
+
+        IN:
+            node - the index of the root of the subtree
+        """
+        lefts = self._lefts
+        rights = self._rights
+        parents = self._parents
+
+        pivot = rights[node]
+        rights[node] = lefts[pivot]
+        if lefts[pivot]:
+            parents[lefts[pivot]] = node
+
+        self._transplant(node, pivot)
+        lefts[pivot] = node
+        parents[node] = pivot
+
+    def _rotate_right(self, node: int) -> None:
+        """
+        Rotates the subtree with the given root to the right
+
+        IN:
+            node - the index of the root of the subtree
+        """
+        lefts = self._lefts
+        rights = self._rights
+        parents = self._parents
+
+        pivot = lefts[node]
+        lefts[node] = rights[pivot]
+        if rights[pivot]:
+            parents[rights[pivot]] = node
+
+        self._transplant(node, pivot)
+        rights[pivot] = node
+        parents[node] = pivot
+
+    def _fix_after_insert_rb(self, node: int) -> None:
+        """
+        Restores the red-black properties after inserting a node
+
+        IN:
+            node - the index of the inserted node
+        """
+        lefts = self._lefts
+        rights = self._rights
+        parents = self._parents
+        colors = self._colors
+
+        while colors[parents[node]] == _ARRAY_RED:
+            parent = parents[node]
+            grandparent = parents[parent]
+
+            if parent == lefts[grandparent]:
+                uncle = rights[grandparent]
+                if colors[uncle] == _ARRAY_RED:
+                    colors[parent] = colors[uncle] = _ARRAY_BLACK
+                    colors[grandparent] = _ARRAY_RED
+                    node = grandparent
+                    continue
+
+                if node == rights[parent]:
+                    node = parent
+                    self._rotate_left(node)
+                    parent = parents[node]
+
+                colors[parent] = _ARRAY_BLACK
+                colors[grandparent] = _ARRAY_RED
+                self._rotate_right(grandparent)
+
+            else:
+                uncle = lefts[grandparent]
+                if colors[uncle] == _ARRAY_RED:
+                    colors[parent] = colors[uncle] = _ARRAY_BLACK
+                    colors[grandparent] = _ARRAY_RED
+                    node = grandparent
+                    continue
+
+                if node == lefts[parent]:
+                    node = parent
+                    self._rotate_right(node)
+                    parent = parents[node]
+
+                colors[parent] = _ARRAY_BLACK
+                colors[grandparent] = _ARRAY_RED
+                self._rotate_left(grandparent)
+
+        colors[self._root] = _ARRAY_BLACK
+
+    def _fix_after_delete_rb(self, node: int) -> None:
+        """
+        Restores the red-black properties after removing a black node
+
+        IN:
+            node - the index of the node that took the place of the removed one
+                (can be nil, its parent is set by the deletion)
+        """
+        lefts = self._lefts
+        rights = self._rights
+        parents = self._parents
+        colors = self._colors
+
+        while node != self._root and colors[node] == _ARRAY_BLACK:
+            parent = parents[node]
+
+            if node == lefts[parent]:
+                sibling = rights[parent]
+                if colors[sibling] == _ARRAY_RED:
+                    colors[sibling] = _ARRAY_BLACK
+                    colors[parent] = _ARRAY_RED
+                    self._rotate_left(parent)
+                    sibling = rights[parent]
+
+                if colors[lefts[sibling]] == _ARRAY_BLACK and colors[rights[sibling]] == _ARRAY_BLACK:
+                    colors[sibling] = _ARRAY_RED
+                    node = parent
+                    continue
+
+                if colors[rights[sibling]] == _ARRAY_BLACK:
+                    colors[lefts[sibling]] = _ARRAY_BLACK
+                    colors[sibling] = _ARRAY_RED
+                    self._rotate_right(sibling)
+                    sibling = rights[parent]
+
+                colors[sibling] = colors[parent]
+                colors[parent] = _ARRAY_BLACK
+                colors[rights[sibling]] = _ARRAY_BLACK
+                self._rotate_left(parent)
+
+            else:
+                sibling = lefts[parent]
+                if colors[sibling] == _ARRAY_RED:
+                    colors[sibling] = _ARRAY_BLACK
+                    colors[parent] = _ARRAY_RED
+                    self._rotate_right(parent)
+                    sibling = lefts[parent]
+
+                if colors[lefts[sibling]] == _ARRAY_BLACK and colors[rights[sibling]] == _ARRAY_BLACK:
+                    colors[sibling] = _ARRAY_RED
+                    node = parent
+                    continue
+
+                if colors[lefts[sibling]] == _ARRAY_BLACK:
+                    colors[rights[sibling]] = _ARRAY_BLACK
+                    colors[sibling] = _ARRAY_RED
+                    self._rotate_left(sibling)
+                    sibling = lefts[parent]
+
+                colors[sibling] = colors[parent]
+                colors[parent] = _ARRAY_BLACK
+                colors[lefts[sibling]] = _ARRAY_BLACK
+                self._rotate_right(parent)
+
+            node = self._root
+
+        colors[node] = _ARRAY_BLACK
+
+    def __iter__(self) -> Iterator[int]:
+        return self.iter_inorder()
+
+    def __reversed__(self) -> Iterator[int]:
+        return self.iter_inorder(reverse=True)
+
+    def iter_inorder(self, reverse: bool = False) -> Iterator[int]:
+        """
+        Lazily iterates over the values of this tree using deepth first inorder algorithm
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            reverse - whether or not to iterate in reverse order
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return map(self._keys.__getitem__, self._iter_inorder(reverse))
+
+    def iter_preorder(self, reverse: bool = False) -> Iterator[int]:
+        """
+        Lazily iterates over the values of this tree using deepth first preorder algorithm
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            reverse - whether or not to visit the right subtrees first
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return map(self._keys.__getitem__, self._iter_preorder(reverse))
+
+    def iter_postorder(self, reverse: bool = False) -> Iterator[int]:
+        """
+        Lazily iterates over the values of this tree using deepth first postorder algorithm
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            reverse - whether or not to visit the right subtrees first
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return map(self._keys.__getitem__, self._iter_postorder(reverse))
+
+    def iter_breadthfirst(self) -> Iterator[int]:
+        """
+        Lazily iterates over the values of this tree using breadth first algorithm
+        NOTE: the tree must not be modified during iteration
+
+        OUT:
+            iterator over the values
+        """
+        return map(self._keys.__getitem__, self._iter_breadthfirst())
+
+    def traverse_inorder(
+        self,
+        callback: Callable[[_ArrayNodeView], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first inorder algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the view of the node being processed
+        """
+        for node in self._iter_inorder(reverse):
+            callback(_ArrayNodeView(self, node))
+
+    def traverse_preorder(
+        self,
+        callback: Callable[[_ArrayNodeView], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first preorder algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the view of the node being processed
+        """
+        for node in self._iter_preorder(reverse):
+            callback(_ArrayNodeView(self, node))
+
+    def traverse_postorder(
+        self,
+        callback: Callable[[_ArrayNodeView], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first postorder algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the view of the node being processed
+        """
+        for node in self._iter_postorder(reverse):
+            callback(_ArrayNodeView(self, node))
+
+    def traverse_breadthfirst(
+        self,
+        callback: Callable[[_ArrayNodeView], Any]
+    ) -> None:
+        """
+        Traverse the tree using breadth first algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the view of the node being processed
+        """
+        for node in self._iter_breadthfirst():
+            callback(_ArrayNodeView(self, node))
+
+    def _iter_inorder(self, reverse: bool = False) -> Iterator[int]:
+        """
+        Generator over the node indices in inorder
+
+        IN:
+            reverse - whether or not to iterate in reverse order
+                (Default: False)
+
+        OUT:
+            iterator over the indices
+        """
+        first_children = self._lefts if not reverse else self._rights
+        second_children = self._rights if not reverse else self._lefts
+        stack: list[int] = []
+        node = self._root
+
+        while True:
+            # Go as far to the first side as possible
+            while node:
+                stack.append(node)
+                node = first_children[node]
+
+            if not stack:
+                return
+
+            node = stack.pop()
+            yield node
+            node = second_children[node]
+
+    def _iter_preorder(self, reverse: bool = False) -> Iterator[int]:
+        """
+        Generator over the node indices in preorder
+
+        IN:
+            reverse - whether or not to visit the right subtrees first
+                (Default: False)
+
+        OUT:
+            iterator over the indices
+        """
+        if not self._root:
+            return
+
+        # Push the child we want to visit first the last
+        first_children = self._rights if not reverse else self._lefts
+        second_children = self._lefts if not reverse else self._rights
+        stack = [self._root]
+
+        while stack:
+            node = stack.pop()
+            yield node
+
+            for child in (first_children[node], second_children[node]):
+                if child:
+                    stack.append(child)
+
+    def _iter_postorder(self, reverse: bool = False) -> Iterator[int]:
+        """
+        Generator over the node indices in postorder
+
+        IN:
+            reverse - whether or not to visit the right subtrees first
+                (Default: False)
+
+        OUT:
+            iterator over the indices
+        """
+        first_children = self._lefts if not reverse else self._rights
+        second_children = self._rights if not reverse else self._lefts
+        stack: list[int] = []
+        last_visited = 0
+        node = self._root
+
+        while stack or node:
+            # Go as far to the first side as possible
+            while node:
+                stack.append(node)
+                node = first_children[node]
+
+            top = stack[-1]
+            second_child = second_children[top]
+
+            # Visit the second subtree before the node itself
+            if second_child and second_child != last_visited:
+                node = second_child
+
+            else:
+                stack.pop()
+                yield top
+                last_visited = top
+
+    def _iter_breadthfirst(self) -> Iterator[int]:
+        """
+        Generator over the node indices in breadth first order
+
+        OUT:
+            iterator over the indices
+        """
+        if not self._root:
+            return
+
+        lefts = self._lefts
+        rights = self._rights
+        queue: deque[int] = deque()
+        queue.append(self._root)
+
+        while queue:
+            node = queue.pop()
+
+            for child in (lefts[node], rights[node]):
+                if child:
+                    queue.appendleft(child)
+
+            yield node
+
+
+class _BPlusNode(Generic[_T]):
+    """
+    Represents a node of a B+ tree: leaves keep the sorted keys with their values
+    and are linked with each other, internal nodes keep the separator keys and the children
+    """
+    __slots__ = ("keys", "values", "children", "prev", "next")
+
+    def __init__(
+        self,
+        keys: list[Any],
+        values: list[_T] | None = None,
+        children: list[_BPlusNode[_T]] | None = None
+    ) -> None:
+        """
+        Constructor for B+ tree node
+
+        IN:
+            keys - the sorted keys of the values (leaves)
+                or the separator keys between the children (internal nodes)
+            values - the values for leaves, None for internal nodes
+                (Default: None)
+            children - the children for internal nodes, None for leaves
+                (Default: None)
+        """
+        self.keys = keys
+        self.values = values
+        self.children = children
+        self.prev: _BPlusNode[_T] | None = None
+        self.next: _BPlusNode[_T] | None = None
+
+    def __repr__(self) -> str:
+        kind = "leaf" if self.children is None else "internal"
+        return f"<{type(self).__name__}({kind}, size={len(self.keys)})>"
+
+
+class BPlusTree(_VectorizedQueriesMixin, _AsyncMixin, Generic[_T]):
+    """
+    Represents a B+ tree with the interface of BinaryTree: every node keeps
+    up to `order` sorted keys in a list which is searched with bisect,
+    the values are kept in the leaves and the leaves are linked for sequential scans,
+    so a lookup visits O(log_order n) nodes instead of O(log2 n)
+    and the tree takes a Python object per `order` values instead of per value
+
+    Separator keys are the first keys of the right subtrees, equal keys can be
+    on both sides of a separator, so the searches for the first equal key go left
+    and the inserts go right (after the equal values, like in BinaryTree)
+
+    NOTE: the values are only in the leaves, so every iteration order gives
+        the values in sorted order, the traversals pass the B+ tree nodes to the callbacks
+    """
+    ORDERINGS = BinaryTree.ORDERINGS
+    DEFAULT_ORDER = 64
+    MIN_ORDER = 3
+
+    def __init__(
+        self,
+        allow_dupes: bool = True,
+        key: Callable[[_T], Any] | None = None,
+        ordering: _Ordering = "hash",
+        order: int = DEFAULT_ORDER
+    ) -> None:
+        """
+        Constructor for B+ tree
+
+        IN:
+            allow_dupes - whether or not the tree accepts duplicate values
+                (Default: True)
+            key - the function that gives the sort keys, see BinaryTree
+                (Default: None)
+            ordering - the ordering to use if there's no key function, see BinaryTree
+                (Default: "hash")
+            order - the maximum number of values in a leaf and children in an internal node,
+                the nodes (but the root) are kept at least half full
+                (Default: 64)
+        """
+        if ordering not in self.ORDERINGS:
+            raise ValueError(
+                f"unknown ordering {ordering!r}, expected one of {self.ORDERINGS}"
+            )
+
+        if order < self.MIN_ORDER:
+            raise ValueError(f"the order must be at least {self.MIN_ORDER}, got {order}")
+
+        self.allow_dupes = allow_dupes
+        self.key_func = key
+        self.ordering = ordering
+        self.order = order
+        self._get_key = BinaryTree._select_key_func(key, ordering)# pylint: disable=protected-access
+        self._root: _BPlusNode[_T] = _BPlusNode([], [])
+        self._size = 0
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}(size={self._size}, order={self.order})>"
+
+    def __len__(self) -> int:
+        return self._size
+
+    def clear(self) -> None:
+        """
+        Removes all values from this tree
+        """
+        self._root = _BPlusNode([], [])
+        self._size = 0
+        self._key_array = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        """
+        Returns a flat representation of this tree for pickle and copy:
+        the values in order, the nodes are rebuilt on unpickling
+        (the leaf links would make pickle recurse through every leaf)
+        """
+        state = self.__dict__.copy()
+        del state["_root"]
+        del state["_get_key"]
+        state.pop("_key_array", None)
+        state["_values"] = list(self)
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """
+        Restores this tree from the representation returned by __getstate__
+        """
+        state = state.copy()
+        values = state.pop("_values")
+        self.__dict__.update(state)
+        self._get_key = BinaryTree._select_key_func(self.key_func, self.ordering)# pylint: disable=protected-access
+        # The hashes of some types (e.g. str) differ between processes,
+        # the sort is stable, so it keeps the order of the equal keys
+        self._build(sorted(values, key=self._get_key))
+
+    def __copy__(self) -> BPlusTree[_T]:
+        tree = type(self).__new__(type(self))
+        tree.__setstate__(self.__getstate__())
+        return tree
+
+    def __deepcopy__(self, memo: dict[int, Any]) -> BPlusTree[_T]:
+        tree = type(self).__new__(type(self))
+        memo[id(self)] = tree
+        tree.__setstate__(deepcopy(self.__getstate__(), memo))
+        return tree
+
+    def _iter_snapshot_keys(self) -> Iterator[Any]:
+        if self._get_key is not _identity:
+            raise ValueError("vectorized queries require the native ordering")
+
+        return chain.from_iterable(leaf.keys for leaf in self._iter_leaves())
+
+    @classmethod
+    def from_iterable(
+        cls,
+        values: Iterable[_T],
+        presorted: bool = False,
+        **kwargs: Any
+    ) -> BPlusTree[_T]:
+        """
+        Builds a tree with full nodes from the given values in O(n)
+        (plus O(n log n) to sort the values if they are not sorted yet)
+
+        IN:
+            values - the values for the tree
+            presorted - whether or not the values are already sorted
+                in the order of this tree (by key), skips sorting
+                (Default: False)
+            kwargs - the rest of the arguments are passed to the constructor
+
+        OUT:
+            new tree
+        """
+        tree = cls(**kwargs)
+        get_key = tree._get_key# pylint: disable=protected-access
+
+        if not presorted:
+            values = sorted(values, key=get_key)
+
+        if not tree.allow_dupes:
+            values = chain.from_iterable(
+                _unique_values(group)
+                for _, group in groupby(values, key=get_key)
+            )
+
+        tree._build(list(values))# pylint: disable=protected-access
+        return tree
+
+    @staticmethod
+    def _get_chunks(num_items: int, order: int) -> Iterator[tuple[int, int]]:
+        """
+        Splits the items into the least number of chunks of at most `order` items,
+        the chunks get equal sizes (+-1), so none of them is less than half full
+
+        IN:
+            num_items - the number of items
+            order - the maximum chunk size
+
+        OUT:
+            iterator over (start, end) pairs
+        """
+        num_chunks = max(-(-num_items // order), 1)
+        bounds = [num_items * i // num_chunks for i in range(num_chunks + 1)]
+        return zip(bounds, islice(bounds, 1, None))
+
+    def _build(self, values: list[_T]) -> None:
+        """
+        Replaces the contents of this tree with a tree made of the given sorted values,
+        the nodes are built level by level from the leaves
+
+        IN:
+            values - the values for the tree, must be sorted
+        """
+        order = self.order
+        keys = list(map(self._get_key, values))
+        self._size = len(values)
+        self._key_array = None
+
+        nodes = [
+            _BPlusNode(keys[start:end], values[start:end])
+            for start, end in self._get_chunks(len(values), order)
+        ]
+        for prev_node, node in zip(nodes, islice(nodes, 1, None)):
+            prev_node.next = node
+            node.prev = prev_node
+
+        # The first key in the subtree of each node, the separators come from them
+        first_keys = [node.keys[0] if node.keys else None for node in nodes]
+
+        while len(nodes) > 1:
+            parents = []
+            parent_first_keys = []
+            for start, end in self._get_chunks(len(nodes), order):
+                parents.append(_BPlusNode(first_keys[start + 1:end], children=nodes[start:end]))
+                parent_first_keys.append(first_keys[start])
+            nodes = parents
+            first_keys = parent_first_keys
+
+        self._root = nodes[0]
+
+    def _iter_leaves(self, reverse: bool = False) -> Iterator[_BPlusNode[_T]]:
+        """
+        Iterates over the leaves following the leaf links
+
+        IN:
+            reverse - whether or not to start from the last leaf
+                (Default: False)
+
+        OUT:
+            iterator over the leaves
+        """
+        leaf: _BPlusNode[_T] | None = self._root
+        while leaf.children is not None:# type: ignore[union-attr]
+            leaf = leaf.children[-1 if reverse else 0]# type: ignore[union-attr]
+
+        while leaf is not None:
+            yield leaf
+            leaf = leaf.prev if reverse else leaf.next
+
+    def _find_leaf(self, key: Any, after_equal: bool = False) -> tuple[_BPlusNode[_T], int]:
+        """
+        Walks down to the position of the given key in the leaves
+
+        IN:
+            key - the key
+            after_equal - whether to find the position after the equal keys
+                or before them (the latter can be in an earlier leaf than the equal keys)
+                (Default: False)
+
+        OUT:
+            tuple:
+                the leaf
+                the index in the leaf
+        """
+        bisect = bisect_right if after_equal else bisect_left
+        node = self._root
+        while node.children is not None:
+            node = node.children[bisect(node.keys, key)]
+
+        return node, bisect(node.keys, key)
+
+    def _find_path(
+        self,
+        value: _T,
+        key: Any
+    ) -> tuple[list[tuple[_BPlusNode[_T], int]], _BPlusNode[_T], int] | None:
+        """
+        Finds the entry with the given value and the path to its leaf
+
+        IN:
+            value - the value
+            key - the key of the value
+
+        OUT:
+            tuple:
+                list of (internal node, child index) pairs from the root down to the leaf
+                the leaf
+                the index of the value in the leaf
+            or None if not found
+        """
+        path = []
+        node = self._root
+        while node.children is not None:
+            index = bisect_left(node.keys, key)
+            path.append((node, index))
+            node = node.children[index]
+
+        index = bisect_left(node.keys, key)
+        while True:
+            keys = node.keys
+            values = node.values
+            if TYPE_CHECKING:
+                values = cast_type(list[_T], values)
+
+            while index < len(keys):
+                if key < keys[index]:
+                    return None
+                if values[index] == value:
+                    return path, node, index
+                index += 1
+
+            # The equal keys can go on in the next leaf, go up to the first
+            # ancestor that has a next child and down its leftmost path
+            while path and path[-1][1] == len(path[-1][0].children) - 1:# type: ignore[arg-type]
+                path.pop()
+            if not path:
+                return None
+
+            parent, child_index = path.pop()
+            path.append((parent, child_index + 1))
+            node = parent.children[child_index + 1]# type: ignore[index]
+            while node.children is not None:
+                path.append((node, 0))
+                node = node.children[0]
+            index = 0
+
+    def _has_value(self, value: _T, key: Any) -> bool:
+        """
+        Private method that checks if a value exists
+
+        IN:
+            value - the value to check
+            key - the key of the value
+
+        OUT:
+            bool
+        """
+        # Same as _find_leaf, inlined since it's the hot path
+        leaf: _BPlusNode[_T] | None = self._root
+        while leaf.children is not None:# type: ignore[union-attr]
+            leaf = leaf.children[bisect_left(leaf.keys, key)]# type: ignore[union-attr]
+        index = bisect_left(leaf.keys, key)# type: ignore[union-attr]
+
+        while leaf is not None:
+            keys = leaf.keys
+            values = leaf.values
+            if TYPE_CHECKING:
+                values = cast_type(list[_T], values)
+
+            while index < len(keys):
+                if key < keys[index]:
+                    return False
+                if values[index] == value:
+                    return True
+                index += 1
+
+            # The equal keys can go on in the next leaf
+            leaf = leaf.next
+            index = 0
+
+        return False
+
+    def has_value(self, value: _T) -> bool:
+        """
+        Checks if the given value exists
+
+        IN:
+            value - the value to check
+
+        OUT:
+            bool
+        """
+        return self._has_value(value, self._get_key(value))
+
+    def __contains__(self, value: Any) -> bool:
+        return self._has_value(value, self._get_key(value))
+
+    def add(self, value: _T) -> bool:
+        """
+        Adds the given value to this tree
+
+        IN:
+            value - the value to add
+
+        OUT:
+            bool - whether or not the value was added
+        """
+        key = self._get_key(value)
+
+        path = []
+        node = self._root
+        while node.children is not None:
+            index = bisect_right(node.keys, key)
+            path.append((node, index))
+            node = node.children[index]
+
+        index = bisect_right(node.keys, key)
+        values = node.values
+        if TYPE_CHECKING:
+            values = cast_type(list[_T], values)
+
+        if not self.allow_dupes:
+            # The equal keys are right before the index, they can start in an earlier leaf
+            check_leaf: _BPlusNode[_T] | None = node
+            check_index = index - 1
+            while check_leaf is not None:
+                check_keys = check_leaf.keys
+                check_values = check_leaf.values
+                if TYPE_CHECKING:
+                    check_values = cast_type(list[_T], check_values)
+
+                while check_index >= 0 and not check_keys[check_index] < key:
+                    if check_values[check_index] == value:
+                        # The value is a dupe and we don't like dupes here
+                        return False
+                    check_index -= 1
+
+                if check_index >= 0:
+                    break
+
+                check_leaf = check_leaf.prev
+                if check_leaf is not None:
+                    check_index = len(check_leaf.keys) - 1
+
+        node.keys.insert(index, key)
+        values.insert(index, value)
+        self._size += 1
+        self._key_array = None
+
+        if len(node.keys) > self.order:
+            self._split(path, node)
+
+        return True
+
+    def _split(self, path: list[tuple[_BPlusNode[_T], int]], node: _BPlusNode[_T]) -> None:
+        """
+        Splits an overfull node in half and goes up while the parents overflow
+
+        IN:
+            path - the (internal node, child index) pairs from the root down to the node
+            node - the overfull node
+        """
+        order = self.order
+
+        while True:
+            middle = len(node.keys) // 2
+
+            if node.children is None:
+                values = node.values
+                if TYPE_CHECKING:
+                    values = cast_type(list[_T], values)
+
+                sibling = _BPlusNode(node.keys[middle:], values[middle:])
+                del node.keys[middle:]
+                del values[middle:]
+                separator = sibling.keys[0]
+
+                sibling.prev = node
+                sibling.next = node.next
+                if node.next is not None:
+                    node.next.prev = sibling
+                node.next = sibling
+
+            else:
+                # The middle key moves up
+                separator = node.keys[middle]
+                sibling = _BPlusNode(node.keys[middle + 1:], children=node.children[middle + 1:])
+                del node.keys[middle:]
+                del node.children[middle + 1:]
+
+            if not path:
+                self._root = _BPlusNode([separator], children=[node, sibling])
+                return
+
+            parent, index = path.pop()
+            parent.keys.insert(index, separator)
+            parent.children.insert(index + 1, sibling)# type: ignore[union-attr]
+
+            if len(parent.children) <= order:# type: ignore[arg-type]
+                return
+            node = parent
+
+    def delete(self, value: _T) -> bool:
+        """
+        Deletes the given value from this tree
+
+        IN:
+            value - the value to delete
+
+        OUT:
+            bool - whether or not the value was deleted
+        """
+        found = self._find_path(value, self._get_key(value))
+
+        if found is None:
+            return False
+
+        path, node, index = found
+        del node.keys[index]
+        del node.values[index]# type: ignore[union-attr]
+        self._size -= 1
+        self._key_array = None
+
+        if path and len(node.keys) < (self.order + 1) // 2:
+            self._fix_underflow(path, node)
+
+        return True
+
+    def _fix_underflow(self, path: list[tuple[_BPlusNode[_T], int]], node: _BPlusNode[_T]) -> None:
+        """
+        Refills a node that is less than half full by borrowing an item from a sibling
+        or merging it with a sibling, merges go up while the parents underflow
+
+        IN:
+            path - the (internal node, child index) pairs from the root down to the node
+            node - the underfull node
+        """
+        min_size = (self.order + 1) // 2
+
+        def get_size(sized_node: _BPlusNode[_T]) -> int:
+            return len(sized_node.keys) if sized_node.children is None else len(sized_node.children)
+
+        while path:
+            if get_size(node) >= min_size:
+                return
+
+            parent, index = path.pop()
+            children = parent.children
+            if TYPE_CHECKING:
+                children = cast_type(list[_BPlusNode[_T]], children)
+
+            left = children[index - 1] if index else None
+            right = children[index + 1] if index + 1 < len(children) else None
+
+            if left is not None and get_size(left) > min_size:
+                if node.children is None:
+                    node.keys.insert(0, left.keys.pop())
+                    node.values.insert(0, left.values.pop())# type: ignore[union-attr]
+                    parent.keys[index - 1] = node.keys[0]
+                else:
+                    node.keys.insert(0, parent.keys[index - 1])
+                    node.children.insert(0, left.children.pop())# type: ignore[union-attr]
+                    parent.keys[index - 1] = left.keys.pop()
+                return
+
+            if right is not None and get_size(right) > min_size:
+                if node.children is None:
+                    node.keys.append(right.keys.pop(0))
+                    node.values.append(right.values.pop(0))# type: ignore[union-attr]
+                    parent.keys[index] = right.keys[0]
+                else:
+                    node.keys.append(parent.keys[index])
+                    node.children.append(right.children.pop(0))# type: ignore[union-attr]
+                    parent.keys[index] = right.keys.pop(0)
+                return
+
+            self._merge_children(parent, index - 1 if left is not None else index)
+            node = parent
+
+        # Shrink the tree if the root is left with one child
+        if node.children is not None and len(node.children) == 1:
+            self._root = node.children[0]
+
+    @staticmethod
+    def _merge_children(parent: _BPlusNode[_T], index: int) -> None:
+        """
+        Merges a child of a node with its right sibling
+
+        IN:
+            parent - the node
+            index - the index of the left child of the two
+        """
+        children = parent.children
+        if TYPE_CHECKING:
+            children = cast_type(list[_BPlusNode[_T]], children)
+
+        left = children[index]
+        right = children.pop(index + 1)
+        separator = parent.keys.pop(index)
+
+        if left.children is None:
+            left.keys += right.keys
+            left.values += right.values# type: ignore[operator]
+            left.next = right.next
+            if right.next is not None:
+                right.next.prev = left
+
+        else:
+            left.keys.append(separator)
+            left.keys += right.keys
+            left.children += right.children# type: ignore[operator, arg-type]
+
+    def add_many(self, values: Iterable[_T]) -> list[bool]:
+        """
+        Adds the given values to this tree
+
+        IN:
+            values - the values to add
+
+        OUT:
+            list of bools - whether or not each value was added
+        """
+        return list(map(self.add, values))
+
+    def delete_many(self, values: Iterable[_T]) -> list[bool]:
+        """
+        Deletes the given values from this tree
+
+        IN:
+            values - the values to delete
+
+        OUT:
+            list of bools - whether or not each value was deleted
+        """
+        return list(map(self.delete, values))
+
+    def contains_many(self, values: Iterable[_T]) -> list[bool]:
+        """
+        Checks if the given values exist
+
+        NOTE: if NumPy is available and the values are a numpy.ndarray,
+            the check is vectorized over the sorted key snapshot
+            and returns numpy.ndarray of bools
+
+        IN:
+            values - the values to check
+
+        OUT:
+            list of bools - whether or not each value exists
+        """
+        if np is not None and isinstance(values, np.ndarray):
+            return self._contains_many_vectorized(values)
+
+        return list(map(self.has_value, values))
+
+    def range(
+        self,
+        start: _T | None = None,
+        end: _T | None = None,
+        inclusive: tuple[bool, bool] = (True, True),
+        reverse: bool = False
+    ) -> Iterator[_T]:
+        """
+        Lazily iterates over the values which keys are between the keys
+        of the given values in O(log n + k) following the leaf links
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            start - the lower bound, if None, iterates from the first value
+                (Default: None)
+            end - the upper bound, if None, iterates to the last value
+                (Default: None)
+            inclusive - whether or not the lower and the upper bounds are included
+                (Default: (True, True))
+            reverse - whether or not to iterate from the upper bound down
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        get_key = self._get_key
+        start_key = get_key(start) if start is not None else None
+        end_key = get_key(end) if end is not None else None
+        include_start, include_end = inclusive
+
+        leaf: _BPlusNode[_T] | None
+        if not reverse:
+            if start_key is None:
+                leaf, index = next(self._iter_leaves()), 0
+            else:
+                leaf, index = self._find_leaf(start_key, after_equal=not include_start)
+
+            while leaf is not None:
+                keys = leaf.keys
+                values = leaf.values
+                if TYPE_CHECKING:
+                    values = cast_type(list[_T], values)
+
+                for i in range(index, len(keys)):
+                    # Past the upper bound?
+                    if end_key is not None and (
+                        end_key < keys[i]
+                        or (not include_end and not end_key > keys[i])
+                    ):
+                        return
+
+                    yield values[i]
+
+                leaf = leaf.next
+                index = 0
+
+        else:
+            if end_key is None:
+                leaf = next(self._iter_leaves(reverse=True))
+                index = len(leaf.keys)
+            else:
+                leaf, index = self._find_leaf(end_key, after_equal=include_end)
+
+            while leaf is not None:
+                keys = leaf.keys
+                values = leaf.values
+                if TYPE_CHECKING:
+                    values = cast_type(list[_T], values)
+
+                for i in range(index - 1, -1, -1):
+                    # Past the lower bound?
+                    if start_key is not None and (
+                        start_key > keys[i]
+                        or (not include_start and not start_key < keys[i])
+                    ):
+                        return
+
+                    yield values[i]
+
+                leaf = leaf.prev
+                if leaf is not None:
+                    index = len(leaf.keys)
+
+    def floor(self, value: _T) -> _T | None:
+        """
+        Returns the greatest value which key is less than or equal to the key of the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        return next(self.range(end=value, reverse=True), None)
+
+    def ceiling(self, value: _T) -> _T | None:
+        """
+        Returns the smallest value which key is greater than or equal to the key of the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        return next(self.range(start=value), None)
+
+    def predecessor(self, value: _T) -> _T | None:
+        """
+        Returns the greatest value which key is less than the key of the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        return next(self.range(end=value, inclusive=(True, False), reverse=True), None)
+
+    def successor(self, value: _T) -> _T | None:
+        """
+        Returns the smallest value which key is greater than the key of the given value
+
+        IN:
+            value - the value
+
+        OUT:
+            the found value or None
+        """
+        return next(self.range(start=value, inclusive=(False, True)), None)
+
+    def rank(self, value: _T) -> int:
+        """
+        Returns the number of values in this tree that are less than the given value,
+        O(log n + n / order), the leaves before the value are counted
+
+        IN:
+            value - the value to rank
+
+        OUT:
+            int
+        """
+        leaf: _BPlusNode[_T] | None
+        leaf, rank = self._find_leaf(self._get_key(value))
+
+        leaf = leaf.prev
+        while leaf is not None:
+            rank += len(leaf.keys)
+            leaf = leaf.prev
+
+        return rank
+
+    def select(self, index: int) -> _T:
+        """
+        Returns the value with the given index in sorted order (k-th smallest value),
+        O(n / order), the leaves before the value are skipped
+
+        IN:
+            index - the index of the value, supports negative indices
+
+        OUT:
+            the value
+
+        RAISES:
+            IndexError - if the index is out of range
+        """
+        if index < 0:
+            index += self._size
+
+        if not 0 <= index < self._size:
+            raise IndexError("tree index out of range")
+
+        for leaf in self._iter_leaves():
+            if index < len(leaf.keys):
+                return leaf.values[index]# type: ignore[index]
+            index -= len(leaf.keys)
+
+        raise AssertionError("the tree size doesn't match the leaves")
+
+    def __iter__(self) -> Iterator[_T]:
+        return self.iter_inorder()
+
+    def __reversed__(self) -> Iterator[_T]:
+        return self.iter_inorder(reverse=True)
+
+    def iter_inorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this tree in sorted order following the leaf links
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            reverse - whether or not to iterate in reverse order
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        if reverse:
+            return chain.from_iterable(
+                reversed(leaf.values)# type: ignore[arg-type]
+                for leaf in self._iter_leaves(reverse=True)
+            )
+
+        return chain.from_iterable(leaf.values for leaf in self._iter_leaves())# type: ignore[misc]
+
+    def iter_preorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this tree using deepth first preorder algorithm,
+        the values are only in the leaves, so that's the sorted order like in iter_inorder
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            reverse - whether or not to visit the last children first
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return self.iter_inorder(reverse)
+
+    def iter_postorder(self, reverse: bool = False) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this tree using deepth first postorder algorithm,
+        the values are only in the leaves, so that's the sorted order like in iter_inorder
+        NOTE: the tree must not be modified during iteration
+
+        IN:
+            reverse - whether or not to visit the last children first
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return self.iter_inorder(reverse)
+
+    def iter_breadthfirst(self) -> Iterator[_T]:
+        """
+        Lazily iterates over the values of this tree using breadth first algorithm,
+        all leaves are on the last level, so that's the sorted order like in iter_inorder
+        NOTE: the tree must not be modified during iteration
+
+        OUT:
+            iterator over the values
+        """
+        return self.iter_inorder()
+
+    def traverse_inorder(
+        self,
+        callback: Callable[[_BPlusNode[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first inorder algorithm,
+        an internal node is visited after its first subtree
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        for node in self._iter_depth_first("inorder", reverse):
+            callback(node)
+
+    def traverse_preorder(
+        self,
+        callback: Callable[[_BPlusNode[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first preorder algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        for node in self._iter_depth_first("preorder", reverse):
+            callback(node)
+
+    def traverse_postorder(
+        self,
+        callback: Callable[[_BPlusNode[_T]], Any],
+        reverse: bool = False
+    ) -> None:
+        """
+        Traverse the tree using deepth first postorder algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        for node in self._iter_depth_first("postorder", reverse):
+            callback(node)
+
+    def traverse_breadthfirst(
+        self,
+        callback: Callable[[_BPlusNode[_T]], Any]
+    ) -> None:
+        """
+        Traverse the tree using breadth first algorithm
+
+        IN:
+            callback - a callable that's being used for processing the tree,
+                must accept a single argument - the node being processed
+        """
+        queue = deque([self._root])
+        while queue:
+            node = queue.popleft()
+            callback(node)
+            if node.children is not None:
+                queue.extend(node.children)
+
+    def _iter_depth_first(
+        self,
+        order: Literal["preorder", "inorder", "postorder"],
+        reverse: bool
+    ) -> Iterator[_BPlusNode[_T]]:
+        """
+        Generator over the nodes in depth first order, uses O(height) memory
+
+        IN:
+            order - "preorder", "inorder" (an internal node goes after its first subtree)
+                or "postorder"
+            reverse - whether or not to visit the last children first
+
+        OUT:
+            iterator over the nodes
+        """
+        def enter(node: _BPlusNode[_T]) -> tuple[_BPlusNode[_T], Iterator[tuple[int, _BPlusNode[_T]]]]:
+            children = node.children or []
+            return node, enumerate(reversed(children) if reverse else children)
+
+        if order == "preorder":
+            yield self._root
+
+        stack = [enter(self._root)]
+        while stack:
+            node, children = stack[-1]
+            index, child = next(children, (-1, None))
+
+            if child is None:
+                stack.pop()
+                if order == "postorder" or (order == "inorder" and node.children is None):
+                    yield node
+                continue
+
+            # Internal nodes have at least two children
+            if order == "inorder" and index == 1:
+                yield node
+            if order == "preorder":
+                yield child
+            stack.append(enter(child))
+
+    def height(self) -> int:
+        """
+        Returns the number of levels in this tree (1 for a single leaf),
+        the same for every leaf
+
+        OUT:
+            int
+        """
+        height = 1
+        node = self._root
+        while node.children is not None:
+            node = node.children[0]
+            height += 1
+
+        return height
+
+
+class MappedBinaryTree:
+    """
+    Represents a read-only binary tree over a memory-mapped dump
+    (written by BinaryTree.dump), the queries read the file directly
+    without building any node objects, so opening a tree is O(1)
+    """
+    def __init__(self, path: str | PathLike[str], key: Callable[[Any], Any] | None = None) -> None:
+        """
+        Constructor for mapped binary tree
+
+        IN:
+            path - the path to the dump file
+            key - the key function, must be the same as the dumped tree had
+                (Default: None)
+
+        RAISES:
+            ValueError - if the file isn't a valid dump
+        """
+        with open(path, "rb") as dump_file:
+            self._mmap = mmap.mmap(dump_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            typecode, self.balance, flags, self._num_nodes, self._size = _read_dump_header(self._mmap)
+            self.allow_dupes = bool(flags & _DUMP_ALLOW_DUPES)
+            self.ordering: _Ordering = "native" if flags & _DUMP_NATIVE_ORDERING else "hash"
+
+            if flags & _DUMP_CUSTOM_KEY and key is None:
+                raise ValueError("the tree was dumped with a key function, pass it as 'key'")
+
+            record = _DUMP_RECORDS[typecode]
+            if len(self._mmap) < _DUMP_HEADER.size + record.size * self._num_nodes:
+                raise ValueError("truncated binary tree dump")
+
+        except ValueError:
+            self._mmap.close()
+            raise
+
+        self.key_func = key
+        self._get_key: Callable[[Any], Any]
+        if key is not None:
+            self._get_key = key
+        elif self.ordering == "native":
+            self._get_key = _identity
+        else:
+            self._get_key = hash
+
+        self._record_size = record.size
+        self._unpack_record = record.unpack_from
+
+    def __enter__(self) -> MappedBinaryTree:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Unmaps the file, the tree can't be used after this
+        """
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _read(self, index: int) -> tuple[Any, int, int, int]:
+        """
+        Reads a node record
+
+        IN:
+            index - the index of the node
+
+        OUT:
+            tuple:
+                the value
+                the index of the left child or 0
+                the index of the right child or 0
+                how many times the value was added
+
+        RAISES:
+            ValueError - if the child indices are out of range
+        """
+        value, right_index, count, flags = self._unpack_record(
+            self._mmap,
+            _DUMP_HEADER.size + index * self._record_size
+        )
+        left_index = index + 1 if flags & _DUMP_HAS_LEFT else 0
+
+        # In preorder, the children go after their parent
+        if left_index >= self._num_nodes or (right_index and not index < right_index < self._num_nodes):
+            raise ValueError("corrupted binary tree dump")
+
+        return value, left_index, right_index, count
+
+    def has_value(self, value: Any) -> bool:
+        """
+        Checks if a node with the given value exists
+
+        IN:
+            value - the value to check
+
+        OUT:
+            bool
+        """
+        if not self._size:
+            return False
+
+        get_key = self._get_key
+        read = self._read
+        key = get_key(value)
+        # The root is the first record, so the index 0 means no node
+        stack = [0]
+
+        while stack:
+            node_value, left_index, right_index, _ = read(stack.pop())
+            node_key = get_key(node_value)
+
+            if key < node_key:
+                if left_index:
+                    stack.append(left_index)
+
+            elif key > node_key:
+                if right_index:
+                    stack.append(right_index)
+
+            elif node_value == value:
+                return True
+
+            else:
+                # Nodes with equal keys can be on either side
+                stack.extend(i for i in (left_index, right_index) if i)
+
+        return False
+
+    def __contains__(self, value: Any) -> bool:
+        return self.has_value(value)
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.iter_inorder()
+
+    def __reversed__(self) -> Iterator[Any]:
+        return self.iter_inorder(reverse=True)
+
+    def iter_inorder(self, reverse: bool = False) -> Iterator[Any]:
+        """
+        Lazily iterates over the values of this tree using deepth first inorder algorithm
+
+        IN:
+            reverse - whether or not to iterate in reverse order
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        return self.range(reverse=reverse)
+
+    def iter_preorder(self) -> Iterator[Any]:
+        """
+        Lazily iterates over the values of this tree using deepth first preorder algorithm,
+        this is a sequential scan of the file
+
+        OUT:
+            iterator over the values
+        """
+        record_size = self._record_size
+        unpack_record = self._unpack_record
+
+        for offset in range(_DUMP_HEADER.size, _DUMP_HEADER.size + self._num_nodes * record_size, record_size):
+            value, _, count, _ = unpack_record(self._mmap, offset)
+            yield from repeat(value, count)
+
+    def range(
+        self,
+        start: Any = None,
+        end: Any = None,
+        inclusive: tuple[bool, bool] = (True, True),
+        reverse: bool = False
+    ) -> Iterator[Any]:
+        """
+        Lazily iterates over the values which keys are between the keys
+        of the given values, the subtrees outside of the bounds are skipped
+
+        IN:
+            start - the lower bound, if None, iterates from the first value
+                (Default: None)
+            end - the upper bound, if None, iterates to the last value
+                (Default: None)
+            inclusive - whether or not the lower and the upper bounds are included
+                (Default: (True, True))
+            reverse - whether or not to iterate from the upper bound down
+                (Default: False)
+
+        OUT:
+            iterator over the values
+        """
+        if not self._size:
+            return
+
+        get_key = self._get_key
+        read = self._read
+        start_key = get_key(start) if start is not None else None
+        end_key = get_key(end) if end is not None else None
+        include_start, include_end = inclusive
+
+        def is_after_start(node_key: Any) -> bool:
+            if start_key is None:
+                return True
+            return start_key < node_key or (include_start and not node_key < start_key)
+
+        def is_before_end(node_key: Any) -> bool:
+            if end_key is None:
+                return True
+            return node_key < end_key or (include_end and not end_key < node_key)
+
+        if reverse:
+            is_after_start, is_before_end = is_before_end, is_after_start
+            first, second = 2, 1
+
+        else:
+            first, second = 1, 2
+
+        stack: list[tuple[Any, Any, int, int]] = []
+        index: int | None = 0
+        while True:
+            # Descend, skipping the nodes (and their first subtrees) before the lower bound
+            while index is not None:
+                record = read(index)
+                node_key = get_key(record[0])
+                if is_after_start(node_key):
+                    stack.append((record[0], node_key, record[second], record[3]))
+                    index = record[first] or None
+
+                else:
+                    index = record[second] or None
+
+            if not stack:
+                return
+
+            node_value, node_key, index, count = stack.pop()
+            if not is_before_end(node_key):
+                return
+
+            yield from repeat(node_value, count)
+            index = index or None
@@ -10,16 +10,67 @@ Various tests for PyBinaryTree
 import sys
 import pathlib
 sys.path.insert(0, str(pathlib.Path.cwd() / "src"))
+import asyncio
+import collections
+import copy
 import json
+import io
+import math
+import operator
+import os
+import pickle
+import random
+import subprocess
+import threading
+import tempfile
 import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # from src import PyBinaryTree
 from src.PyBinaryTree import (
     _Node,
-    BinaryTree
+    BinaryTree,
+    TreeMap,
+    ArrayBinaryTree,
+    MappedBinaryTree,
+    ConcurrentBinaryTree,
+    PersistentBinaryTree,
+    BPlusTree
 )
 
 
+# The invariants every BinaryTree keeps: the parent links, the subtree sizes
+# (with order statistics) and the red-black rules, the values are checked if given
+def assert_valid_tree(test, tree, expected_values=None):
+    # pylint: disable=protected-access
+    if expected_values is not None:
+        test.assertEqual(list(tree), expected_values)
+        test.assertEqual(len(tree), len(expected_values))
+
+    if tree._root is None:
+        return
+
+    test.assertIsNone(tree._root.parent)
+    if tree.balance == "rb":
+        RedBlackTreeTest.assertRedBlack(test, tree)
+    if tree._num_nodes is not None:
+        test.assertEqual(tree._num_nodes, sum(1 for _ in tree._iter_inorder(tree._root)))
+
+    for node in tree._iter_inorder(tree._root):
+        children = [child for child in (node.left_child, node.right_child) if child is not None]
+        for child in children:
+            test.assertIs(child.parent, node)
+        if tree.order_statistics:
+            test.assertEqual(node.size, node.count + sum(child.size for child in children))
+    # pylint: enable=protected-access
+
+
 class NodeTest(unittest.TestCase):
     TEST_VALUES = (
         "test value",
@@ -65,6 +116,12 @@ class NodeTest(unittest.TestCase):
         for v, n in self.value_nodes_map.items():
             self.assertEqual(hash(v), hash(n))
 
+    def test_key(self):
+        self.assertEqual(_Node("value").key, hash("value"))
+        self.assertEqual(_Node("value", key=5).key, 5)
+        # None is a valid key, not a request for the hash
+        self.assertIsNone(_Node("value", key=None).key)
+
     def test_remove_child(self):
         lc = _Node(9001)
         rc = _Node("bruh")
@@ -170,7 +227,10 @@ class BinaryTreeTest(unittest.TestCase):
         with self.subTest("Can add dupe"):
             self.assertTrue(tree1.add(dupe_val))
             tree1.traverse_breadthfirst(callback)
-            self.assertEqual(known_values.count(dupe_val), 2)
+            # The dupe goes to the same node
+            self.assertEqual(known_values.count(dupe_val), 1)
+            self.assertEqual(list(tree1).count(dupe_val), 2)
+            self.assertEqual(tree1.count(dupe_val), 2)
 
         known_values.clear()
 
@@ -209,9 +269,9 @@ class BinaryTreeTest(unittest.TestCase):
             self.assertEqual(tree._root.right_child.value, rc_value)
 
         tree.add(rc_value)# add dupe
-        with self.subTest("Add as the right child of the right child of the root"):
-            self.assertIsNotNone(tree._root.right_child.right_child)
-            self.assertEqual(tree._root.right_child.right_child.value, rc_value)
+        with self.subTest("Count the dupe in the right child of the root"):
+            self.assertIsNone(tree._root.right_child.right_child)
+            self.assertEqual(tree._root.right_child.count, 2)
 
         lc_value = 9
         tree.add(lc_value)
@@ -359,6 +419,220 @@ class BinaryTreeTest(unittest.TestCase):
         tree1.traverse_breadthfirst(callback)
         self.assertEqual(traversed_node_values, breadthfirst_data)
 
+    def test_iterators(self):
+        tree1 = self.tree1
+
+        with self.subTest("Test __iter__ and __reversed__"):
+            self.assertEqual(tuple(tree1), self.TREE1_INORDER_DATA)
+            self.assertEqual(tuple(reversed(tree1)), self.TREE1_INORDER_DATA_REVERSED)
+
+        for method, data, data_reversed in (
+            (tree1.iter_inorder, self.TREE1_INORDER_DATA, self.TREE1_INORDER_DATA_REVERSED),
+            (tree1.iter_preorder, self.TREE1_PREORDER_DATA, self.TREE1_PREORDER_DATA_REVERSED),
+            (tree1.iter_postorder, self.TREE1_POSTORDER_DATA, self.TREE1_POSTORDER_DATA_REVERSED)
+        ):
+            with self.subTest(f"Test '{method.__name__}'"):
+                self.assertEqual(tuple(method()), data)
+                self.assertEqual(tuple(method(reverse=True)), data_reversed)
+
+        with self.subTest("Test 'iter_breadthfirst'"):
+            self.assertEqual(tuple(tree1.iter_breadthfirst()), self.TREE1_BREADTHFIRST_DATA)
+
+        with self.subTest("Test empty tree"):
+            self.assertEqual(list(BinaryTree()), [])
+            self.assertEqual(list(BinaryTree().iter_postorder()), [])
+
+    def test_iterators_are_lazy(self):
+        tree1 = self.tree1
+
+        iterator = iter(tree1)
+        self.assertEqual(next(iterator), self.TREE1_INORDER_DATA[0])
+        self.assertEqual(next(iterator), self.TREE1_INORDER_DATA[1])
+
+        postorder_iterator = tree1.iter_postorder()
+        self.assertEqual(next(postorder_iterator), self.TREE1_POSTORDER_DATA[0])
+
+        # Iterators are independent
+        self.assertEqual(next(iterator), self.TREE1_INORDER_DATA[2])
+
+    def test_contains(self):
+        self.assertIn(3, self.tree1)
+        self.assertNotIn(-3, self.tree1)
+        self.assertNotIn("a", self.tree1)
+
+    def test_clear(self):
+        tree1 = self.tree1
+        tree1.clear()
+
+        self.assertEqual(len(tree1), 0)
+        self.assertEqual(list(tree1), [])
+        self.assertTrue(tree1.add(1))
+        self.assertEqual(list(tree1), [1])
+
+    def test_len(self):
+        tree1 = self.tree1
+        tree2 = self.tree2
+
+        self.assertEqual(len(BinaryTree()), 0)
+        self.assertEqual(len(tree1), len(self.TREE1_DATA))
+        self.assertEqual(len(tree2), len(self.TREE2_DATA))
+
+        tree1.add(3)
+        self.assertEqual(len(tree1), len(self.TREE1_DATA) + 1)
+        tree2.add(3)
+        self.assertEqual(len(tree2), len(self.TREE2_DATA))
+
+        tree1.delete(3)
+        tree1.delete(-100)
+        self.assertEqual(len(tree1), len(self.TREE1_DATA))
+
+        for i in self.TREE2_DATA:
+            tree2.delete(i)
+        self.assertEqual(len(tree2), 0)
+
+    def test_rank_select(self):
+        for order_statistics in (False, True):
+            tree = BinaryTree(order_statistics=order_statistics)
+            for i in self.TREE2_DATA:
+                tree.add(i)
+            sorted_data = sorted(self.TREE2_DATA)
+
+            with self.subTest("Test rank", order_statistics=order_statistics):
+                for i, value in enumerate(sorted_data):
+                    self.assertEqual(tree.rank(value), i)
+                self.assertEqual(tree.rank(-100), 0)
+                self.assertEqual(tree.rank(100), len(sorted_data))
+
+            with self.subTest("Test select", order_statistics=order_statistics):
+                for i, value in enumerate(sorted_data):
+                    self.assertEqual(tree.select(i), value)
+                self.assertEqual(tree.select(-1), sorted_data[-1])
+                with self.assertRaises(IndexError):
+                    tree.select(len(sorted_data))
+
+            with self.subTest("Test after deletion", order_statistics=order_statistics):
+                for value in (7, 0, 12):
+                    tree.delete(value)
+                    sorted_data.remove(value)
+                for i, value in enumerate(sorted_data):
+                    self.assertEqual(tree.rank(value), i)
+                    self.assertEqual(tree.select(i), value)
+
+    def test_batch_operations(self):
+        tree2 = self.tree2
+        batch = [100, 3, -1, 3, 12, 6, 0]
+
+        with self.subTest("Test 'contains_many'"):
+            self.assertEqual(
+                tree2.contains_many(batch),
+                [tree2.has_value(i) for i in batch]
+            )
+            self.assertEqual(tree2.contains_many([]), [])
+            self.assertEqual(BinaryTree().contains_many(batch), [False] * len(batch))
+
+        with self.subTest("Test 'add_many'"):
+            self.assertEqual(
+                tree2.add_many(batch),
+                [True, False, True, False, False, True, False]
+            )
+            self.assertEqual(list(tree2), sorted(set(self.TREE2_DATA + tuple(batch))))
+
+            tree = BinaryTree()
+            self.assertEqual(tree.add_many(batch), [True] * len(batch))
+            self.assertEqual(list(tree), sorted(batch))
+
+        with self.subTest("Test 'delete_many'"):
+            self.assertEqual(
+                tree2.delete_many(batch + [-50]),
+                [True, True, True, False, True, True, True, False]
+            )
+            self.assertEqual(list(tree2), sorted(set(self.TREE2_DATA) - set(batch)))
+
+    def test_batch_operations_big(self):
+        with open(self.TREE3_DATA_PATH, "r", encoding="utf-8") as json_file:
+            values = json.load(json_file)["values"]
+
+        for balance in BinaryTree.BALANCE_MODES:
+            with self.subTest(balance=balance):
+                tree = BinaryTree(allow_dupes=False, balance=balance)
+                self.assertTrue(all(tree.add_many(values[::2])))
+                self.assertEqual(tree.add_many(values), [bool(i % 2) for i in range(len(values))])
+                self.assertEqual(len(tree), len(values))
+
+                probes = values[::3] + [-i for i in range(1, 100)]
+                self.assertEqual(tree.contains_many(probes), [i > 0 for i in probes])
+
+                self.assertTrue(all(tree.delete_many(values[::3])))
+                self.assertEqual(list(tree), sorted(set(values) - set(values[::3])))
+
+    def test_hash_once_per_operation(self):
+        class Value:
+            num_hash_calls = 0
+
+            def __init__(self, value):
+                self.value = value
+
+            def __hash__(self):
+                Value.num_hash_calls += 1
+                return hash(self.value)
+
+            def __eq__(self, other):
+                return self.value == other.value
+
+        tree = BinaryTree(balance="rb")
+        for i in range(100):
+            tree.add(Value(i))
+
+        for method in (tree.has_value, tree.add, tree.delete):
+            with self.subTest(f"Test '{method.__name__}'"):
+                Value.num_hash_calls = 0
+                method(Value(50))
+                self.assertEqual(Value.num_hash_calls, 1)
+
+    def test_range(self):
+        tree2 = self.tree2
+        sorted_data = sorted(self.TREE2_DATA)
+
+        self.assertEqual(list(tree2.range()), sorted_data)
+        self.assertEqual(list(tree2.range(reverse=True)), sorted_data[::-1])
+        self.assertEqual(list(tree2.range(3, 9)), [3, 4, 5, 7, 8, 9])
+        self.assertEqual(list(tree2.range(3, 9, inclusive=(False, False))), [4, 5, 7, 8])
+        self.assertEqual(list(tree2.range(3, 9, inclusive=(True, False))), [3, 4, 5, 7, 8])
+        self.assertEqual(list(tree2.range(3, 9, reverse=True)), [9, 8, 7, 5, 4, 3])
+        self.assertEqual(list(tree2.range(3, 9, inclusive=(False, False), reverse=True)), [8, 7, 5, 4])
+        self.assertEqual(list(tree2.range(6)), [7, 8, 9, 10, 11, 12])
+        self.assertEqual(list(tree2.range(end=2)), [0, 1, 2])
+        self.assertEqual(list(tree2.range(6, 6)), [])
+        self.assertEqual(list(tree2.range(100)), [])
+        self.assertEqual(list(BinaryTree().range(1, 5)), [])
+
+        # Dupes are all included
+        tree1 = self.tree1
+        tree1.add(5)
+        tree1.add(5)
+        self.assertEqual(list(tree1.range(4, 6)), [4, 5, 5, 5, 6])
+        self.assertEqual(list(tree1.range(5, 5, reverse=True)), [5, 5, 5])
+
+    def test_neighbours(self):
+        tree2 = self.tree2
+
+        for value, floor, ceiling, predecessor, successor in (
+            (6, 5, 7, 5, 7),
+            (7, 7, 7, 5, 8),
+            (0, 0, 0, None, 1),
+            (-5, None, 0, None, 0),
+            (12, 12, 12, 11, None),
+            (50, 12, None, 12, None)
+        ):
+            with self.subTest(value=value):
+                self.assertEqual(tree2.floor(value), floor)
+                self.assertEqual(tree2.ceiling(value), ceiling)
+                self.assertEqual(tree2.predecessor(value), predecessor)
+                self.assertEqual(tree2.successor(value), successor)
+
+        self.assertIsNone(BinaryTree().floor(1))
+        self.assertIsNone(BinaryTree().successor(1))
+
     def test_cmp_hash(self):
         cmp = BinaryTree.cmp_hash
 
@@ -429,3 +703,2096 @@ class BinaryTreeTest(unittest.TestCase):
                 self.assertTrue(tree.has_value(value))
                 self.assertTrue(tree.delete(value))
                 self.assertFalse(tree.has_value(value))
+
+    def test_degenerate_tree(self):
+        # Sorted input turns an unbalanced tree into a linked list,
+        # make sure none of the operations recurse per level
+        num_values = sys.getrecursionlimit() * 2
+        tree = BinaryTree()
+        for i in range(num_values):
+            tree.add(i)
+
+        counter = 0
+        def callback(node):
+            nonlocal counter
+            counter += 1
+
+        for traverse in (
+            tree.traverse_inorder,
+            tree.traverse_preorder,
+            tree.traverse_postorder,
+            tree.traverse_breadthfirst
+        ):
+            with self.subTest(f"Test '{traverse.__name__}'"):
+                counter = 0
+                traverse(callback)
+                self.assertEqual(counter, num_values)
+
+        self.assertTrue(tree.has_value(num_values - 1))
+        self.assertTrue(tree.delete(num_values - 1))
+        self.assertFalse(tree.has_value(num_values - 1))
+        self.assertTrue(tree.delete(0))
+        self.assertFalse(tree.has_value(0))
+
+
+class OrderingTest(unittest.TestCase):
+    WORDS = ("pear", "apple", "fig", "banana", "kiwi", "cherry", "date")
+
+    class Colliding:
+        def __init__(self, value):
+            self.value = value
+
+        def __hash__(self):
+            return 42
+
+        def __eq__(self, other):
+            return isinstance(other, type(self)) and self.value == other.value
+
+        def __repr__(self):
+            return f"Colliding({self.value})"
+
+    def test_unknown_ordering(self):
+        with self.assertRaises(ValueError):
+            BinaryTree(ordering="random")
+
+    def test_native_ordering(self):
+        for balance in BinaryTree.BALANCE_MODES:
+            with self.subTest(balance=balance):
+                tree = BinaryTree(ordering="native", balance=balance)
+                tree.add_many(self.WORDS)
+
+                self.assertEqual(list(tree), sorted(self.WORDS))
+                self.assertTrue(tree.has_value("kiwi"))
+                self.assertFalse(tree.has_value("grape"))
+                self.assertEqual(tree.rank("cherry"), 2)
+
+                tree = BinaryTree.from_iterable(self.WORDS, ordering="native", balance=balance)
+                self.assertEqual(list(tree), sorted(self.WORDS))
+
+    def test_key_function(self):
+        tree = BinaryTree(key=lambda value: -value)
+        for i in range(10):
+            tree.add(i)
+
+        self.assertEqual(list(tree), list(range(9, -1, -1)))
+
+        # Equal keys don't make the values equal
+        tree = BinaryTree(allow_dupes=False, key=len, balance="rb")
+        for word in self.WORDS:
+            self.assertTrue(tree.add(word))
+        self.assertFalse(tree.add("kiwi"))
+
+        self.assertEqual(list(tree), sorted(self.WORDS, key=len))
+        for word in self.WORDS:
+            self.assertTrue(tree.has_value(word))
+        self.assertFalse(tree.has_value("plum"))
+        self.assertFalse(tree.delete("plum"))
+        self.assertTrue(tree.delete("date"))
+        self.assertFalse(tree.has_value("date"))
+        self.assertTrue(tree.has_value("pear"))
+        self.assertTrue(tree.has_value("kiwi"))
+
+    def test_hash_collisions(self):
+        # -1 and -2 have the same hash in CPython
+        tree = BinaryTree(allow_dupes=False)
+        self.assertTrue(tree.add(-1))
+        self.assertTrue(tree.add(-2))
+        self.assertFalse(tree.add(-1))
+        self.assertEqual(len(tree), 2)
+
+        for balance in BinaryTree.BALANCE_MODES:
+            with self.subTest(balance=balance):
+                values = [self.Colliding(i) for i in range(50)]
+                tree = BinaryTree(allow_dupes=False, balance=balance)
+
+                self.assertTrue(all(tree.add_many(values)))
+                self.assertFalse(any(tree.add_many(self.Colliding(i) for i in range(50))))
+                self.assertEqual(len(tree), 50)
+                self.assertTrue(all(tree.contains_many(values)))
+                self.assertFalse(tree.has_value(self.Colliding(50)))
+
+                for i in range(0, 50, 2):
+                    self.assertTrue(tree.delete(self.Colliding(i)))
+                self.assertFalse(tree.delete(self.Colliding(0)))
+                self.assertEqual(
+                    tree.contains_many(values),
+                    [bool(i % 2) for i in range(50)]
+                )
+
+                tree = BinaryTree.from_iterable(values * 2, allow_dupes=False, balance=balance)
+                self.assertEqual(len(tree), 50)
+
+    def test_key_collisions_batch(self):
+        def key(value):
+            return value // 10
+
+        for balance in BinaryTree.BALANCE_MODES:
+            with self.subTest(balance=balance):
+                tree = BinaryTree(allow_dupes=False, key=key, balance=balance)
+                self.assertEqual(tree.add_many([3, 22]), [True, True])
+                self.assertEqual(tree.add_many([18, 16, 18]), [True, True, False])
+                self.assertEqual(sorted(tree), [3, 16, 18, 22])
+
+                tree = BinaryTree(key=key, balance=balance)
+                tree.add_many([3, 22])
+                self.assertEqual(tree.add_many([18, 16, 18]), [True, True, True])
+                self.assertEqual(tree.count(18), 2)
+                self.assertEqual(len(tree), 5)
+
+                tree = BinaryTree(key=key, balance=balance)
+                for value in (36, 34, 11, 25, 32, 12, 14, 18):
+                    tree.add(value)
+                self.assertEqual(tree.contains_many([18, 11, 31]), [True, True, False])
+                self.assertEqual(tree.delete_many([18, 11, 31]), [True, True, False])
+                self.assertEqual(sorted(tree), [12, 14, 25, 32, 34, 36])
+
+                rng = random.Random(balance)
+                reference = collections.Counter()
+                tree = BinaryTree(key=key, balance=balance)
+                for _ in range(20):
+                    values = [rng.randrange(100) for _ in range(30)]
+                    tree.add_many(values)
+                    reference.update(values)
+
+                    values = [rng.randrange(100) for _ in range(30)]
+                    expected = []
+                    for value in values:
+                        expected.append(reference[value] > 0)
+                        if reference[value]:
+                            reference[value] -= 1
+                    self.assertEqual(tree.delete_many(values), expected)
+
+                    values = [rng.randrange(100) for _ in range(30)]
+                    self.assertEqual(tree.contains_many(values), [reference[v] > 0 for v in values])
+                    self.assertEqual(sorted(tree), sorted(reference.elements()))
+
+
+class TreeMapTest(unittest.TestCase):
+    ITEMS = ((5, "five"), (1, "one"), (9, "nine"), (3, "three"), (7, "seven"))
+
+    def setUp(self):
+        self.tree_map = TreeMap(self.ITEMS)
+
+    def tearDown(self):
+        del self.tree_map
+
+    def test_getitem_setitem(self):
+        tree_map = self.tree_map
+
+        for k, v in self.ITEMS:
+            self.assertEqual(tree_map[k], v)
+        with self.assertRaises(KeyError):
+            tree_map[2]# pylint: disable=pointless-statement
+
+        tree_map[5] = "FIVE"
+        tree_map[2] = "two"
+        self.assertEqual(tree_map[5], "FIVE")
+        self.assertEqual(tree_map[2], "two")
+        self.assertEqual(len(tree_map), len(self.ITEMS) + 1)
+
+    def test_delitem_pop(self):
+        tree_map = self.tree_map
+
+        del tree_map[1]
+        self.assertNotIn(1, tree_map)
+        with self.assertRaises(KeyError):
+            del tree_map[1]
+
+        self.assertEqual(tree_map.pop(9), "nine")
+        self.assertEqual(tree_map.pop(9, "default"), "default")
+        with self.assertRaises(KeyError):
+            tree_map.pop(9)
+
+        self.assertEqual(len(tree_map), len(self.ITEMS) - 2)
+
+    def test_get_contains(self):
+        tree_map = self.tree_map
+
+        self.assertEqual(tree_map.get(3), "three")
+        self.assertIsNone(tree_map.get(4))
+        self.assertEqual(tree_map.get(4, "default"), "default")
+        self.assertIn(7, tree_map)
+        self.assertNotIn(8, tree_map)
+
+    def test_ordered_views(self):
+        tree_map = self.tree_map
+        sorted_items = sorted(self.ITEMS)
+
+        self.assertEqual(list(tree_map), [k for k, _ in sorted_items])
+        self.assertEqual(list(tree_map.keys()), [k for k, _ in sorted_items])
+        self.assertEqual(list(tree_map.values()), [v for _, v in sorted_items])
+        self.assertEqual(list(tree_map.items()), sorted_items)
+        self.assertEqual(dict(tree_map), dict(self.ITEMS))
+        self.assertEqual(list(tree_map.range(3, 7)), [3, 5, 7])
+
+        views = (
+            (tree_map.keys(), [k for k, _ in sorted_items], 3, 4),
+            (tree_map.values(), [v for _, v in sorted_items], "three", "four"),
+            (tree_map.items(), sorted_items, (3, "three"), (3, "four")),
+        )
+        for view, expected, present, missing in views:
+            with self.subTest(view=type(view).__name__):
+                self.assertEqual(len(view), len(self.ITEMS))
+                # The views can be iterated more than once
+                self.assertEqual(list(view), expected)
+                self.assertEqual(list(view), expected)
+                self.assertIn(present, view)
+                self.assertNotIn(missing, view)
+                self.assertEqual(list(view), expected)
+
+        # The views reflect the later changes
+        keys = tree_map.keys()
+        tree_map[4] = "four"
+        self.assertEqual(len(keys), len(self.ITEMS) + 1)
+        self.assertIn(4, keys)
+        self.assertIn((4, "four"), tree_map.items())
+
+    def test_many_items(self):
+        tree_map = TreeMap(ordering="native")
+        for i in range(1000):
+            tree_map[str(i)] = i
+        for i in range(0, 1000, 2):
+            del tree_map[str(i)]
+
+        self.assertEqual(len(tree_map), 500)
+        self.assertEqual(list(tree_map.keys()), sorted(str(i) for i in range(1, 1000, 2)))
+        for i in range(1, 1000, 2):
+            self.assertEqual(tree_map[str(i)], i)
+
+        tree_map.clear()
+        self.assertEqual(len(tree_map), 0)
+        self.assertEqual(list(tree_map.items()), [])
+
+    def test_from_iterable(self):
+        sorted_items = sorted(self.ITEMS)
+
+        for balance in BinaryTree.BALANCE_MODES:
+            with self.subTest(balance=balance):
+                tree_map = TreeMap.from_iterable(self.ITEMS, balance=balance)
+                self.assertIsInstance(tree_map, TreeMap)
+                self.assertEqual(list(tree_map.items()), sorted_items)
+                self.assertEqual(tree_map[9], "nine")
+
+                tree_map = TreeMap.from_iterable(dict(self.ITEMS), balance=balance)
+                self.assertEqual(list(tree_map.items()), sorted_items)
+
+                tree_map = TreeMap.from_iterable(sorted_items, presorted=True, balance=balance)
+                self.assertEqual(list(tree_map.items()), sorted_items)
+
+                tree_map[4] = "four"
+                del tree_map[5]
+                self.assertEqual(list(tree_map), [1, 3, 4, 7, 9])
+
+        # The last value wins, also for keys that only collide
+        tree_map = TreeMap.from_iterable(
+            [(1, "a"), (12, "b"), (1, "c"), (15, "d"), (12, "e")],
+            key=lambda map_key: map_key // 10
+        )
+        self.assertEqual(dict(tree_map), {1: "c", 12: "e", 15: "d"})
+        self.assertEqual(dict(TreeMap(dict(self.ITEMS))), dict(self.ITEMS))
+
+    def test_add_not_supported(self):
+        tree_map = self.tree_map
+
+        with self.assertRaises(TypeError):
+            tree_map.add(2)
+        with self.assertRaises(TypeError):
+            tree_map.add_many([2, 4])
+
+        self.assertEqual(list(tree_map.items()), sorted(self.ITEMS))
+
+        tree_map.update({2: "two"})
+        self.assertEqual(tree_map[2], "two")
+
+
+class RedBlackTreeTest(unittest.TestCase):
+    NUM_VALUES = 2000
+
+    TREE_DATA_PATH = BinaryTreeTest.TREE3_DATA_PATH
+
+    def setUp(self):
+        with open(self.TREE_DATA_PATH, "r", encoding="utf-8") as json_file:
+            self.values = json.load(json_file)["values"]
+
+    def tearDown(self):
+        del self.values
+
+    def assertRedBlack(self, tree):
+        # pylint: disable=protected-access
+        root = tree._root
+        if root is None:
+            return
+
+        self.assertFalse(root.meta, "the root must be black")
+        self.assertIsNone(root.parent)
+
+        def black_height(node):
+            if node is None:
+                return 1
+
+            for child in (node.left_child, node.right_child):
+                if child is not None:
+                    self.assertIs(child.parent, node)
+                    self.assertFalse(node.meta and child.meta, "a red node has a red child")
+
+            left_height = black_height(node.left_child)
+            right_height = black_height(node.right_child)
+            self.assertEqual(left_height, right_height)
+
+            return left_height + (not node.meta)
+
+        black_height(root)
+        # pylint: enable=protected-access
+
+    @staticmethod
+    def get_height(tree):
+        # pylint: disable-next=protected-access
+        level = [tree._root] if tree._root is not None else []
+        height = 0
+        while level:
+            height += 1
+            level = [
+                child
+                for node in level
+                for child in (node.left_child, node.right_child)
+                if child is not None
+            ]
+        return height
+
+    @staticmethod
+    def get_values(tree):
+        values = []
+        tree.traverse_inorder(lambda node: values.extend([node.value] * node.count))
+        return values
+
+    def test_unknown_balance_mode(self):
+        with self.assertRaises(ValueError):
+            BinaryTree(balance="avl-ish")
+
+    def test_sorted_insert(self):
+        tree = BinaryTree(balance="rb")
+        for i in range(self.NUM_VALUES):
+            self.assertTrue(tree.add(i))
+
+        self.assertRedBlack(tree)
+        self.assertLessEqual(self.get_height(tree), 2 * math.log2(self.NUM_VALUES + 1))
+        self.assertEqual(self.get_values(tree), list(range(self.NUM_VALUES)))
+
+        for i in range(self.NUM_VALUES):
+            with self.subTest(f"Test 'has_value' for {i}"):
+                self.assertTrue(tree.has_value(i))
+
+    def test_random_insert_delete(self):
+        tree = BinaryTree(allow_dupes=False, balance="rb")
+        for v in self.values:
+            tree.add(v)
+
+        self.assertRedBlack(tree)
+        self.assertEqual(self.get_values(tree), sorted(self.values))
+        self.assertFalse(tree.add(self.values[0]))
+
+        to_delete = self.values[::2]
+        to_keep = self.values[1::2]
+        for v in to_delete:
+            self.assertTrue(tree.delete(v))
+            self.assertFalse(tree.has_value(v))
+        self.assertFalse(tree.delete(to_delete[0]))
+
+        self.assertRedBlack(tree)
+        self.assertEqual(self.get_values(tree), sorted(to_keep))
+
+        for v in to_keep:
+            self.assertTrue(tree.delete(v))
+        # pylint: disable-next=protected-access
+        self.assertIsNone(tree._root)
+
+    def test_order_statistics(self):
+        tree = BinaryTree(balance="rb", order_statistics=True)
+        for v in self.values:
+            tree.add(v)
+        for v in self.values[::3]:
+            tree.delete(v)
+
+        assert_valid_tree(self, tree)
+
+        sorted_values = sorted(set(self.values) - set(self.values[::3]))
+        self.assertEqual(len(tree), len(sorted_values))
+        for i in range(0, len(sorted_values), 97):
+            self.assertEqual(tree.select(i), sorted_values[i])
+            self.assertEqual(tree.rank(sorted_values[i]), i)
+
+    def test_from_iterable(self):
+        for num_values in (0, 1, 2, 3, 7, 8, 100, len(self.values)):
+            values = self.values[:num_values]
+
+            with self.subTest(num_values=num_values):
+                tree = BinaryTree.from_iterable(values, balance="rb", order_statistics=True)
+                self.assertRedBlack(tree)
+                self.assertEqual(len(tree), num_values)
+                self.assertEqual(list(tree), sorted(values))
+                self.assertLessEqual(self.get_height(tree), math.log2(num_values + 1) + 1)
+                if values:
+                    self.assertEqual(tree.select(num_values // 2), sorted(values)[num_values // 2])
+
+        tree = BinaryTree.from_iterable(range(1000), presorted=True)
+        self.assertEqual(self.get_height(tree), 10)
+        self.assertEqual(list(tree), list(range(1000)))
+
+        with self.subTest("Can modify the built tree"):
+            tree = BinaryTree.from_iterable(self.values, balance="rb")
+            for v in self.values[:500]:
+                self.assertTrue(tree.delete(v))
+            for v in range(-500, 0):
+                self.assertTrue(tree.add(v))
+            self.assertRedBlack(tree)
+            self.assertEqual(list(tree), sorted(self.values[500:] + list(range(-500, 0))))
+
+    def test_from_iterable_dupes(self):
+        values = [i % 5 for i in range(50)]
+
+        tree = BinaryTree.from_iterable(values)
+        self.assertEqual(list(tree), sorted(values))
+
+        tree = BinaryTree.from_iterable(values, allow_dupes=False, balance="rb")
+        self.assertRedBlack(tree)
+        self.assertEqual(list(tree), list(range(5)))
+        self.assertEqual(len(tree), 5)
+
+    def test_range(self):
+        tree = BinaryTree.from_iterable(self.values, balance="rb")
+        sorted_values = sorted(self.values)
+
+        for start, end in ((0, 100), (2500, 7500), (-10, 10**6), (9000, 8000)):
+            with self.subTest(start=start, end=end):
+                expected = [v for v in sorted_values if start <= v <= end]
+                self.assertEqual(list(tree.range(start, end)), expected)
+                self.assertEqual(list(tree.range(start, end, reverse=True)), expected[::-1])
+
+    def test_dupes(self):
+        tree = BinaryTree(balance="rb")
+        values = [i % 7 for i in range(100)]
+        for v in values:
+            tree.add(v)
+
+        self.assertRedBlack(tree)
+        self.assertEqual(self.get_values(tree), sorted(values))
+
+        for _ in range(10):
+            self.assertTrue(tree.delete(3))
+        self.assertRedBlack(tree)
+        self.assertEqual(self.get_values(tree).count(3), len(values) // 7 - 10)
+
+
+class ArrayBinaryTreeTest(unittest.TestCase):
+    TREE_DATA_PATH = BinaryTreeTest.TREE3_DATA_PATH
+
+    def setUp(self):
+        with open(self.TREE_DATA_PATH, "r", encoding="utf-8") as json_file:
+            self.values = json.load(json_file)["values"]
+
+    def tearDown(self):
+        del self.values
+
+    def assertRedBlack(self, tree):
+        # pylint: disable=protected-access
+        lefts, rights, parents, colors = tree._lefts, tree._rights, tree._parents, tree._colors
+        self.assertEqual(colors[0], 0, "the nil node must be black")
+        if not tree._root:
+            return
+        self.assertEqual(colors[tree._root], 0, "the root must be black")
+
+        def black_height(node):
+            if not node:
+                return 1
+
+            for child in (lefts[node], rights[node]):
+                if child:
+                    self.assertEqual(parents[child], node)
+                    self.assertFalse(colors[node] and colors[child], "a red node has a red child")
+
+            left_height = black_height(lefts[node])
+            self.assertEqual(left_height, black_height(rights[node]))
+            return left_height + (not colors[node])
+
+        black_height(tree._root)
+        # pylint: enable=protected-access
+
+    def test_same_as_binary_tree(self):
+        for balance in ArrayBinaryTree.BALANCE_MODES:
+            with self.subTest(balance=balance):
+                tree = ArrayBinaryTree(balance=balance)
+                reference = BinaryTree(balance=balance)
+                for v in BinaryTreeTest.TREE1_DATA:
+                    tree.add(v)
+                    reference.add(v)
+
+                self.assertEqual(len(tree), len(reference))
+                self.assertEqual(list(tree), list(reference))
+                self.assertEqual(list(reversed(tree)), list(reversed(reference)))
+                for order in ("preorder", "postorder"):
+                    for reverse in (False, True):
+                        self.assertEqual(
+                            list(getattr(tree, f"iter_{order}")(reverse)),
+                            list(getattr(reference, f"iter_{order}")(reverse))
+                        )
+                self.assertEqual(list(tree.iter_breadthfirst()), list(reference.iter_breadthfirst()))
+
+    def test_random_operations(self):
+        rng = random.Random(0)
+
+        for balance in ArrayBinaryTree.BALANCE_MODES:
+            for allow_dupes in (False, True):
+                with self.subTest(balance=balance, allow_dupes=allow_dupes):
+                    tree = ArrayBinaryTree(allow_dupes=allow_dupes, balance=balance)
+                    expected = []
+
+                    for _ in range(3000):
+                        value = rng.randrange(500)
+                        if rng.random() < 0.6:
+                            added = tree.add(value)
+                            self.assertEqual(added, allow_dupes or value not in expected)
+                            if added:
+                                expected.append(value)
+                        else:
+                            self.assertEqual(tree.delete(value), value in expected)
+                            if value in expected:
+                                expected.remove(value)
+
+                    self.assertEqual(len(tree), len(expected))
+                    self.assertEqual(list(tree), sorted(expected))
+                    self.assertEqual(tree.contains_many(range(500)), [i in expected for i in range(500)])
+                    if balance == "rb":
+                        self.assertRedBlack(tree)
+
+    def test_free_list(self):
+        # pylint: disable=protected-access
+        tree = ArrayBinaryTree(balance="rb")
+        tree.add_many(range(100))
+        num_slots = len(tree._keys)
+
+        tree.delete_many(range(0, 100, 2))
+        tree.add_many(range(-50, 0))
+        self.assertEqual(len(tree._keys), num_slots)
+        self.assertEqual(list(tree), list(range(-50, 0)) + list(range(1, 100, 2)))
+        self.assertRedBlack(tree)
+        # pylint: enable=protected-access
+
+    def test_from_iterable(self):
+        tree = ArrayBinaryTree.from_iterable(self.values, balance="rb")
+        self.assertRedBlack(tree)
+        self.assertEqual(list(tree), sorted(self.values))
+        self.assertTrue(all(tree.contains_many(self.values)))
+
+        for v in self.values[::2]:
+            self.assertTrue(tree.delete(v))
+        self.assertRedBlack(tree)
+        self.assertEqual(list(tree), sorted(self.values[1::2]))
+
+        tree = ArrayBinaryTree.from_iterable([3, 1, 3, 2, 1], allow_dupes=False)
+        self.assertEqual(list(tree), [1, 2, 3])
+
+    def test_order_queries(self):
+        rng = random.Random(0)
+        values = [rng.randrange(200) for _ in range(300)]
+
+        for balance in ArrayBinaryTree.BALANCE_MODES:
+            for allow_dupes in (False, True):
+                with self.subTest(balance=balance, allow_dupes=allow_dupes):
+                    tree = ArrayBinaryTree(allow_dupes=allow_dupes, balance=balance)
+                    reference = BinaryTree(allow_dupes=allow_dupes, balance=balance, ordering="native")
+                    tree.add_many(values)
+                    reference.add_many(values)
+                    tree.delete_many(values[::3])
+                    reference.delete_many(values[::3])
+
+                    for v in range(-1, 202, 3):
+                        self.assertEqual(tree.floor(v), reference.floor(v))
+                        self.assertEqual(tree.ceiling(v), reference.ceiling(v))
+                        self.assertEqual(tree.predecessor(v), reference.predecessor(v))
+                        self.assertEqual(tree.successor(v), reference.successor(v))
+                        self.assertEqual(tree.rank(v), reference.rank(v))
+
+                    for start, end in ((None, None), (None, 50), (50, None), (20, 120), (120, 20)):
+                        for inclusive in ((True, True), (False, False), (True, False)):
+                            for reverse in (False, True):
+                                self.assertEqual(
+                                    list(tree.range(start, end, inclusive, reverse)),
+                                    list(reference.range(start, end, inclusive, reverse))
+                                )
+
+                    for index in (0, 1, len(tree) // 2, -1, -len(tree)):
+                        self.assertEqual(tree.select(index), reference.select(index))
+                    with self.assertRaises(IndexError):
+                        tree.select(len(tree))
+
+        tree = ArrayBinaryTree()
+        self.assertIsNone(tree.floor(0))
+        self.assertEqual(list(tree.range()), [])
+        self.assertEqual(tree.rank(0), 0)
+
+    def test_traverse_callback(self):
+        tree = ArrayBinaryTree()
+        for v in BinaryTreeTest.TREE1_DATA:
+            tree.add(v)
+
+        values = []
+        def callback(node):
+            values.append(node.value)
+            parent = node.parent
+            if parent is not None:
+                self.assertIn(
+                    node.index,
+                    [child.index for child in (parent.left_child, parent.right_child) if child is not None]
+                )
+
+        tree.traverse_inorder(callback)
+        self.assertEqual(tuple(values), BinaryTreeTest.TREE1_INORDER_DATA)
+
+        values.clear()
+        tree.traverse_breadthfirst(callback)
+        self.assertEqual(tuple(values), BinaryTreeTest.TREE1_BREADTHFIRST_DATA)
+
+    def test_invalid_values(self):
+        tree = ArrayBinaryTree()
+        with self.assertRaises(TypeError):
+            tree.add(0.5)
+        with self.assertRaises(OverflowError):
+            tree.add(2**70)
+        self.assertNotIn("a", tree)
+
+        # Failed adds don't break the free list
+        tree.add_many(range(10))
+        tree.delete(5)
+        with self.assertRaises(TypeError):
+            tree.add(0.5)
+        tree.add(5)
+        self.assertEqual(list(tree), list(range(10)))
+
+
+@unittest.skipIf(np is None, "NumPy isn't available")
+class VectorizedQueriesTest(unittest.TestCase):
+    TREE_DATA_PATH = BinaryTreeTest.TREE3_DATA_PATH
+
+    def setUp(self):
+        with open(self.TREE_DATA_PATH, "r", encoding="utf-8") as json_file:
+            self.values = json.load(json_file)["values"]
+
+        self.trees = (
+            BinaryTree.from_iterable(self.values, ordering="native", balance="rb"),
+            ArrayBinaryTree.from_iterable(self.values, balance="rb")
+        )
+
+    def tearDown(self):
+        del self.values
+        del self.trees
+
+    def test_key_array(self):
+        for tree in self.trees:
+            with self.subTest(tree=type(tree).__name__):
+                key_array = tree.key_array()
+                self.assertEqual(key_array.tolist(), sorted(self.values))
+                self.assertIs(tree.key_array(), key_array)
+
+                # Modifications drop the snapshot
+                tree.add(-1)
+                self.assertIsNot(tree.key_array(), key_array)
+                self.assertEqual(tree.key_array()[0], -1)
+                tree.delete(-1)
+                self.assertEqual(tree.key_array().tolist(), sorted(self.values))
+
+    def test_contains_many(self):
+        probes = np.arange(-100, 11000)
+        expected = np.isin(probes, self.values)
+
+        for tree in self.trees:
+            with self.subTest(tree=type(tree).__name__):
+                results = tree.contains_many(probes)
+                self.assertIsInstance(results, np.ndarray)
+                self.assertTrue(np.array_equal(results, expected))
+                self.assertEqual(tree.contains_many(probes[:50].tolist()), expected[:50].tolist())
+
+        self.assertFalse(BinaryTree(ordering="native").contains_many(probes).any())
+
+    def test_rank_many_count_range(self):
+        sorted_values = sorted(self.values)
+        probes = np.array([-5, sorted_values[0], sorted_values[100], 5000, 10**6])
+
+        for tree in self.trees:
+            with self.subTest(tree=type(tree).__name__):
+                self.assertEqual(
+                    tree.rank_many(probes).tolist(),
+                    [sum(v < p for v in sorted_values) for p in probes.tolist()]
+                )
+                self.assertEqual(tree.count_range(), len(sorted_values))
+                self.assertEqual(
+                    tree.count_range(1000, 2000),
+                    sum(1000 <= v <= 2000 for v in sorted_values)
+                )
+                self.assertEqual(
+                    tree.count_range(sorted_values[10], sorted_values[20], inclusive=(False, False)),
+                    9
+                )
+                self.assertEqual(tree.count_range(2000, 1000), 0)
+
+    def test_unsupported_trees(self):
+        with self.assertRaises(ValueError):
+            BinaryTree.from_iterable(self.values).key_array()
+
+        with self.assertRaises(TypeError):
+            BinaryTree.from_iterable(["a", "b"], ordering="native").key_array()
+
+        # Hash ordering falls back to the regular batch lookup
+        tree = BinaryTree.from_iterable([-1, 5])
+        self.assertEqual(tree.contains_many(np.array([-2, -1, 5])), [False, True, True])
+
+
+class SerializationTest(unittest.TestCase):
+    TREE_DATA_PATH = BinaryTreeTest.TREE3_DATA_PATH
+
+    def setUp(self):
+        with open(self.TREE_DATA_PATH, "r", encoding="utf-8") as json_file:
+            self.values = json.load(json_file)["values"]
+
+        self.temp_dir = tempfile.TemporaryDirectory()# pylint: disable=consider-using-with
+        self.dump_path = pathlib.Path(self.temp_dir.name) / "tree.bin"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        del self.values
+        del self.temp_dir
+
+    @staticmethod
+    def get_shape(tree):
+        return [
+            (node.value, node.meta, getattr(node.parent, "value", None))
+            for node in tree._iter_preorder(tree._root)# pylint: disable=protected-access
+        ]
+
+    def test_dump_load(self):
+        trees = (
+            BinaryTree.from_iterable(self.values),
+            BinaryTree.from_iterable(self.values, balance="rb", ordering="native"),
+            BinaryTree.from_iterable([v / 3 for v in self.values], balance="rb"),
+            BinaryTree(allow_dupes=False),
+        )
+        for tree in trees:
+            with self.subTest(balance=tree.balance, ordering=tree.ordering, size=len(tree)):
+                buffer = io.BytesIO()
+                tree.dump(buffer)
+                buffer.seek(0)
+                loaded = BinaryTree.load(buffer, order_statistics=True)
+
+                self.assertEqual(self.get_shape(loaded), self.get_shape(tree))
+                self.assertEqual(len(loaded), len(tree))
+                self.assertEqual(loaded.allow_dupes, tree.allow_dupes)
+                self.assertEqual(loaded.balance, tree.balance)
+                self.assertEqual(loaded.ordering, tree.ordering)
+                if len(tree):
+                    self.assertEqual(loaded.select(len(tree) // 2), list(tree)[len(tree) // 2])
+
+    def test_dump_key_func(self):
+        tree = BinaryTree.from_iterable(self.values, key=lambda v: -v)
+        buffer = io.BytesIO()
+        tree.dump(buffer)
+
+        buffer.seek(0)
+        with self.assertRaises(ValueError):
+            BinaryTree.load(buffer)
+
+        buffer.seek(0)
+        self.assertEqual(list(BinaryTree.load(buffer, key=lambda v: -v)), list(tree))
+
+    def test_dump_errors(self):
+        with self.assertRaises(TypeError):
+            BinaryTree.from_iterable(["a", "b"]).dump(io.BytesIO())
+        with self.assertRaises(TypeError):
+            BinaryTree.from_iterable([1, 2.5]).dump(io.BytesIO())
+        with self.assertRaises(TypeError):
+            TreeMap({1: 2}).dump(io.BytesIO())
+        with self.assertRaises(OverflowError):
+            BinaryTree.from_iterable([2**64]).dump(io.BytesIO())
+
+        buffer = io.BytesIO()
+        BinaryTree.from_iterable(self.values).dump(buffer)
+        data = buffer.getvalue()
+        for bad_data in (b"", b"XXXX" + data[4:], data[:-1]):
+            with self.subTest(bad_data=bad_data[:8]), self.assertRaises(ValueError):
+                BinaryTree.load(io.BytesIO(bad_data))
+
+        for name, bad_data in self.get_corrupted_dumps():
+            with self.subTest(name), self.assertRaises(ValueError):
+                BinaryTree.load(io.BytesIO(bad_data))
+
+    @staticmethod
+    def get_corrupted_dumps():
+        # The preorder of range(7) is 3 1 0 2 5 4 6, the records are 20 bytes after a 24 bytes header
+        buffer = io.BytesIO()
+        BinaryTree.from_iterable(range(7), ordering="native").dump(buffer)
+        data = buffer.getvalue()
+
+        def set_right_index(index, right_index):
+            offset = 24 + 20 * index + 8
+            return data[:offset] + right_index.to_bytes(4, "little") + data[offset + 4:]
+
+        last_flags = 24 + 20 * 6 + 16
+        yield "right index out of range", set_right_index(0, 1000)
+        yield "unreachable nodes", set_right_index(0, 0)
+        yield "right index before the node", set_right_index(4, 1)
+        yield "left child past the end", data[:last_flags] + b"\x01" + data[last_flags + 1:]
+
+    def test_mapped_tree(self):
+        for balance in BinaryTree.BALANCE_MODES:
+            for ordering in BinaryTree.ORDERINGS:
+                tree = BinaryTree.from_iterable(self.values, balance=balance, ordering=ordering)
+                with open(self.dump_path, "wb") as dump_file:
+                    tree.dump(dump_file)
+
+                with (
+                    self.subTest(balance=balance, ordering=ordering),
+                    MappedBinaryTree(self.dump_path) as mapped
+                ):
+                    self.assertEqual(len(mapped), len(tree))
+                    self.assertEqual(list(mapped), list(tree))
+                    self.assertEqual(list(reversed(mapped)), list(reversed(tree)))
+                    self.assertEqual(list(mapped.iter_preorder()), list(tree.iter_preorder()))
+
+                    for value in self.values[:50]:
+                        self.assertIn(value, mapped)
+                        self.assertNotIn(value + 0.5, mapped)
+
+                    start, end = sorted(self.values)[10], sorted(self.values)[-10]
+                    for inclusive in ((True, True), (False, False), (True, False)):
+                        for reverse in (False, True):
+                            self.assertEqual(
+                                list(mapped.range(start, end, inclusive, reverse)),
+                                list(tree.range(start, end, inclusive, reverse))
+                            )
+
+    def test_mapped_tree_errors(self):
+        with open(self.dump_path, "wb") as dump_file:
+            dump_file.write(b"not a tree dump at all")
+        with self.assertRaises(ValueError):
+            MappedBinaryTree(self.dump_path)
+
+        with open(self.dump_path, "wb") as dump_file:
+            BinaryTree.from_iterable(self.values, key=abs).dump(dump_file)
+        with self.assertRaises(ValueError):
+            MappedBinaryTree(self.dump_path)
+        with MappedBinaryTree(self.dump_path, key=abs) as mapped:
+            self.assertTrue(mapped.has_value(self.values[0]))
+
+        for name, bad_data in self.get_corrupted_dumps():
+            if name == "unreachable nodes":
+                # The mapped tree only reads the reachable records
+                continue
+
+            with open(self.dump_path, "wb") as dump_file:
+                dump_file.write(bad_data)
+            with self.subTest(name), MappedBinaryTree(self.dump_path) as mapped:
+                with self.assertRaises(ValueError):
+                    list(mapped)
+
+
+class CopyPickleTest(unittest.TestCase):
+    TREE_DATA_PATH = BinaryTreeTest.TREE3_DATA_PATH
+
+    def setUp(self):
+        with open(self.TREE_DATA_PATH, "r", encoding="utf-8") as json_file:
+            self.values = json.load(json_file)["values"]
+
+    def tearDown(self):
+        del self.values
+
+    @staticmethod
+    def get_shape(tree):
+        # Sizes are only maintained with order statistics
+        return [
+            (node.value, node.meta, node.size if tree.order_statistics else None, getattr(node.parent, "value", None))
+            for node in tree._iter_preorder(tree._root)# pylint: disable=protected-access
+        ]
+
+    def get_copies(self, tree):
+        return (
+            ("copy", copy.copy(tree)),
+            ("deepcopy", copy.deepcopy(tree)),
+            ("pickle", pickle.loads(pickle.dumps(tree)))
+        )
+
+    def test_trees(self):
+        trees = (
+            BinaryTree.from_iterable(self.values),
+            BinaryTree.from_iterable(self.values, balance="rb", order_statistics=True),
+            BinaryTree.from_iterable(self.values, ordering="native", allow_dupes=False),
+            BinaryTree(),
+        )
+        for tree in trees:
+            for name, tree_copy in self.get_copies(tree):
+                with self.subTest(name, balance=tree.balance, size=len(tree)):
+                    self.assertIsInstance(tree_copy, BinaryTree)
+                    self.assertEqual(self.get_shape(tree_copy), self.get_shape(tree))
+                    self.assertEqual(len(tree_copy), len(tree))
+                    self.assertEqual(tree_copy.allow_dupes, tree.allow_dupes)
+                    self.assertEqual(tree_copy.ordering, tree.ordering)
+
+                    # The copies must be independent
+                    tree_copy.add(10**9)
+                    self.assertFalse(tree.has_value(10**9))
+
+    def test_degenerate_tree(self):
+        num_values = sys.getrecursionlimit() * 2
+        tree = BinaryTree()
+        for i in range(num_values):
+            tree.add(i)
+
+        for name, tree_copy in self.get_copies(tree):
+            with self.subTest(name):
+                self.assertEqual(list(tree_copy), list(range(num_values)))
+                self.assertTrue(tree_copy.delete(0))
+
+    def test_deepcopy_values(self):
+        tree = BinaryTree.from_iterable([(1, ["a"]), (2, ["b"])], key=lambda v: v[0], allow_dupes=False)
+        tree_copy = copy.deepcopy(tree)
+        self.assertEqual(list(tree_copy), list(tree))
+        self.assertIsNot(tree_copy._root.value, tree._root.value)# pylint: disable=protected-access
+        self.assertIs(copy.copy(tree)._root.value, tree._root.value)# pylint: disable=protected-access
+
+    def test_tree_map(self):
+        tree_map = TreeMap((str(v), v) for v in self.values)
+        for name, map_copy in self.get_copies(tree_map):
+            with self.subTest(name):
+                self.assertIsInstance(map_copy, TreeMap)
+                self.assertEqual(list(map_copy.items()), list(tree_map.items()))
+                map_copy["new"] = 0
+                self.assertNotIn("new", tree_map)
+
+    def test_array_tree(self):
+        tree = ArrayBinaryTree.from_iterable(self.values, balance="rb")
+        for name, tree_copy in self.get_copies(tree):
+            with self.subTest(name):
+                self.assertEqual(list(tree_copy), list(tree))
+                tree_copy.add(10**9)
+                self.assertFalse(tree.has_value(10**9))
+
+    def test_other_hash_seed(self):
+        # str hashes differ between processes, the tree must be rebuilt
+        script = (
+            "import pickle, sys; "
+            "from src.PyBinaryTree import BinaryTree; "
+            "sys.stdout.buffer.write(pickle.dumps(BinaryTree.from_iterable(map(str, range(200)))))"
+        )
+        env = dict(os.environ, PYTHONHASHSEED="12345")
+        data = subprocess.run(
+            [sys.executable, "-c", script],
+            env=env,
+            check=True,
+            capture_output=True
+        ).stdout
+
+        tree = pickle.loads(data)
+        self.assertEqual(len(tree), 200)
+        for i in range(200):
+            self.assertTrue(tree.has_value(str(i)))
+        self.assertEqual(
+            [node.key for node in tree._iter_inorder(tree._root)],# pylint: disable=protected-access
+            sorted(hash(str(i)) for i in range(200))
+        )
+
+
+class ConcurrentBinaryTreeTest(unittest.TestCase):
+    NUM_WRITERS = 4
+    NUM_READERS = 4
+    VALUES_PER_WRITER = 2000
+
+    def test_api(self):
+        tree = ConcurrentBinaryTree.from_iterable(range(0, 100, 2), ordering="native", balance="rb")
+
+        self.assertEqual(len(tree), 50)
+        self.assertTrue(tree.add(5))
+        self.assertIn(5, tree)
+        self.assertTrue(tree.delete(5))
+        self.assertEqual(tree.add_many([1, 3]), [True, True])
+        self.assertEqual(tree.contains_many([1, 2, 7]), [True, True, False])
+        self.assertEqual(tree.delete_many([1, 3, 7]), [True, True, False])
+        self.assertEqual(list(tree.range(10, 20)), [10, 12, 14, 16, 18, 20])
+        self.assertEqual((tree.floor(11), tree.ceiling(11)), (10, 12))
+        self.assertEqual((tree.predecessor(10), tree.successor(10)), (8, 12))
+        self.assertEqual((tree.rank(10), tree.select(5)), (5, 10))
+        self.assertEqual(list(reversed(tree)), list(range(98, -1, -2)))
+        self.assertEqual(list(tree.iter_preorder()), list(tree.tree.iter_preorder()))
+
+        # The iterators are snapshots, so the tree can be changed while iterating
+        for value in tree:
+            tree.delete(value)
+        self.assertEqual(len(tree), 0)
+
+        nodes = []
+        tree.add(1)
+        tree.traverse_inorder(nodes.append)
+        self.assertEqual([node.value for node in nodes], [1])
+
+        with tree.write_lock():
+            tree.tree.add(2)
+        with tree.read_lock():
+            self.assertEqual(list(tree.tree), [1, 2])
+
+        tree_copy = pickle.loads(pickle.dumps(tree))
+        self.assertEqual(list(tree_copy), [1, 2])
+
+        tree.clear()
+        self.assertEqual(len(tree), 0)
+
+        with self.assertRaises(TypeError):
+            ConcurrentBinaryTree(BinaryTree(), balance="rb")
+
+    def run_stress(self, tree):
+        """
+        Runs writers that add and delete their own ranges of values
+        and readers that query and iterate over the tree at the same time
+        """
+        barrier = threading.Barrier(self.NUM_WRITERS + self.NUM_READERS)
+        is_writing = threading.Event()
+        is_writing.set()
+        errors = []
+
+        def get_writer_values(writer_id):
+            values = list(range(writer_id, self.NUM_WRITERS * self.VALUES_PER_WRITER, self.NUM_WRITERS))
+            random.Random(writer_id).shuffle(values)
+            return values
+
+        def writer(writer_id):
+            values = get_writer_values(writer_id)
+            barrier.wait()
+
+            for i, value in enumerate(values):
+                tree.add(value)
+                # Delete the odd values once they're in
+                if i % 3 == 2:
+                    tree.delete_many([v for v in values[i - 2:i + 1] if v % 2])
+
+        def reader():
+            barrier.wait()
+            try:
+                while is_writing.is_set():
+                    snapshot = list(tree)
+                    if snapshot != sorted(snapshot):
+                        raise AssertionError("the snapshot isn't sorted")
+                    for value in snapshot[::50]:
+                        tree.has_value(value)
+                    tree.range(100, 200)
+
+            except Exception as e:# pylint: disable=broad-except
+                errors.append(e)
+
+        writers = [threading.Thread(target=writer, args=(i,)) for i in range(self.NUM_WRITERS)]
+        readers = [threading.Thread(target=reader) for _ in range(self.NUM_READERS)]
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        is_writing.clear()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+        expected_values = []
+        for writer_id in range(self.NUM_WRITERS):
+            values = get_writer_values(writer_id)
+            # The odd values after the last full batch of three aren't deleted
+            num_deleted = len(values) - len(values) % 3
+            expected_values.extend(v for i, v in enumerate(values) if i >= num_deleted or not v % 2)
+
+        with tree.read_lock():
+            self.assertEqual(list(tree.tree), sorted(expected_values))
+            self.assertEqual(len(tree.tree), len(expected_values))
+
+    def test_stress(self):
+        for balance in BinaryTree.BALANCE_MODES:
+            with self.subTest(balance=balance):
+                tree = ConcurrentBinaryTree(ordering="native", balance=balance, order_statistics=True)
+                self.run_stress(tree)
+                assert_valid_tree(self, tree.tree)
+
+
+class PersistentBinaryTreeTest(unittest.TestCase):
+    TREE_DATA_PATH = BinaryTreeTest.TREE3_DATA_PATH
+
+    def setUp(self):
+        with open(self.TREE_DATA_PATH, "r", encoding="utf-8") as json_file:
+            self.values = json.load(json_file)["values"]
+
+    def tearDown(self):
+        del self.values
+
+    def assertAVL(self, tree):
+        # pylint: disable=protected-access
+        for node in BinaryTree._iter_postorder(tree._root):
+            left_height = node.left_child.height if node.left_child is not None else 0
+            right_height = node.right_child.height if node.right_child is not None else 0
+            self.assertEqual(node.height, 1 + max(left_height, right_height))
+            self.assertLessEqual(abs(left_height - right_height), 1)
+        # pylint: enable=protected-access
+
+        keys = [tree._get_key(value) for value in tree]# pylint: disable=protected-access
+        self.assertEqual(keys, sorted(keys))
+
+    def test_versions(self):
+        versions = [PersistentBinaryTree(ordering="native")]
+        expected = [[]]
+        rng = random.Random(0)
+
+        for value in self.values[:2000]:
+            if expected[-1] and rng.random() < 0.3:
+                value = rng.choice(expected[-1])
+                versions.append(versions[-1].delete(value))
+                new_values = list(expected[-1])
+                new_values.remove(value)
+            else:
+                versions.append(versions[-1].add(value))
+                new_values = sorted(expected[-1] + [value])
+            expected.append(new_values)
+
+        # Every version still sees its own values
+        for version, values in zip(versions[::100], expected[::100]):
+            with self.subTest(size=len(values)):
+                self.assertEqual(list(version), values)
+                self.assertEqual(len(version), len(values))
+                self.assertAVL(version)
+
+    def test_sharing(self):
+        tree = PersistentBinaryTree.from_iterable(range(1000), ordering="native")
+        new_tree = tree.add(1000)
+
+        # pylint: disable=protected-access
+        old_nodes = {id(node) for node in BinaryTree._iter_preorder(tree._root)}
+        new_nodes = [node for node in BinaryTree._iter_preorder(new_tree._root) if id(node) not in old_nodes]
+        # pylint: enable=protected-access
+        self.assertLessEqual(len(new_nodes), 2 * math.ceil(math.log2(1001)))
+        self.assertNotIn(1000, tree)
+        self.assertIn(1000, new_tree)
+
+    def test_api(self):
+        tree = PersistentBinaryTree.from_iterable(self.values, allow_dupes=False)
+        unique_values = set(self.values)
+        self.assertEqual(len(tree), len(unique_values))
+        self.assertAVL(tree)
+
+        self.assertIs(tree.add(self.values[0]), tree)
+        self.assertIs(tree.delete(-1), tree)
+        self.assertTrue(all(value in tree for value in self.values[:100]))
+
+        smaller_tree = tree.delete_many(self.values[:100])
+        self.assertEqual(len(smaller_tree), len(unique_values - set(self.values[:100])))
+        self.assertAVL(smaller_tree)
+        self.assertEqual(len(smaller_tree.add_many(self.values[:100])), len(tree))
+
+        native_tree = PersistentBinaryTree.from_iterable(self.values, ordering="native")
+        sorted_values = sorted(self.values)
+        self.assertEqual(list(reversed(native_tree)), sorted_values[::-1])
+        self.assertEqual(list(native_tree.range(1000, 2000)), [v for v in sorted_values if 1000 <= v <= 2000])
+        self.assertEqual(
+            list(native_tree.range(1000, 2000, (False, False), reverse=True)),
+            [v for v in sorted_values[::-1] if 1000 < v < 2000]
+        )
+
+        nodes = []
+        native_tree.traverse_breadthfirst(nodes.append)
+        self.assertEqual([node.value for node in nodes], list(native_tree.iter_breadthfirst()))
+
+    def test_collisions(self):
+        # Every value has the same key
+        tree = PersistentBinaryTree(key=lambda value: 0)
+        tree = tree.add_many(range(100))
+        self.assertAVL(tree)
+        for value in range(0, 100, 3):
+            tree = tree.delete(value)
+        self.assertEqual(sorted(tree), [v for v in range(100) if v % 3])
+        self.assertAVL(tree)
+
+
+class AsyncTest(unittest.IsolatedAsyncioTestCase):
+    TREE_DATA_PATH = BinaryTreeTest.TREE3_DATA_PATH
+    CHUNK_SIZE = 100
+
+    def setUp(self):
+        with open(self.TREE_DATA_PATH, "r", encoding="utf-8") as json_file:
+            self.values = json.load(json_file)["values"]
+
+        self.trees = (
+            BinaryTree.from_iterable(self.values),
+            BinaryTree.from_iterable(self.values, balance="rb", ordering="native"),
+            ArrayBinaryTree.from_iterable(self.values, balance="rb"),
+            BPlusTree.from_iterable(self.values, order=5)
+        )
+
+    def tearDown(self):
+        del self.values
+        del self.trees
+
+    async def count_ticks(self, coroutine):
+        """
+        Awaits the coroutine and counts how many times another task got to run meanwhile
+        """
+        ticks = 0
+        is_done = False
+
+        async def ticker():
+            nonlocal ticks
+            while not is_done:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        ticker_task = asyncio.create_task(ticker())
+        try:
+            result = await coroutine
+        finally:
+            is_done = True
+            await ticker_task
+
+        return result, ticks
+
+    async def test_iterators(self):
+        async def collect(aiterator):
+            return [value async for value in aiterator]
+
+        for tree in self.trees:
+            for name in ("inorder", "preorder", "postorder"):
+                for reverse in (False, True):
+                    with self.subTest(tree=type(tree).__name__, name=name, reverse=reverse):
+                        aiterator = getattr(tree, f"aiter_{name}")(reverse, chunk_size=self.CHUNK_SIZE)
+                        values, ticks = await self.count_ticks(collect(aiterator))
+                        self.assertEqual(values, list(getattr(tree, f"iter_{name}")(reverse)))
+                        self.assertGreaterEqual(ticks, len(self.values) // self.CHUNK_SIZE - 1)
+
+            with self.subTest(tree=type(tree).__name__, name="breadthfirst"):
+                values = await collect(tree.aiter_breadthfirst(chunk_size=self.CHUNK_SIZE))
+                self.assertEqual(values, list(tree.iter_breadthfirst()))
+                self.assertEqual(await collect(tree), list(tree))
+
+    async def test_offload(self):
+        with ThreadPoolExecutor(1) as executor:
+            for tree in self.trees:
+                with self.subTest(tree=type(tree).__name__):
+                    values = [v async for v in tree.aiter_inorder(offload=True, executor=executor)]
+                    self.assertEqual(values, list(tree))
+
+                    values = [v async for v in tree.aiter_breadthfirst(offload=True)]
+                    self.assertEqual(values, list(tree.iter_breadthfirst()))
+
+                    self.assertEqual(
+                        await tree.acontains_many([-1, self.values[0]], offload=True, executor=executor),
+                        [False, True]
+                    )
+
+    async def test_batch_operations(self):
+        new_values = [v + 10**6 for v in self.values]
+
+        for tree in self.trees:
+            with self.subTest(tree=type(tree).__name__):
+                results, ticks = await self.count_ticks(tree.aadd_many(new_values, chunk_size=self.CHUNK_SIZE))
+                self.assertTrue(all(results))
+                self.assertEqual(len(results), len(new_values))
+                self.assertGreaterEqual(ticks, len(new_values) // self.CHUNK_SIZE - 1)
+
+                self.assertTrue(all(await tree.acontains_many(new_values, chunk_size=self.CHUNK_SIZE)))
+                self.assertTrue(all(await tree.adelete_many(new_values, offload=True)))
+                self.assertFalse(any(await tree.acontains_many(new_values)))
+                self.assertEqual(len(tree), len(self.values))
+
+        with self.assertRaises(ValueError):
+            await self.trees[0].aadd_many([1], chunk_size=0)
+
+
+class ParallelTest(unittest.TestCase):
+    TREE_DATA_PATH = BinaryTreeTest.TREE3_DATA_PATH
+    NUM_WORKERS = 2
+
+    def setUp(self):
+        with open(self.TREE_DATA_PATH, "r", encoding="utf-8") as json_file:
+            self.values = json.load(json_file)["values"]
+
+    def tearDown(self):
+        del self.values
+
+    def test_parallel_reduce(self):
+        tree = BinaryTree.from_iterable(self.values, balance="rb", ordering="native")
+
+        self.assertEqual(tree.parallel_reduce(sum, operator.add, workers=self.NUM_WORKERS), sum(self.values))
+        self.assertEqual(tree.parallel_reduce(len, operator.add, workers=self.NUM_WORKERS), len(self.values))
+        # The ranges are combined in order
+        self.assertEqual(tree.parallel_reduce(list, operator.add, workers=self.NUM_WORKERS), sorted(self.values))
+        self.assertEqual(BinaryTree().parallel_reduce(sum, operator.add, workers=self.NUM_WORKERS), 0)
+
+        with ThreadPoolExecutor(3) as executor:
+            self.assertEqual(tree.parallel_reduce(max, max, workers=7, executor=executor), max(self.values))
+
+        with self.assertRaises(ValueError):
+            tree.parallel_reduce(sum, operator.add, workers=0)
+
+    def test_parallel_reduce_chunks(self):
+        tree = BinaryTree.from_iterable(self.values, balance="rb", ordering="native")
+        calls = []
+
+        def fn(values):
+            calls.append(len(values))
+            return values
+
+        # Big trees are split into many small ranges, only a few of them are pending at once
+        with mock.patch("src.PyBinaryTree._PARALLEL_CHUNK_SIZE", 7):
+            with ThreadPoolExecutor(2) as executor:
+                self.assertEqual(
+                    tree.parallel_reduce(fn, operator.add, workers=2, executor=executor),
+                    sorted(self.values)
+                )
+
+        self.assertEqual(len(calls), -(-len(self.values) // 7))
+        self.assertTrue(all(num_values <= 7 for num_values in calls))
+
+
+class SplitJoinTest(unittest.TestCase):
+    TREE_DATA_PATH = BinaryTreeTest.TREE3_DATA_PATH
+
+    def setUp(self):
+        with open(self.TREE_DATA_PATH, "r", encoding="utf-8") as json_file:
+            self.values = json.load(json_file)["values"]
+
+    def tearDown(self):
+        del self.values
+
+    def get_trees(self, values):
+        for balance in BinaryTree.BALANCE_MODES:
+            for order_statistics in (False, True):
+                tree = BinaryTree(balance=balance, order_statistics=order_statistics, ordering="native")
+                # Random inserts make the shapes (and colours) less regular than from_iterable
+                tree.add_many(values)
+                yield tree
+
+    def test_split_join(self):
+        values = self.values[:2000]
+        sorted_values = sorted(values)
+        split_points = [-1, sorted_values[0], sorted_values[777], sorted_values[-1], 10**9]
+
+        for split_point in split_points:
+            for tree in self.get_trees(values):
+                with self.subTest(split_point=split_point, balance=tree.balance, stats=tree.order_statistics):
+                    left, right = tree.split(split_point)
+
+                    self.assertEqual(len(tree), 0)
+                    assert_valid_tree(self, left, [v for v in sorted_values if v < split_point])
+                    assert_valid_tree(self, right, [v for v in sorted_values if v >= split_point])
+
+                    joined = BinaryTree.join(left, right)
+                    assert_valid_tree(self, joined, sorted_values)
+                    self.assertEqual((len(left), len(right)), (0, 0))
+                    # The trees are still usable
+                    joined.add(-5)
+                    joined.delete(sorted_values[100])
+                    self.assertIn(-5, joined)
+
+    def test_join_uneven(self):
+        for tree in self.get_trees(range(1000)):
+            with self.subTest(balance=tree.balance, stats=tree.order_statistics):
+                small_tree = tree._new_empty()# pylint: disable=protected-access
+                small_tree.add_many([1000, 1001, 1002])
+
+                joined = BinaryTree.join(tree, small_tree)
+                assert_valid_tree(self, joined, list(range(1003)))
+
+                small_tree.add_many([-3, -2, -1])
+                joined = BinaryTree.join(small_tree, joined)
+                assert_valid_tree(self, joined, list(range(-3, 1003)))
+
+    def test_join_errors(self):
+        with self.assertRaises(ValueError):
+            BinaryTree.join(
+                BinaryTree.from_iterable([5], ordering="native"),
+                BinaryTree.from_iterable([1], ordering="native")
+            )
+        with self.assertRaises(ValueError):
+            BinaryTree.join(BinaryTree(balance="rb"), BinaryTree())
+        with self.assertRaises(ValueError):
+            BinaryTree.join(
+                BinaryTree.from_iterable([1], ordering="native", allow_dupes=False),
+                BinaryTree.from_iterable([1], ordering="native", allow_dupes=False)
+            )
+
+        # Dupes can be on both sides
+        joined = BinaryTree.join(
+            BinaryTree.from_iterable([1, 1], ordering="native"),
+            BinaryTree.from_iterable([1], ordering="native")
+        )
+        self.assertEqual(list(joined), [1, 1, 1])
+
+    def test_set_operations(self):
+        first_values = set(self.values[:3000])
+        second_values = set(self.values[2000:5000])
+
+        for balance in BinaryTree.BALANCE_MODES:
+            with self.subTest(balance=balance):
+                first = BinaryTree.from_iterable(first_values, balance=balance, allow_dupes=False)
+                second = BinaryTree.from_iterable(second_values, balance=balance, allow_dupes=False)
+
+                for name, expected in (
+                    ("union", first_values | second_values),
+                    ("intersection", first_values & second_values),
+                    ("difference", first_values - second_values)
+                ):
+                    result = getattr(first, name)(second)
+                    self.assertEqual(sorted(result), sorted(expected))
+                    assert_valid_tree(self, result, list(result))
+                    self.assertEqual(len(first), len(first_values))
+
+        with self.assertRaises(ValueError):
+            BinaryTree().union(BinaryTree(ordering="native"))
+
+    def test_tree_map(self):
+        first = TreeMap({"a": 1, "b": 2, "c": 3}.items())
+        second = TreeMap({"b": 20, "d": 40}.items())
+
+        self.assertEqual(dict(first.union(second).items()), {"a": 1, "b": 2, "c": 3, "d": 40})
+        self.assertEqual(dict(first.intersection(second).items()), {"b": 2})
+        self.assertEqual(dict(first.difference(second).items()), {"a": 1, "c": 3})
+
+        tree_map = TreeMap(((i, str(i)) for i in range(100)), ordering="native")
+        left, right = tree_map.split(50)
+        self.assertIsInstance(left, TreeMap)
+        self.assertEqual(right[75], "75")
+        self.assertNotIn(75, left)
+        self.assertEqual(dict(TreeMap.join(left, right).items()), {i: str(i) for i in range(100)})
+
+
+class StatsTest(unittest.TestCase):
+    def test_stats(self):
+        tree = BinaryTree(balance="rb", ordering="native")
+        calls = []
+        tree.enable_stats(hook=lambda *args: calls.append(args))
+
+        for value in range(100):
+            tree.add(value)
+        self.assertTrue(tree.has_value(50))
+        self.assertFalse(tree.has_value(1000))
+        self.assertTrue(tree.delete(0))
+        tree.add_many([200, 201])
+        tree.contains_many([1, 2, 3])
+
+        stats = tree.stats()
+        self.assertEqual(stats["operations"], {"add": 102, "delete": 1, "has_value": 5})
+        self.assertEqual(stats["size"], 101)
+        self.assertGreater(stats["rotations"], 0)
+        self.assertLessEqual(stats["height"], 2 * math.log2(stats["size"] + 1))
+        self.assertEqual(sum(stats["depths"]["add"].values()), 100)
+        self.assertEqual(sum(stats["depths"]["has_value"].values()), 2)
+        self.assertEqual(
+            stats["path_length"]["add"],
+            sum(depth * count for depth, count in stats["depths"]["add"].items())
+        )
+        # The first value goes to the empty tree
+        self.assertEqual(calls[0], ("add", 0, 0))
+        self.assertEqual(len(calls), 103)
+        self.assertEqual(calls[-1][:2], ("delete", 0))
+
+        # The snapshot doesn't change
+        tree.add(300)
+        self.assertEqual(stats["operations"]["add"], 102)
+
+    def test_degenerate_tree(self):
+        tree = BinaryTree(ordering="native")
+        tree.enable_stats()
+        tree.add_many(range(100))
+        for value in range(100):
+            tree.has_value(value)
+
+        stats = tree.stats()
+        self.assertEqual(stats["height"], 100)
+        self.assertEqual(stats["rotations"], 0)
+        self.assertEqual(max(stats["depths"]["has_value"]), 100)
+
+    def test_batch_counts(self):
+        for balance in BinaryTree.BALANCE_MODES:
+            with self.subTest(balance=balance):
+                tree = BinaryTree(balance=balance)
+                tree.enable_stats()
+
+                tree.add_many([1, 2, 3])
+                tree.delete_many([1, 4])
+                tree.contains_many([2, 3, 5, 6])
+
+                stats = tree.stats()
+                self.assertEqual(stats["operations"], {"add": 3, "delete": 2, "has_value": 4})
+                # The batches aren't measured one value at a time
+                self.assertEqual(stats["depths"], {"add": {}, "delete": {}, "has_value": {}})
+                self.assertEqual(stats["size"], 2)
+
+    def test_disable(self):
+        tree = BinaryTree()
+        with self.assertRaises(RuntimeError):
+            tree.stats()
+
+        tree.enable_stats()
+        self.assertIn("add", vars(tree))
+        # Instrumentation doesn't leak into copies
+        tree_copy = copy.deepcopy(tree)
+        self.assertNotIn("add", vars(tree_copy))
+        self.assertEqual(len(pickle.loads(pickle.dumps(tree))), 0)
+
+        tree.disable_stats()
+        self.assertNotIn("add", vars(tree))
+        self.assertIs(type(tree).add, BinaryTree.add)
+        with self.assertRaises(RuntimeError):
+            tree.stats()
+
+
+class RebalanceTest(unittest.TestCase):
+    def test_rebalance(self):
+        for num_values in (1, 2, 3, 100, 1023, 1024, 5000):
+            for order_statistics in (False, True):
+                with self.subTest(num_values=num_values, order_statistics=order_statistics):
+                    tree = BinaryTree(ordering="native", order_statistics=order_statistics)
+                    tree.add_many(range(num_values))
+                    tree.rebalance()
+
+                    assert_valid_tree(self, tree, list(range(num_values)))
+                    self.assertEqual(RedBlackTreeTest.get_height(tree), num_values.bit_length())
+                    if order_statistics:
+                        self.assertEqual(tree.select(num_values // 2), num_values // 2)
+
+        # The tree works as usual afterwards
+        tree.add(-1)
+        self.assertTrue(tree.delete(2500))
+        self.assertEqual(tree.rank(2501), 2501)
+
+    def test_rebalance_rb(self):
+        values = list(range(1000))
+        random.Random(0).shuffle(values)
+        tree = BinaryTree(balance="rb", ordering="native")
+        tree.add_many(values)
+        tree.rebalance()
+
+        assert_valid_tree(self, tree, sorted(values))
+        self.assertEqual(RedBlackTreeTest.get_height(tree), 10)
+
+        BinaryTree().rebalance()
+
+    def test_auto_rebalance(self):
+        num_values = 20_000
+        for order_statistics in (False, True):
+            with self.subTest(order_statistics=order_statistics):
+                tree = BinaryTree(ordering="native", auto_rebalance=2, order_statistics=order_statistics)
+                tree.enable_stats()
+                for value in range(num_values):
+                    tree.add(value)
+
+                assert_valid_tree(self, tree, list(range(num_values)))
+                self.assertLessEqual(tree.stats()["height"], 2 * math.log2(num_values + 1) + 1)
+                # Only small subtrees get rebuilt, not the whole tree every time
+                self.assertLess(tree.stats()["rotations"], 2 * num_values * math.log2(num_values))
+
+        for kwargs in ({"auto_rebalance": 1}, {"auto_rebalance": 2, "balance": "rb"}):
+            with self.subTest(**kwargs), self.assertRaises(ValueError):
+                BinaryTree(**kwargs)
+
+
+class TreapTest(unittest.TestCase):
+    def assertTreap(self, tree, expected_values):
+        assert_valid_tree(self, tree, expected_values)
+
+        # The priorities form a max-heap
+        # pylint: disable=protected-access
+        for node in tree._iter_inorder(tree._root):
+            for child in (node.left_child, node.right_child):
+                if child is not None:
+                    self.assertGreaterEqual(node.meta, child.meta)
+        # pylint: enable=protected-access
+
+    def test_add_delete(self):
+        rng = random.Random(0)
+        random_values = [rng.randrange(10_000) for _ in range(2000)]
+        for name, values in (
+            ("random", random_values),
+            ("sorted", list(range(2000))),
+            ("reversed", list(range(2000, 0, -1))),
+            ("dupes", [rng.randrange(50) for _ in range(500)]),
+        ):
+            for allow_dupes in (False, True):
+                for order_statistics in (False, True):
+                    with self.subTest(values=name, allow_dupes=allow_dupes, order_statistics=order_statistics):
+                        tree = BinaryTree(
+                            balance="treap",
+                            allow_dupes=allow_dupes,
+                            order_statistics=order_statistics,
+                            ordering="native"
+                        )
+                        tree.add_many(values)
+                        expected = sorted(values if allow_dupes else set(values))
+                        self.assertTreap(tree, expected)
+                        # Expected height is about 3 log2 n, degenerate shapes would be ~n
+                        self.assertLess(RedBlackTreeTest.get_height(tree), 6 * math.log2(len(expected) + 1))
+
+                        for value in values[::3]:
+                            if tree.delete(value):
+                                expected.remove(value)
+                        self.assertTreap(tree, expected)
+
+                        if order_statistics and expected:
+                            self.assertEqual(tree.select(len(expected) // 2), expected[len(expected) // 2])
+
+    def test_bulk(self):
+        values = list(range(1000))
+        tree = BinaryTree.from_iterable(values, balance="treap", order_statistics=True, ordering="native")
+        self.assertTreap(tree, values)
+
+        for other in (copy.copy(tree), pickle.loads(pickle.dumps(tree))):
+            with self.subTest(type=type(other)):
+                self.assertEqual(other.balance, "treap")
+                self.assertTreap(other, values)
+
+        with io.BytesIO() as fp:
+            tree.dump(fp)
+            fp.seek(0)
+            loaded = BinaryTree.load(fp)
+        self.assertEqual(loaded.balance, "treap")
+        self.assertTreap(loaded, values)
+
+        left, right = tree.split(500)
+        self.assertTreap(left, values[:500])
+        self.assertTreap(right, values[500:])
+        joined = BinaryTree.join(left, right)
+        self.assertTreap(joined, values)
+
+        joined.add(-1)
+        joined.rebalance()
+        self.assertTreap(joined, [-1] + values)
+        self.assertEqual(RedBlackTreeTest.get_height(joined), 10)
+
+
+class BPlusTreeTest(unittest.TestCase):
+    TREE_DATA_PATH = BinaryTreeTest.TREE3_DATA_PATH
+
+    def setUp(self):
+        with open(self.TREE_DATA_PATH, "r", encoding="utf-8") as json_file:
+            self.values = json.load(json_file)["values"]
+
+    def tearDown(self):
+        del self.values
+
+    def assertBPlusTree(self, tree, expected_values):
+        # pylint: disable=protected-access
+        self.assertEqual(list(tree), expected_values)
+        self.assertEqual(list(reversed(tree)), expected_values[::-1])
+        self.assertEqual(len(tree), len(expected_values))
+
+        min_size = (tree.order + 1) // 2
+        leaves = []
+
+        def check_node(node, depth, low, high):
+            self.assertTrue(all(a <= b for a, b in zip(node.keys, node.keys[1:])))
+            # Equal keys can be on both sides of a separator
+            self.assertTrue(all((low is None or low <= k) and (high is None or k <= high) for k in node.keys))
+
+            if node.children is None:
+                self.assertEqual(len(node.keys), len(node.values))
+                self.assertLessEqual(len(node.keys), tree.order)
+                if node is not tree._root:
+                    self.assertGreaterEqual(len(node.keys), min_size)
+                self.assertEqual(depth, tree.height())
+                leaves.append(node)
+                return
+
+            self.assertEqual(len(node.children), len(node.keys) + 1)
+            self.assertLessEqual(len(node.children), tree.order)
+            self.assertGreaterEqual(len(node.children), min_size if node is not tree._root else 2)
+            bounds = [low] + node.keys + [high]
+            for i, child in enumerate(node.children):
+                check_node(child, depth + 1, bounds[i], bounds[i + 1])
+
+        check_node(tree._root, 1, None, None)
+
+        self.assertIsNone(leaves[0].prev)
+        self.assertIsNone(leaves[-1].next)
+        for leaf, next_leaf in zip(leaves, leaves[1:]):
+            self.assertIs(leaf.next, next_leaf)
+            self.assertIs(next_leaf.prev, leaf)
+        # pylint: enable=protected-access
+
+    def test_same_as_binary_tree(self):
+        for order in (3, 4, 7, BPlusTree.DEFAULT_ORDER):
+            for allow_dupes in (False, True):
+                with self.subTest(order=order, allow_dupes=allow_dupes):
+                    tree = BPlusTree(allow_dupes=allow_dupes, order=order)
+                    reference = BinaryTree(allow_dupes=allow_dupes, balance="rb", order_statistics=True)
+
+                    self.assertEqual(tree.add_many(self.values), reference.add_many(self.values))
+                    self.assertBPlusTree(tree, list(reference))
+
+                    probes = self.values[::7] + [-1, 10**9]
+                    self.assertEqual(tree.contains_many(probes), reference.contains_many(probes))
+                    for method in ("floor", "ceiling", "predecessor", "successor", "rank"):
+                        self.assertEqual(
+                            [getattr(tree, method)(v) for v in probes],
+                            [getattr(reference, method)(v) for v in probes],
+                            method
+                        )
+                    self.assertEqual(
+                        list(tree.range(self.values[0], self.values[1])),
+                        list(reference.range(self.values[0], self.values[1]))
+                    )
+                    self.assertEqual(
+                        list(tree.range(self.values[2], inclusive=(False, True), reverse=True)),
+                        list(reference.range(self.values[2], inclusive=(False, True), reverse=True))
+                    )
+                    self.assertEqual([tree.select(i) for i in (0, 5, -1)], [reference.select(i) for i in (0, 5, -1)])
+
+                    to_delete = self.values[::2] + [-1]
+                    self.assertEqual(tree.delete_many(to_delete), reference.delete_many(to_delete))
+                    self.assertBPlusTree(tree, list(reference))
+
+    def test_random_operations(self):
+        rng = random.Random(0)
+
+        for order in (3, 4, 5, 16):
+            for allow_dupes in (False, True):
+                with self.subTest(order=order, allow_dupes=allow_dupes):
+                    tree = BPlusTree(allow_dupes=allow_dupes, ordering="native", order=order)
+                    expected = []
+
+                    for _ in range(3000):
+                        value = rng.randrange(200)
+                        if rng.random() < 0.55:
+                            is_added = allow_dupes or value not in expected
+                            self.assertEqual(tree.add(value), is_added)
+                            if is_added:
+                                expected.append(value)
+                                expected.sort()
+                        else:
+                            is_deleted = value in expected
+                            self.assertEqual(tree.delete(value), is_deleted)
+                            if is_deleted:
+                                expected.remove(value)
+
+                    self.assertBPlusTree(tree, expected)
+
+                    for value in list(expected):
+                        self.assertTrue(tree.delete(value))
+                    self.assertBPlusTree(tree, [])
+                    self.assertEqual(tree.height(), 1)
+
+    def test_equal_keys(self):
+        # Many different values with the same key span several leaves
+        for allow_dupes in (False, True):
+            with self.subTest(allow_dupes=allow_dupes):
+                tree = BPlusTree(allow_dupes=allow_dupes, key=lambda v: v // 100, order=4)
+                values = list(range(300))
+                random.Random(0).shuffle(values)
+
+                self.assertTrue(all(tree.add_many(values)))
+                self.assertEqual(tree.add(150), allow_dupes)
+                # The sort is stable, so the equal keys stay in the order they were added
+                expected = sorted(values, key=lambda v: v // 100)
+                if allow_dupes:
+                    expected.insert(200, 150)
+                self.assertBPlusTree(tree, expected)
+
+                for value in values[::3]:
+                    self.assertTrue(tree.has_value(value))
+                    self.assertTrue(tree.delete(value))
+                    expected.remove(value)
+                    self.assertFalse(value in tree and value != 150)
+                self.assertBPlusTree(tree, expected)
+
+    def test_from_iterable(self):
+        for num_values in (0, 1, 64, 65, 1000):
+            with self.subTest(num_values=num_values):
+                values = list(range(num_values)) * 2
+                tree = BPlusTree.from_iterable(values, ordering="native", allow_dupes=False, order=8)
+                self.assertBPlusTree(tree, list(range(num_values)))
+
+                self.assertFalse(any(tree.add_many(range(num_values))))
+                self.assertBPlusTree(tree, list(range(num_values)))
+
+        with self.assertRaises(ValueError):
+            BPlusTree(order=2)
+        with self.assertRaises(ValueError):
+            BPlusTree(ordering="alphabetical")
+
+    def test_copy_pickle(self):
+        tree = BPlusTree.from_iterable(self.values, order=5)
+        tree.add("a string")
+
+        for other in (copy.copy(tree), copy.deepcopy(tree), pickle.loads(pickle.dumps(tree))):
+            with self.subTest(type=type(other)):
+                self.assertEqual(other.order, 5)
+                self.assertBPlusTree(other, list(tree))
+                other.delete("a string")
+                self.assertIn("a string", tree)
+
+    def test_traversals(self):
+        def walk(node, order, reverse):
+            if node.children is None:
+                return [node]
+            children = node.children[::-1] if reverse else node.children
+            subtrees = [walk(child, order, reverse) for child in children]
+            if order == "preorder":
+                return [node] + sum(subtrees, [])
+            if order == "postorder":
+                return sum(subtrees, []) + [node]
+            return subtrees[0] + [node] + sum(subtrees[1:], [])
+
+        tree = BPlusTree.from_iterable(range(50), ordering="native", order=3)
+        tree.delete(20)
+        expected = [v for v in range(50) if v != 20]
+        self.assertGreater(tree.height(), 2)
+
+        for order in ("inorder", "preorder", "postorder"):
+            for reverse in (False, True):
+                with self.subTest(order=order, reverse=reverse):
+                    values = list(getattr(tree, f"iter_{order}")(reverse))
+                    self.assertEqual(values, expected[::-1] if reverse else expected)
+                    nodes = []
+                    getattr(tree, f"traverse_{order}")(nodes.append, reverse)
+                    reference = walk(tree._root, order, reverse)# pylint: disable=protected-access
+                    self.assertEqual(list(map(id, nodes)), list(map(id, reference)))
+
+        self.assertEqual(list(tree.iter_breadthfirst()), expected)
+        nodes = []
+        tree.traverse_breadthfirst(nodes.append)
+        level = [tree._root]# pylint: disable=protected-access
+        levels = []
+        while level:
+            levels += level
+            level = [child for node in level for child in node.children or []]
+        self.assertEqual(list(map(id, nodes)), list(map(id, levels)))
+
+        empty = BPlusTree()
+        nodes = []
+        empty.traverse_inorder(nodes.append)
+        self.assertEqual(len(nodes), 1)
+        self.assertEqual(list(empty.iter_postorder()), [])
+
+    @unittest.skipIf(np is None, "requires NumPy")
+    def test_vectorized(self):
+        tree = BPlusTree.from_iterable(range(0, 1000, 2), ordering="native")
+        self.assertEqual(tree.contains_many(np.array([0, 1, 998])).tolist(), [True, False, True])
+        self.assertEqual(tree.count_range(10, 20), 6)
+        tree.add(11)
+        self.assertEqual(tree.count_range(10, 20), 7)
+
+        with self.assertRaises(ValueError):
+            BPlusTree().key_array()
+
+
+class DuplicateCountTest(unittest.TestCase):
+    def get_trees(self):
+        for balance in BinaryTree.BALANCE_MODES:
+            for order_statistics in (False, True):
+                yield BinaryTree(balance=balance, order_statistics=order_statistics, ordering="native")
+
+    def test_hot_value(self):
+        tree = BinaryTree(ordering="native", order_statistics=True)
+        tree.add_many(range(10))
+        for _ in range(100_000):
+            tree.add(5)
+
+        # pylint: disable-next=protected-access
+        self.assertEqual(sum(1 for _ in tree._iter_inorder(tree._root)), 10)
+        self.assertEqual(RedBlackTreeTest.get_height(tree), 10)
+        self.assertEqual(len(tree), 100_010)
+        self.assertEqual(tree.count(5), 100_001)
+        self.assertEqual((tree.count(4), tree.count(42)), (1, 0))
+        self.assertEqual(tree.rank(6), 100_006)
+        self.assertEqual((tree.select(5), tree.select(100_005), tree.select(100_006)), (5, 5, 6))
+
+        for _ in range(100_000):
+            self.assertTrue(tree.delete(5))
+        self.assertEqual(tree.count(5), 1)
+        self.assertTrue(tree.delete(5))
+        self.assertFalse(tree.has_value(5))
+        self.assertFalse(tree.delete(5))
+        self.assertEqual(list(tree), [0, 1, 2, 3, 4, 6, 7, 8, 9])
+
+    def test_node_count(self):
+        # The balancing that depends on the tree size uses the number of nodes, not values
+        tree = BinaryTree(ordering="native", auto_rebalance=2)
+        for _ in range(10_000):
+            tree.add(0)
+        for value in range(1, 64):
+            tree.add(value)
+        assert_valid_tree(self, tree, [0] * 9999 + list(range(64)))
+        self.assertLessEqual(RedBlackTreeTest.get_height(tree), 2 * math.log2(64 + 1) + 1)
+
+        tree = BinaryTree(balance="treap", ordering="native")
+        tree.add_many([1, 2, 3] * 1000)
+        with mock.patch.object(random, "random", wraps=random.random) as random_mock:
+            tree.rebalance()
+            tree = copy.copy(tree)
+            buffer = io.BytesIO()
+            tree.dump(buffer)
+            buffer.seek(0)
+            tree = BinaryTree.load(buffer)
+        self.assertEqual(random_mock.call_count, 9)
+        self.assertEqual(list(tree), [1] * 1000 + [2] * 1000 + [3] * 1000)
+
+        # The node count isn't known after joining trees with dupes
+        tree = BinaryTree(ordering="native", auto_rebalance=2)
+        tree.add_many([1, 1, 2])
+        left, right = tree.split(2)
+        tree = BinaryTree.join(left, right)
+        tree.add_many(range(3, 20))
+        assert_valid_tree(self, tree, [1, 1] + list(range(2, 20)))
+        # pylint: disable-next=protected-access
+        self.assertEqual(tree._num_nodes, 19)
+
+    def test_operations(self):
+        rng = random.Random(0)
+        values = [rng.randrange(50) for _ in range(2000)]
+
+        for tree in self.get_trees():
+            with self.subTest(balance=tree.balance, order_statistics=tree.order_statistics):
+                self.assertTrue(all(tree.add_many(values[:1000])))
+                for value in values[1000:]:
+                    self.assertTrue(tree.add(value))
+                expected = sorted(values)
+
+                self.assertEqual(list(tree), expected)
+                self.assertEqual(list(reversed(tree)), expected[::-1])
+                self.assertEqual(len(tree), len(expected))
+                self.assertEqual(list(tree.range(10, 20)), [v for v in expected if 10 <= v <= 20])
+                self.assertEqual(list(tree.range(10, 20, reverse=True)), [v for v in expected if 10 <= v <= 20][::-1])
+                for value in range(0, 51, 7):
+                    self.assertEqual(tree.count(value), expected.count(value))
+                    self.assertEqual(tree.rank(value), expected.index(value) if value in expected else len(expected))
+                for index in range(0, len(expected), 97):
+                    self.assertEqual(tree.select(index), expected[index])
+
+                nodes = []
+                tree.traverse_inorder(nodes.append)
+                self.assertEqual(len(nodes), len(set(values)))
+                self.assertEqual(sum(node.count for node in nodes), len(values))
+
+                to_delete = values[::3]
+                self.assertTrue(all(tree.delete_many(to_delete)))
+                for value in to_delete:
+                    expected.remove(value)
+                assert_valid_tree(self, tree, expected)
+                if tree.order_statistics:
+                    for index in range(0, len(expected), 97):
+                        self.assertEqual(tree.select(index), expected[index])
+
+    def test_collisions(self):
+        # Equal keys but different values still get their own nodes
+        tree = BinaryTree(key=lambda v: v // 10)
+        tree.add_many([1, 2, 1, 11, 2, 1])
+
+        nodes = []
+        tree.traverse_inorder(nodes.append)
+        self.assertEqual(sorted((node.value, node.count) for node in nodes), [(1, 3), (2, 2), (11, 1)])
+        self.assertEqual((tree.count(1), tree.count(2), tree.count(3)), (3, 2, 0))
+
+    def test_keeps_counts(self):
+        values = [v % 13 for v in range(500)]
+
+        for tree in self.get_trees():
+            with self.subTest(balance=tree.balance, order_statistics=tree.order_statistics):
+                tree.add_many(values)
+                expected = sorted(values)
+
+                built = BinaryTree.from_iterable(values, balance=tree.balance, ordering="native")
+                self.assertEqual(list(built), expected)
+                self.assertEqual(built.count(3), expected.count(3))
+
+                for other in (copy.copy(tree), pickle.loads(pickle.dumps(tree))):
+                    self.assertEqual(list(other), expected)
+                    self.assertEqual(other.count(3), expected.count(3))
+
+                with io.BytesIO() as fp:
+                    tree.dump(fp)
+                    fp.seek(0)
+                    loaded = BinaryTree.load(fp, order_statistics=tree.order_statistics)
+                self.assertEqual(list(loaded), expected)
+                self.assertEqual(len(loaded), len(expected))
+                if tree.order_statistics:
+                    self.assertEqual(loaded.select(100), expected[100])
+
+                other = BinaryTree.from_iterable(
+                    [100, 3],
+                    balance=tree.balance,
+                    order_statistics=tree.order_statistics,
+                    ordering="native"
+                )
+                union = tree.union(other)
+                self.assertEqual(list(union), expected + [100])
+
+                left, right = tree.split(5)
+                self.assertEqual(list(left), [v for v in expected if v < 5])
+                self.assertEqual(len(right), len([v for v in expected if v >= 5]))
+                joined = BinaryTree.join(left, right)
+                self.assertEqual(list(joined), expected)
+                self.assertEqual(len(joined), len(expected))
+
+                joined.rebalance()
+                self.assertEqual(list(joined), expected)
+
+    def test_join_boundary(self):
+        # A value that is in both trees must end up in one counted node
+        for tree in self.get_trees():
+            with self.subTest(balance=tree.balance, order_statistics=tree.order_statistics):
+                def make(values, tree=tree):
+                    new_tree = BinaryTree(
+                        balance=tree.balance,
+                        order_statistics=tree.order_statistics,
+                        ordering="native"
+                    )
+                    new_tree.add_many(values)
+                    return new_tree
+
+                joined = BinaryTree.join(make([1, 2, 3, 3]), make([3, 4, 5]))
+                assert_valid_tree(self, joined, [1, 2, 3, 3, 3, 4, 5])
+                # pylint: disable-next=protected-access
+                self.assertEqual(sum(1 for _ in joined._iter_inorder(joined._root)), 5)
+                self.assertEqual(joined.count(3), 3)
+                if tree.order_statistics:
+                    self.assertEqual(joined.rank(4), 5)
+                    self.assertEqual([joined.select(i) for i in range(7)], [1, 2, 3, 3, 3, 4, 5])
+
+                for _ in range(3):
+                    self.assertTrue(joined.delete(3))
+                self.assertFalse(joined.has_value(3))
+                assert_valid_tree(self, joined, [1, 2, 4, 5])
+
+                # The right tree can be all boundary values
+                joined = BinaryTree.join(make([1, 2]), make([2, 2]))
+                assert_valid_tree(self, joined, [1, 2, 2, 2])
+                self.assertEqual(joined.count(2), 3)
+
+        # Only the equal values are counted together, not the equal keys
+        def get_key(value):
+            return value // 10
+
+        left = BinaryTree(key=get_key)
+        left.add_many([1, 13])
+        right = BinaryTree(key=get_key)
+        right.add_many([13, 15, 25])
+        joined = BinaryTree.join(left, right)
+        assert_valid_tree(self, joined)
+        self.assertEqual(sorted(joined), [1, 13, 13, 15, 25])
+        self.assertEqual((joined.count(13), joined.count(15)), (2, 1))
+        # pylint: disable-next=protected-access
+        self.assertEqual(sum(1 for _ in joined._iter_inorder(joined._root)), 4)
+
+    def test_mapped(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "tree.bin")
+            tree = BinaryTree(ordering="native", balance="rb")
+            tree.add_many([3, 1, 3, 2, 3])
+            with open(path, "wb") as dump_file:
+                tree.dump(dump_file)
+
+            with MappedBinaryTree(path) as mapped:
+                self.assertEqual(len(mapped), 5)
+                self.assertEqual(list(mapped), [1, 2, 3, 3, 3])
+                self.assertEqual(list(mapped.range(2, 3, reverse=True)), [3, 3, 3, 2])
+                self.assertEqual(sorted(mapped.iter_preorder()), [1, 2, 3, 3, 3])
+
+    def test_concurrent(self):
+        tree = ConcurrentBinaryTree()
+        tree.add_many(["a", "b", "a"])
+        self.assertEqual(tree.count("a"), 2)